@@ -47,8 +47,9 @@ def run_opt(ctx, model, conf):
 @cli.command(name='check', help='Check and validate the provided configuration and model.')
 @click.option(
     '--model',
+    required=True,
     type=click.Path(exists=True, resolve_path=True),
-    help='Folder containing the model that should be used for optimization.')
+    help='Path to the model that should be used for optimization.')
 @click.option(
     '--conf',
     default='conf/csaopt.conf',
@@ -58,9 +59,74 @@ def run_opt(ctx, model, conf):
     '--with-aws',
     is_flag=True,
     default=False,
-    help='If enabled, the check will also spin up EC2 instances to verify configuration and communication.')
-def run_check(**kwargs):
-    print('Check called')
+    help='Spin up EC2 instances to verify configuration and communication. Not supported yet, the check fails.')
+@click.option('--steps', default=None, type=int, help='Number of annealing steps run by the check.')
+@click.pass_context
+def run_check(ctx, model, conf, with_aws, steps):
+    from csaopt.model_loader.model_loader import load_models
+    from csaopt.utils import numba_available
+
+    # Fails before the local checks run, so a successful check never implies that instances were verified
+    if with_aws:
+        eprint('Checking EC2 instances is not supported yet.')
+        sys.exit(1)
+
+    internal_conf = ctx.obj['internal_conf']
+    config = get_configs(conf)
+    config['model']['path'] = model
+
+    loaded_model, errors = load_models([config], internal_conf)[0]
+    if loaded_model is None:
+        eprint('Validation failed for model {}: {}'.format(model, '; '.join(str(error) for error in errors)))
+        sys.exit(1)
+    print('Model {} passed validation'.format(loaded_model.name))
+
+    if not numba_available():
+        eprint('Numba is required to compile the model, skipping compilation.')
+        sys.exit(1)
+
+    from csaopt.engine.preflight import preflight_model
+    report = preflight_model(
+        loaded_model,
+        config.get('optimization', {}),
+        steps=steps or internal_conf['check.steps'],
+        thread_count=internal_conf['check.thread_count'])
+
+    for name, compile_time in report.compile_times.items():
+        print('Compiled `{}` in {:.3f}s'.format(name, compile_time))
+    for name, error in report.errors.items():
+        eprint('Compiling `{}` failed: {}'.format(name, error))
+    if not report.passed:
+        sys.exit(1)
+
+    print('Compiled annealing kernel in {:.3f}s'.format(report.kernel_compile_time))
+    print('{} steps of {} chains: {:.1f}us per step, {:.3f}us per chain and step, best value {}'.format(
+        report.steps, report.thread_count, report.step_time * 1e6, report.step_time * 1e6 / report.thread_count,
+        report.best_value))
+
+
+@cli.command(name='worker', help='Run a local CSAOpt worker that executes optimizations on the CPU.')
+@click.option('--queue-id', envvar='WORKER_QUEUE_ID', required=True, help='Queue id of this worker.')
+@click.option('--host', envvar='REDIS_HOST', default='localhost', help='Hostname or IP address of the broker.')
+@click.option('--port', envvar='REDIS_PORT', default=6379, type=int, help='Port of the broker.')
+@click.option('--password', envvar='REDIS_PASSWORD', default=None, help='Password of the broker.')
+@click.option(
+    '--engine',
+    type=click.Choice(['numpy', 'numba']),
+    default='numpy',
+    help='Engine used to run optimizations.')
+@click.option(
+    '--compression',
+    envvar='WORKER_COMPRESSION',
+    type=click.Choice(['zlib', 'zstd', 'lz4']),
+    default=None,
+    help='Codec used to compress results.')
+@click.option('--compression-level', envvar='WORKER_COMPRESSION_LEVEL', default=None, type=int,
+              help='Codec specific compression level.')
+def run_worker(queue_id, host, port, password, engine, compression, compression_level):
+    from csaopt.worker.worker import run_worker
+    run_worker(queue_id, host=host, port=port, password=password, engine=engine, compression=compression,
+               compression_level=compression_level)
 
 
 @cli.command(name='cleanup', help='Clean up generated files and terminate any running EC2 instances')
@@ -2,6 +2,8 @@ __version__ = '0.1.0'
 __appname__ = 'CSAOpt: Cloud based, GPU accelerated Simulated Annealing'
 
 import asyncio
+import contextlib
+import copy
 import logging
 import shutil
 import sys
@@ -11,23 +13,24 @@ import re
 import os
 import time
 import pathlib
+import signal
 import better_exceptions
 
 from pyhocon import ConfigTree
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.job import Job as ApJob
 from asyncio.selector_events import BaseSelectorEventLoop
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Tuple
 from sty import fg, ef, rs, Rule, Render
 from datetime import datetime, timedelta
-from async_timeout import timeout
 
-from .model_loader.model_loader import ModelLoader
+from .model_loader.model_loader import load_models
 from .model import Model
 from .utils import get_configs, internet_connectivity_available
 from .instancemanager.instancemanager import InstanceManager
 from .instancemanager.awstools import AWSTools
 from .jobs.jobmanager import Job, JobManager, ExecutionType
+from .jobs.output import OUTPUT_FORMATS, StreamingResultWriter, check_output_format
 from .broker import Broker
 
 better_exceptions.hook()
@@ -52,6 +55,7 @@ class ConsolePrinter:
         self.spinner_idx = 0
         self.termsize = shutil.get_terminal_size((80, 20))
         self.last_line: str = ''
+        self.spinner_detail: str = ''
         self.has_scheduled_print: bool = False
         self.print_job: Optional[ApJob] = None
         self.scheduler: AsyncIOScheduler = AsyncIOScheduler()
@@ -102,11 +106,12 @@ class ConsolePrinter:
     def print_with_spinner(self, txt: str) -> None:
         self.scheduler.remove_all_jobs()
         self.last_line = txt
+        self.spinner_detail = ''
 
         self.print_job = self.scheduler.add_job(
             lambda: self.print('\r' + ConsolePrinter._format_to_width(
                 self.columns,
-                txt,
+                txt + self.spinner_detail,
                 fg.csaopt_magenta + self.spinner[self.spinner_idx] + '    ')),
             'interval',
             seconds=0.42,
@@ -114,6 +119,10 @@ class ConsolePrinter:
             max_instances=1,
             next_run_time=datetime.now() + timedelta(milliseconds=50))  # run in 50ms, then periodically
 
+    def set_spinner_detail(self, detail: str) -> None:
+        """Sets details shown after the text of the current spinner line, e.g. progress, until the spinner finishes"""
+        self.spinner_detail = detail
+
     def spinner_success(self) -> None:
         # If log level < warn, just re-print with 'Done.'
         # Truncate to console width to fit message
@@ -149,6 +158,7 @@ class Runner:
         self.loop = asyncio.get_event_loop()
         self.models: List[Model] = []
         self.failures: List[str] = []
+        self.jobmanager: Optional[JobManager] = None
 
         self.console_printer.print_magenta(ef.bold + 'Welcome to CSAOpt v{}\n\n'.format(__version__))
 
@@ -157,6 +167,14 @@ class Runner:
             from .instancemanager.local import Local
             return Local(conf, internal_conf)
 
+        if conf.get('remote.platform', None) == 'local':
+            from .instancemanager.local_processes import LocalProcesses
+            return LocalProcesses(conf, internal_conf)
+
+        if conf.get('remote.platform', None) == 'memory':
+            from .instancemanager.in_memory import InMemory
+            return InMemory(conf, internal_conf)
+
         if not internet_connectivity_available():
             raise AssertionError('Configured remote/cloud execution but internet connectivity unavailable.')
 
@@ -168,6 +186,17 @@ class Runner:
         else:
             raise AttributeError('Cloud platform ' + cloud_platform + ' unrecognized.')
 
+    def _terminate_after_failed_provisioning(self, instancemanager: InstanceManager) -> None:
+        """Terminates instances that were started before provisioning failed
+
+        The instance manager may be partially initialized, so errors are logged instead of replacing the provisioning
+        error.
+        """
+        try:
+            instancemanager.__exit__(None, None, None)
+        except Exception:
+            log.exception('An exception occured while terminating instances after provisioning failed')
+
     def duplicate_remote_configs(self, configs):
         for config in configs:
             if config.get('remote', None) is not None:
@@ -179,6 +208,60 @@ class Runner:
         for config in configs:
             config['remote'] = remote_conf
 
+    async def _load_models(self, configs: List[ConfigTree], internal_conf: ConfigTree, loop) -> bool:
+        """Loads and validates the models of this run in parallel processes, see :func:`~model_loader.load_models`
+
+        Failures are recorded in `self.failures` instead of being raised, so that the instances started in the
+        meantime can be shut down regularly.
+
+        Returns:
+            `True` if all models were loaded successfully
+        """
+        printer = self.console_printer
+        printer.print_with_spinner('Loading Models')
+        model_confs = []
+        for idx, model_path in enumerate(self.model_paths):
+            if idx < len(configs):
+                model_conf = configs[idx]
+            else:
+                # Further models of a run with a single configuration
+                model_conf = copy.deepcopy(configs[0])
+                if 'name' in model_conf['model']:
+                    # Workers keep deployed models by name, so each model needs its own
+                    model_conf['model']['name'] = '{}_{}'.format(model_conf['model']['name'], idx)
+            model_conf['model']['path'] = model_path
+            model_confs.append(model_conf)
+
+        log.debug('Loading models {}'.format(self.model_paths))
+        try:
+            loaded_models = await loop.run_in_executor(None, load_models, model_confs, internal_conf,
+                                                       internal_conf.get('model.loading.max_processes', None))
+        except Exception as e:
+            log.exception('An exception occured while loading models')
+            loaded_models = []
+            self.failures.append('Error while loading models: ' + str(e))
+
+        model_names: Dict[str, str] = {}
+        for model_path, (model, errors) in zip(self.model_paths, loaded_models):
+            if model is None:
+                self.failures.append('Validation failed for model {}: {}'.format(
+                    model_path, '; '.join(str(error) for error in errors)))
+            elif model.name in model_names:
+                self.failures.append('Models {} and {} have the same name `{}`, model names must be unique'.format(
+                    model_names[model.name], model_path, model.name))
+            else:
+                model_names[model.name] = model_path
+        if len(self.failures) > 0:
+            printer.spinner_failure()
+            for failure in self.failures:
+                printer.println(failure)
+            return False
+
+        self.models = [model for model, _ in loaded_models]
+        log.debug('Models loaded succesfully.')
+        printer.spinner_success()
+        return True
+
     async def _run_async(self, loop):
         printer = self.console_printer
         printer.print_with_spinner('Loading Config')
@@ -188,6 +271,10 @@ class Runner:
 
             internal_conf = self.invocation_options['internal_conf']
 
+            # Checked before any instances are started, since results are written while the jobs run
+            save_to_file, output_format = self._output_settings(configs, internal_conf)
+            check_output_format(output_format)
+
             ctx = Context(printer, configs, internal_conf)
         except Exception as e:
             printer.spinner_failure()
@@ -195,15 +282,6 @@ class Runner:
             raise e
         printer.spinner_success()
 
-        printer.print_with_spinner('Loading Models')
-        for idx, model_path in enumerate(self.model_paths):
-            configs[idx]['model']['path'] = model_path
-            log.debug('Loading model {}'.format(model_path))
-            loader = ModelLoader(configs[idx], internal_conf)
-            self.models.insert(idx, loader.get_model())
-            log.debug('Models loaded succesfully.')
-        printer.spinner_success()
-
         # Get cloud config, create instance manager
         self.remote_config = configs[0]
 
@@ -212,10 +290,36 @@ class Runner:
         else:
             start_msg = 'Starting instances on {}'.format(self.remote_config['remote.platform'].upper())
 
-        printer.print_with_spinner(start_msg)
-        await asyncio.sleep(0.8)
+        instancemanager = self._get_instance_manager(ctx, self.remote_config, internal_conf)
+
+        # Provisioning is the longest stage and does not depend on the models, so instances are started right away,
+        # in a thread, while the models are loaded and validated. Entering the instance manager this way needs the
+        # exit stack to terminate the instances on all paths, like a with block would.
+        log.debug('Starting instances in the background')
+        provisioning = loop.run_in_executor(None, instancemanager.__enter__)
+
+        with contextlib.ExitStack() as exit_stack:
+            try:
+                models_loaded = await self._load_models(configs, internal_conf, loop)
+                printer.print_with_spinner(start_msg)
+            finally:
+                # Instances can only be terminated once provisioning finished, also if loading the models failed
+                await asyncio.wait([provisioning])
+                if not provisioning.cancelled() and provisioning.exception() is None:
+                    exit_stack.push(instancemanager)
+                elif not provisioning.cancelled():
+                    exit_stack.callback(self._terminate_after_failed_provisioning, instancemanager)
+
+            if provisioning.exception() is not None:
+                printer.spinner_failure()
+                self.failures.append('Error while starting instances: ' + str(provisioning.exception()))
+                raise provisioning.exception()
+
+            if not models_loaded:
+                printer.spinner_success()
+                printer.println('Shutting down instances, since the models could not be loaded')
+                return
 
-        with self._get_instance_manager(ctx, self.remote_config, internal_conf) as instancemanager:
             log.debug('Entered instancemanager block')
             printer.spinner_success()
             printer.print_with_spinner('Waiting for broker to come online')
@@ -227,8 +331,6 @@ class Runner:
                 printer.println('Broker password (in case you intend to re-use instances): ' +
                                 instancemanager.broker_password)
 
-            await asyncio.sleep(5.0)
-
             queue_ids: List[str] = []
             for worker in workers:
                 if 'queue_id' in worker.props:
@@ -239,33 +341,40 @@ class Runner:
 
             redis_connect_timeout = configs[0].get('broker.connect_timeout',
                                                    internal_conf['broker.defaults.connect_timeout'])
-            async with timeout(30) as async_timeout:
-                while not async_timeout.expired:
-                    try:
-                        await asyncio.sleep(5)
-                        broker: Broker = Broker(
-                            host=str(broker_instance.public_ip),
-                            port=broker_instance.port,
-                            queue_ids=queue_ids,
-                            socket_connect_timeout=redis_connect_timeout,
-                            password=broker_instance.props.get('password', None))
-                        printer.spinner_success()
-                        break
-                    except ConnectionError:
-                        pass
-
-            if async_timeout.expired:
+            compression = configs[0].get('broker.compression.codec', internal_conf['broker.compression.codec'])
+            compression_level = configs[0].get('broker.compression.level', internal_conf['broker.compression.level'])
+            compression_threshold = configs[0].get('broker.compression.threshold',
+                                                   internal_conf['broker.compression.threshold'])
+            broker: Broker = Broker(
+                host=str(broker_instance.public_ip),
+                port=broker_instance.port,
+                queue_ids=queue_ids,
+                socket_connect_timeout=redis_connect_timeout,
+                password=broker_instance.props.get('password', None),
+                compression=compression,
+                compression_level=compression_level,
+                compression_threshold=compression_threshold,
+                in_memory=broker_instance.props.get('in_memory', False),
+                max_connections=configs[0].get('broker.connection_pool_size',
+                                               internal_conf['broker.connection_pool_size']))
+            try:
+                await broker.wait_until_ready(
+                    timeout=configs[0].get('broker.ready_timeout', internal_conf['broker.ready_timeout']))
+            except TimeoutError:
                 log.debug('Timeout while waiting for Broker')
                 printer.spinner_failure()
-                raise TimeoutError('Timed out waiting for broker to come online')
+                raise
+            printer.spinner_success()
 
-            jobmanager = JobManager(ctx, broker, self.models, configs)
+            if hasattr(instancemanager, 'declare_workers'):
+                # Workers running in memory receive messages through the broker object itself
+                instancemanager.declare_workers(broker)
 
-            await asyncio.sleep(5)  # wait for redis to start
+            self.jobmanager = jobmanager = JobManager(ctx, broker, self.models, configs)
 
             printer.print_with_spinner("Waiting for workers to join")
-            for worker_id in (await jobmanager.wait_for_worker_join()):
-                printer.println('Worker {} joined'.format(worker_id))
+            await jobmanager.wait_for_worker_join(on_join=lambda worker_id: printer.println(
+                'Worker {} joined'.format(worker_id)))
 
             printer.spinner_success()
             printer.print_with_spinner('Deploying model')
@@ -280,17 +389,32 @@ class Runner:
 
             printer.spinner_success()
 
-            await asyncio.sleep(0.8)
-
             printer.print_with_spinner('Running Simulated Annealing')
-
-            await asyncio.sleep(1)
-            # TODO: this needs timeouts
-            jobs: List[Job] = await jobmanager.submit()
-
-            await jobmanager.wait_for_results()
+            progress_task = asyncio.ensure_future(self._show_progress(jobmanager)) \
+                if jobmanager.progress_enabled else None
+            result_writer = jobmanager.result_writer = StreamingResultWriter(
+                self._output_path(configs[0], OUTPUT_FORMATS[output_format]), output_format,
+                only_best=(save_to_file == 'best')) if save_to_file != 'none' else None
+            cancel_on_interrupt = self._add_interrupt_handler(loop)
+            try:
+                jobs: List[Job] = await jobmanager.submit()
+                await jobmanager.wait_for_results()
+            except Exception:
+                if result_writer is not None:
+                    # Keeps the results that arrived before the failure
+                    result_writer.close()
+                raise
+            finally:
+                if cancel_on_interrupt:
+                    loop.remove_signal_handler(signal.SIGINT)
+                if progress_task is not None:
+                    progress_task.cancel()
             printer.spinner_success()
 
+            if jobmanager.cancelled:
+                printer.println('Jobs were cancelled, {} of {} jobs returned (partial) results'.format(
+                    sum(1 for job in jobs if job.completed), len(jobs)))
+
             printer.print_with_spinner('Retrieving results')
             printer.spinner_success()
 
@@ -306,26 +430,66 @@ class Runner:
 
             printer.println('Evaluated: {} State: {}'.format(best_value, best_state))
 
-            for index, job in enumerate(jobs):
-                config = configs[0] if len(configs) == 1 else configs[index]
-                save_to_file = config.get('save_to_file.type', 'none')
-                base_path = config.get('save_to_file.path', os.path.dirname(os.path.realpath(__file__)))
-                conf_name = config.get('name', ('optimization_' + str(int(time.time()))))
-                path = os.path.join(base_path, conf_name)
+            if jobmanager.aggregator is not None:
+                top_results = jobmanager.top_results()
+                printer.println('Best {} results:'.format(len(top_results)))
+                for value, _, job in top_results:
+                    printer.println('  {} (job {})'.format(value, job.id))
+
+            sweep_summary = jobmanager.summarize_sweep(jobs)
+            if len(sweep_summary) > 0:
+                printer.println('Sweep results, from best to worst:')
+                for point, value in sweep_summary:
+                    printer.println('  {}: {}'.format(
+                        ', '.join('{}={}'.format(key, val) for key, val in point.items()), value))
+
+            if broker.encoder.bytes_saved > 0:
+                printer.println('Message compression saved {:.1f} kB'.format(broker.encoder.bytes_saved / 1024))
+
+            if result_writer is not None:
+                printer.print_with_spinner('Writing results')
+                # Results were written while the jobs ran, only the consolidation into a single file is left
+                output_path = await loop.run_in_executor(None, result_writer.close)
+                printer.spinner_success()
+                printer.println('Results have successfully been written to {}'.format(output_path))
 
-                pathlib.Path(base_path, conf_name).mkdir(parents=True, exist_ok=True)
+            printer.println('Waiting for instances to shutdown. This might take a long time. If you configured ' +
+                            'files to be written to disk, they are now ready for your perusal.')
 
-                binary = config.get('save_to_file.binary', False)
-                if save_to_file == 'all':
-                    job.write_files(path, binary)
-                elif save_to_file == 'best':
-                    job.write_files(path, binary, only_best=True)
+    def _output_settings(self, configs: List[ConfigTree], internal_conf: ConfigTree) -> Tuple[str, str]:
+        """Returns the `save_to_file` type and format of a run
 
-            if save_to_file != 'none':
-                printer.println('Files have successfully been written.')
+        Results of all jobs are written into one file, so all configurations need the same `save_to_file` settings.
 
-            printer.println('Waiting for instances to shutdown. This might take a long time. If you configured ' +
-                            'files to be written to disk, they are now ready for your perusal.')
+        Raises:
+            AssertionError: If the `save_to_file` settings differ between configurations
+        """
+        settings = set((config.get('save_to_file.type', 'none'), config.get('save_to_file.path', None),
+                        config.get('save_to_file.format', internal_conf['save_to_file.format'])) for config in configs)
+        if len(settings) > 1:
+            raise AssertionError('save_to_file settings need to be the same for all configurations, since results '
+                                 'are written into a single file')
+        save_to_file, _, output_format = settings.pop()
+        return save_to_file, output_format
+
+    def _output_path(self, config, extension: str) -> str:
+        """Returns the path of the result file of this run, creating its directory if required"""
+        base_path = config.get('save_to_file.path', os.path.dirname(os.path.realpath(__file__)))
+        conf_name = config.get('name', ('optimization_' + str(int(time.time()))))
+
+        pathlib.Path(base_path, conf_name).mkdir(parents=True, exist_ok=True)
+        return os.path.join(base_path, conf_name, 'results_{}.{}'.format(
+            datetime.now().strftime('%Y%m%d-%H%M%S'), extension))
+
+    async def _show_progress(self, jobmanager: JobManager) -> None:
+        """Shows the latest progress updates of all jobs on the spinner line"""
+        latest: Dict[str, Dict[str, Any]] = {}
+        async for update in jobmanager.progress():
+            latest[update['job_id']] = update
+            best_value = min(job_update['best_value'] for job_update in latest.values())
+            acceptance_rate = sum(job_update['acceptance_rate'] for job_update in latest.values()) / len(latest)
+            self.console_printer.set_spinner_detail(' ({} jobs, best {:.6g}, acceptance {:.0%})'.format(
+                len(latest), best_value, acceptance_rate))
 
     def run(self) -> None:
         """
@@ -341,8 +505,30 @@ class Runner:
         else:
             self.console_printer.println(fg.green + 'All done. ✨')
 
+    def _add_interrupt_handler(self, loop) -> bool:
+        """Cancels running jobs on Ctrl-C instead of interrupting the run, see :meth:`~Runner.cancel`
+
+        Returns:
+            `True` if the handler was added, which is not supported on all platforms
+        """
+        try:
+            loop.add_signal_handler(signal.SIGINT, self.cancel)
+            return True
+        except (NotImplementedError, RuntimeError):
+            return False
+
     def cancel(self) -> None:
-        pass
+        """Cancels the running optimization
+
+        Workers stop their jobs and return the best results found so far, which are collected and reported as usual,
+        see :meth:`~jobs.jobmanager.JobManager.cancel`. Cancelling again, or before jobs were submitted, interrupts the
+        run.
+        """
+        if self.jobmanager is None or self.jobmanager.cancelled:
+            raise KeyboardInterrupt()
+
+        self.console_printer.set_spinner_detail(' (cancelling, press Ctrl-C again to abort)')
+        self.jobmanager.cancel()
 
 
 class Context:
@@ -10,18 +10,25 @@ import uuid
 import logging
 import sys
 import asyncio
+import copy
+import functools
+import math
+import time
+import numpy as np
+import redis
+import threading
 
-from async_timeout import timeout
 from dramatiq.brokers.redis import RedisBroker
 from dramatiq.brokers.stub import StubBroker
 from dramatiq.results import Results, ResultMissing
-from dramatiq.results.backends import RedisBackend
+from dramatiq.results.backends import RedisBackend, StubBackend
 from dramatiq import Message
-from typing import Dict, Any, List, Union
+from typing import Dict, Any, List, Union, Optional, Tuple, Callable, Sequence
 from collections import defaultdict
 from enum import Enum
 from sortedcontainers import SortedSet
 
+from .memory import MemoryBroker
 from ..model import Model
 from ..utils import is_pytest_run
 
@@ -41,20 +48,237 @@ def _use_stub_broker() -> bool:
     return bool(os.environ.get('USE_STUB_BROKER')) is True
 
 
+def _supports_pipelined_enqueue(broker: RedisBroker) -> bool:
+    """Check whether a Redis broker exposes the internals used by :meth:`Broker._enqueue_pipelined`
+
+    Pipelined enqueueing mirrors `RedisBroker.enqueue` of Dramatiq 1.3 to 2.x, which runs the Lua `dispatch` script
+    registered in `scripts` through `do_enqueue`. These are not part of Dramatiq's public API.
+
+    Returns:
+        True if the `dispatch` script and `do_enqueue` are available
+    """
+    scripts = getattr(broker, 'scripts', None)
+    return isinstance(scripts, dict) and callable(scripts.get('dispatch')) and callable(
+        getattr(broker, 'do_enqueue', None))
+
+
+def _model_key(model_hash: str) -> str:
+    return 'csaopt:models:' + model_hash
+
+
+_PROGRESS_CHANNEL = 'csaopt:progress'
+_CONTROL_CHANNEL = 'csaopt:control'
+
+
 class WorkerCommand(Enum):
     """Enum for supported worker commands"""
 
     DeployModel = 'deploy_model'
+    DeployCachedModel = 'deploy_cached_model'
     RunOptimization = 'run_optimization'
+    Cancel = 'cancel'
+
+
+def pack_results(values: np.ndarray, states: np.ndarray, dtype: np.dtype) -> Dict[str, Any]:
+    """Packs optimization results into the columnar result format
+
+    All states are sent as one contiguous buffer of shape (chains, dimensions) and all values as another, instead of
+    one array per chain. See :func:`unpack_results` for the receiving side.
+
+    Args:
+        values: Values of all chains
+        states: States of all chains
+        dtype: Data type the results are sent in, i.e. the model's precision
+
+    Returns:
+        Dictionary containing `dtype`, `shape`, `values` and `states`
+    """
+    states = np.ascontiguousarray(states, dtype=dtype)
+    states = states.reshape((states.shape[0], -1))
+    return {
+        'dtype': np.dtype(dtype).str,
+        'shape': list(states.shape),
+        'values': np.ascontiguousarray(values, dtype=dtype).tobytes(),
+        'states': states.tobytes()
+    }
+
+
+def unpack_results(result: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """Unpacks optimization results sent by a worker
+
+    Columnar results (see :func:`pack_results`) are wrapped with `np.frombuffer`, i.e. without copying the data.
+    Results of workers that send `values` and `states` as (lists of) arrays are converted to arrays.
+
+    Args:
+        result: Result of a `run_optimization` command
+
+    Returns:
+        A tuple of values and states, the latter with one row per chain. Columnar results are read-only.
+    """
+    if 'shape' not in result:
+        return np.asarray(result['values']), np.asarray(result['states'])
+
+    dtype = np.dtype(result['dtype'])
+    values = np.frombuffer(result['values'], dtype=dtype)
+    states = np.frombuffer(result['states'], dtype=dtype).reshape(result['shape'])
+    return values, states
+
+
+def parse_result_return(spec: Optional[str]) -> Optional[int]:
+    """Parses the `results.return` option of a job, i.e. how many results a worker sends back
+
+    Args:
+        spec: `all` (or `None`), `best` or `top_k=N`
+
+    Returns:
+        The number of results to return, or `None` for all results
+
+    Raises:
+        AssertionError if the option is invalid
+    """
+    if spec is None or spec == 'all':
+        return None
+    if spec == 'best':
+        return 1
+
+    name, _, count = str(spec).partition('=')
+    if name.strip() != 'top_k' or not count.strip().isdigit() or int(count) < 1:
+        raise AssertionError('results.return needs to be all, best or top_k=N with N >= 1, but is {}'.format(spec))
+    return int(count)
+
+
+def reduce_results(values: np.ndarray, states: np.ndarray, count: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Reduces results to the best `count` values and their states, see :func:`parse_result_return`
+
+    Args:
+        values: Values of all chains
+        states: States of all chains, one row per chain
+        count: Number of results to keep, `None` keeps all results
+
+    Returns:
+        A tuple of values and states. Reduced results are ordered from best to worst.
+    """
+    if count is None or count >= len(values):
+        return values, states
+
+    best = np.argpartition(values, count - 1)[:count]
+    best = best[np.argsort(values[best])]
+    return values[best], states[best]
+
+
+# 0xc1 is the only byte that is never used in msgpack, so it cannot be confused with the start of an uncompressed
+# message. It is followed by a byte identifying the codec and the compressed msgpack data.
+_COMPRESSED_HEADER = 0xc1
+_CODEC_IDS = {'zlib': 1, 'zstd': 2, 'lz4': 3}
+
+
+def _compress(codec: str, data: bytes, level: Optional[int]) -> bytes:
+    if codec == 'zlib':
+        import zlib
+        return zlib.compress(data, -1 if level is None else level)
+    elif codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    elif codec == 'lz4':
+        import lz4.frame
+        return lz4.frame.compress(data, compression_level=0 if level is None else level)
+    else:
+        raise AttributeError('Compression codec ' + codec + ' unrecognized.')
+
+
+def _decompress(codec_id: int, data: bytes) -> bytes:
+    if codec_id == _CODEC_IDS['zlib']:
+        import zlib
+        return zlib.decompress(data)
+    elif codec_id == _CODEC_IDS['zstd']:
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    elif codec_id == _CODEC_IDS['lz4']:
+        import lz4.frame
+        return lz4.frame.decompress(data)
+    else:
+        raise AttributeError('Compression codec id ' + str(codec_id) + ' unrecognized.')
 
 
 class _MsgPackEncoder(dramatiq.Encoder):
+    """Dramatiq encoder using msgpack (and msgpack-numpy), optionally compressing large messages
+
+    Compressed messages are prefixed with a header naming the codec, so they can be told apart from plain msgpack.
+    Decoding always accepts both, which keeps encoders with and without compression compatible as long as the
+    receiving side has the codec available. `zlib` is always available, `zstd` and `lz4` require the `zstandard` and
+    `lz4` packages, respectively.
+
+    Args:
+        compression: Codec used for compression (`zlib`, `zstd` or `lz4`) or `None` to disable compression
+        compression_level: Codec specific compression level, `None` selects the codec's default
+        compression_threshold: Messages smaller than this (in bytes) are not compressed
+
+    Attributes:
+        bytes_saved: Total number of bytes saved by compression, for encoded as well as decoded messages
+    """
+
+    def __init__(self, compression: Optional[str] = None, compression_level: Optional[int] = None,
+                 compression_threshold: int = 1024) -> None:
+        if compression is not None:
+            if compression not in _CODEC_IDS:
+                raise AttributeError('Compression codec ' + compression + ' unrecognized.')
+            try:
+                _compress(compression, b'', compression_level)
+            except ImportError:
+                raise AssertionError('Compression codec {} is not available, the required package is missing'.format(
+                    compression))
+
+        self.compression = compression
+        self.compression_level = compression_level
+        self.compression_threshold = compression_threshold
+        self.bytes_saved = 0
+
     def encode(self, data: dramatiq.encoder.MessageData) -> bytes:
-        return msgpack.packb(data, use_bin_type=True)
+        return self._compress(self.pack(data))
 
     def decode(self, data: bytes) -> dramatiq.encoder.MessageData:
+        if len(data) > 1 and data[0] == _COMPRESSED_HEADER:
+            compressed_size = len(data)
+            data = _decompress(data[1], data[2:])
+            self.bytes_saved += len(data) - compressed_size
         return msgpack.unpackb(data, raw=False)
 
+    def _compress(self, packed: bytes) -> bytes:
+        if self.compression is None or len(packed) < self.compression_threshold:
+            return packed
+
+        compressed = bytes([_COMPRESSED_HEADER, _CODEC_IDS[self.compression]]) + _compress(
+            self.compression, packed, self.compression_level)
+        if len(compressed) >= len(packed):
+            return packed
+
+        self.bytes_saved += len(packed) - len(compressed)
+        return compressed
+
+    def pack(self, data: Any) -> bytes:
+        """Packs data with msgpack, without compression"""
+        return msgpack.packb(data, use_bin_type=True)
+
+    def encode_with_packed_args(self, data: dramatiq.encoder.MessageData, packed_args: bytes) -> bytes:
+        """Encodes message data, using already packed bytes for its `args`
+
+        Since msgpack is a concatenative format, this produces exactly the same bytes as :meth:`encode`, but allows
+        packing a payload once and re-using it for many messages.
+
+        Args:
+            data: Message data, see :meth:`dramatiq.Message.asdict`
+            packed_args: Result of :meth:`pack` on `data['args']`
+
+        Returns:
+            The encoded message
+        """
+        packer = msgpack.Packer(use_bin_type=True)
+        encoded = [packer.pack_map_header(len(data))]
+        for key, value in data.items():
+            encoded.append(packer.pack(key))
+            encoded.append(packed_args if key == 'args' else packer.pack(value))
+        return self._compress(b''.join(encoded))
+
 
 class Broker():
     """Class wrapping a Dramatiq broker
@@ -62,7 +286,7 @@ class Broker():
     This class wraps a Dramatiq Broker and offers sending messages and retrieving results from said broker. Since the
     worker code is, by design, separate from this codebase, the standard way of communicating with Dramatiq workers
     is unavailable. Therefore, messages are enqueued directly on the broker and kept track of by this class. When
-    retrieving results, the stored messages are polled for results and then discarded.
+    retrieving results, the stored messages are awaited and then discarded.
 
     Per convention, there is one optimization worker per queue id, so the size of the list of queue ids must correspond
     with the overall number of worker processes, or more specifically, the number of worker instances, since one
@@ -74,39 +298,112 @@ class Broker():
         port: Redis port
         password: Redis password
         queue_ids: Queue ids of available workers
+        compression: Codec used to compress large messages, see :class:`_MsgPackEncoder`. Messages received from
+            the workers are decoded regardless of this setting.
+        compression_level: Codec specific compression level
+        compression_threshold: Messages smaller than this (in bytes) are not compressed
+        in_memory: Deliver messages to workers in the same process instead of using Redis, see
+            :class:`~memory.MemoryBroker`. Workers are declared with :func:`~csaopt.worker.worker.declare_actors`.
+        max_connections: Size of the Redis connection pool, which is shared by enqueueing, pings and result retrieval
+        kwargs: Any other keyword arguments are passed to the Redis connections, e.g. `socket_connect_timeout`
     """
 
+    # Longest single blocking read while waiting for results, see :meth:`~Broker.wait_for_any_result`
+    _blocking_slice_seconds = 2
+
     def __init__(self,
                  host: str = 'localhost',
                  port: int = 6379,
-                 password: str = None,
+                 password: Optional[str] = None,
                  queue_ids: List[str] = [],
-                 **kwargs: str) -> None:
+                 compression: Optional[str] = None,
+                 compression_level: Optional[int] = None,
+                 compression_threshold: int = 1024,
+                 in_memory: bool = False,
+                 max_connections: int = 16,
+                 **kwargs: Any) -> None:
 
         if len(queue_ids) < 1:
             log.warning('Constructing {} without queue_ids'.format(Broker))
 
-        if is_pytest_run() and _use_stub_broker():
-            broker = StubBroker
+        self.encoder = msgpack_encoder = _MsgPackEncoder(compression, compression_level, compression_threshold)
+
+        broker: dramatiq.Broker
+        if in_memory:
+            broker = MemoryBroker()
+            for queue_id in queue_ids:
+                broker.declare_queue(queue_id)
+            # Results are not stored in the backend, but resolved as futures. It is only required by the actor options.
+            self.result_backend = backend = StubBackend(encoder=msgpack_encoder)
+        elif is_pytest_run() and _use_stub_broker():
+            broker = StubBroker()
             broker.emit_after('process_boot')
+            # Other than Redis, the stub broker only accepts messages for declared queues
+            for queue_id in queue_ids:
+                broker.declare_queue(queue_id)
+            self.result_backend = backend = StubBackend(encoder=msgpack_encoder)
         else:
-            self.dramatiq_broker = broker = RedisBroker(host=host, port=port, password=password, **kwargs)
+            # Connecting is deferred until the first command, see wait_until_ready. If the pool is exhausted, threads
+            # wait for a connection to be returned instead of failing.
+            connection_pool = redis.BlockingConnectionPool(
+                host=host, port=port, password=password, max_connections=max_connections, **kwargs)
+            redis_broker = RedisBroker(connection_pool=connection_pool)
+            self.result_backend = backend = RedisBackend(encoder=msgpack_encoder, client=redis_broker.client)
+            broker = redis_broker
 
-            msgpack_encoder = _MsgPackEncoder()
-            self.result_backend = backend = RedisBackend(encoder=msgpack_encoder, client=self.dramatiq_broker.client)
-            broker.add_middleware(Results(backend=backend))
+        self.dramatiq_broker = broker
+        broker.add_middleware(Results(backend=backend))
 
         dramatiq.set_broker(broker)
         dramatiq.set_encoder(msgpack_encoder)
 
         self.queue_ids: SortedSet = SortedSet(queue_ids)
         self.queue_messages: Dict[str, List[dramatiq.Message]] = defaultdict(list)
+        # Model store for backends without a Redis client, i.e. the StubBackend
+        self.stub_model_store: Dict[str, bytes] = {}
+        # Subscribers by channel for brokers without a Redis client, i.e. in-memory and stub brokers
+        self.subscribers: Dict[str, List[Callable[[Dict[str, Any]], None]]] = defaultdict(list)
+
+    async def wait_until_ready(self, timeout: float = 30.0, initial_delay: float = 0.1, max_delay: float = 5.0) -> None:
+        """Waits until the broker accepts connections
+
+        The broker is probed with a `PING`, retrying with exponential backoff, so it is detected as soon as it is up
+        without flooding it while it starts. The probe runs in the default executor, so the event loop stays
+        responsive. Brokers in memory and stub brokers are always ready.
+
+        Args:
+            timeout: Overall timeout in seconds
+            initial_delay: Delay in seconds after the first failed probe, doubled after each failed probe
+            max_delay: Maximum delay in seconds between probes
+
+        Raises:
+            TimeoutError if the broker was not ready within the timeout
+        """
+        client = getattr(self.result_backend, 'client', None)
+        if client is None:
+            return
+
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        delay = initial_delay
+        while True:
+            try:
+                await loop.run_in_executor(None, client.ping)
+                return
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError) as e:
+                log.debug('Broker not ready yet: {}'.format(e))
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError('Timed out waiting for broker to come online')
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(2 * delay, max_delay)
 
     def clear_queue_messages(self):
         """Clears messages that were queued on the broker
 
         The broker can only wait for results on message objects that were submitted to the Dramatiq broker.
-        It does so by keeping an internal queue of messages. These messages will be polled for results in the
+        It does so by keeping an internal queue of messages. These messages will be awaited in the
         next call to :meth:`~Broker.get_results`. Clearing the queue has the effect of 'forgetting' earlier
         messages.
 
@@ -125,6 +422,9 @@ class Broker():
             `True` if the actor responded with `pong`
 
         """
+        if isinstance(self.dramatiq_broker, MemoryBroker):
+            raise AssertionError('Blocking pings are not supported in memory, use send_ping instead')
+
         queue_id = self.__extract_queue_id(queue)
 
         msg = self.dramatiq_broker.enqueue(
@@ -141,6 +441,39 @@ class Broker():
 
         return result == 'pong'
 
+    def send_ping(self, queue: Union[str, int]) -> dramatiq.Message:
+        """Sends a `ping` message to the specified queue without waiting for the response.
+
+        The message is not tracked as a queued message, i.e. its result is not part of :meth:`~Broker.get_results`.
+        Use :meth:`~Broker.wait_for_any_result` to await the `pong`.
+
+        Args:
+            queue: Index or id of queue
+
+        Returns:
+            The enqueued message
+        """
+        queue_id = self.__extract_queue_id(queue)
+
+        return self.dramatiq_broker.enqueue(
+            Message(
+                queue_name=queue_id,
+                actor_name='PingActor',
+                args=(),
+                kwargs={},
+                options={},
+            ))
+
+    def remove_queue(self, queue: Union[str, int]) -> None:
+        """Removes a queue, e.g. because its worker did not join, and forgets all messages sent to it
+
+        Args:
+            queue: Index or id of queue
+        """
+        queue_id = self.__extract_queue_id(queue)
+        self.queue_ids.discard(queue_id)
+        self.queue_messages.pop(queue_id, None)
+
     async def get_queue_results(self, queue: Union[str, int], timeout=10.0) -> List[Dict[str, Any]]:
         """Get results for specific queue.
 
@@ -155,8 +488,8 @@ class Broker():
             A list of the retrieved results
 
         """
-        for queue_id in self.queue_ids:
-            results = await self.get_results(queues=[self.__extract_queue_id(queue)], result_timeout=timeout)
+        queue_id = self.__extract_queue_id(queue)
+        results = await self.get_results(queues=[queue_id], result_timeout=timeout)
 
         return results[queue_id]
 
@@ -176,15 +509,14 @@ class Broker():
         """
         return await self.get_results(queues=self.queue_ids, result_timeout=timeout)
 
-    async def get_results(self, queues: List[str], result_timeout: float = 10.0) -> Dict[str, List[Dict[str, Any]]]:
+    async def get_results(self, queues: List[Union[str, int]],
+                          result_timeout: float = 10.0) -> Dict[str, List[Dict[str, Any]]]:
         """Get results for a list of queue indices or ids.
 
-        This will attempt to fetch results from the Dramatiq results backend for the specified queues. Internally,
-        it constructs a list of messages that need to provide results and tries, in a non-blocking manner, to get
-        results from the Dramatiq results backend. If a message has not yet received results, it will be re-tried
-        after one-tenth of the specified timeout, but at a minimum of 1 second. Therefore, this method will re-try
-        for a total number of 10 times, after which the overall timeout will stop the polling.
-
+        This will wait for results of all messages that were sent to the specified queues. Instead of polling each
+        message, a single blocking pop on the result keys of all pending messages is issued. Redis answers it as soon
+        as any of the results is stored, so results are received right after the worker finishes and waiting costs
+        no round trips. The blocking call runs in the default executor to keep the event loop responsive.
 
         Args:
             queues: List of queue indices or ids
@@ -193,58 +525,257 @@ class Broker():
         Returns:
             A dictionary of queue ids and list of the retrieved results for each queue
 
+        Raises:
+            TimeoutError if not all results were received within the timeout
         """
-        messages_to_process: Dict[str, List[dramatiq.Message]] = {}
-        for queue_id in self.queue_ids:
-            for message in self.queue_messages[queue_id]:
+        messages_to_process: Dict[str, dramatiq.Message] = {}
+        for queue in queues:
+            for message in self.queue_messages[self.__extract_queue_id(queue)]:
                 messages_to_process[message.message_id] = message
         log.debug('Messages to process is [{}]'.format(messages_to_process))
 
-        message_ids_processed: List[str] = []
         results: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
 
-        async with timeout(result_timeout) as timeout_cm:
-            while len(messages_to_process) > 0:
-                for msg in messages_to_process.values():
-                    try:
-                        msg_result = msg.get_result(  # type: ignore
-                            backend=self.result_backend, timeout=int(result_timeout * 1e3))
-                        results[msg.queue_name].append(msg_result)  # type: ignore
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + result_timeout
+        while len(messages_to_process) > 0:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError('Timed out while waiting for results')
 
-                        message_ids_processed.append(msg.message_id)  # type: ignore
-                    except ResultMissing:
-                        pass
+            completed = await self.wait_for_any_result(list(messages_to_process.values()), remaining)
+            if completed is not None:
+                msg, msg_result = completed
+                results[msg.queue_name].append(msg_result)
+                messages_to_process.pop(msg.message_id, None)
 
-                # Remove all processed messages from messages_to_process list
-                for message_id in message_ids_processed:
-                    messages_to_process.pop(message_id, None)
+                log.debug('Received result for message {}, there is/are still {} messages to be awaited.'.format(
+                    msg.message_id, len(messages_to_process)))
 
-                message_ids_processed.clear()
+        return results
 
-                log.debug('Sleeping for {} seconds, there is/are still {} messages to be awaited.'.format(
-                    max(1.0, result_timeout / 10.0), len(messages_to_process)))
-                await asyncio.sleep(max(1.0, result_timeout / 10.0))
+    async def wait_for_any_result(self, messages: List[dramatiq.Message],
+                                  timeout_seconds: float) -> Optional[Tuple[dramatiq.Message, Any]]:
+        """Waits until the result of any of the given messages is available
 
-        if timeout_cm.expired:
-            raise TimeoutError('Timed out while waiting for results')
+        The blocking wait runs in the default executor, so the event loop stays responsive. In memory, the result
+        futures are awaited directly.
 
-        return results
+        Args:
+            messages: Messages to wait for
+            timeout_seconds: Maximum time to wait
+
+        Returns:
+            Tuple of message and its result or `None` on timeout
+        """
+        if isinstance(self.dramatiq_broker, MemoryBroker):
+            return await self._wait_for_any_result_in_memory(self.dramatiq_broker, messages, timeout_seconds)
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._wait_for_any_result, messages, timeout_seconds)
+
+    async def _wait_for_any_result_in_memory(self, broker: MemoryBroker, messages: List[dramatiq.Message],
+                                             timeout_seconds: float) -> Optional[Tuple[dramatiq.Message, Any]]:
+        futures = {broker.get_result_future(msg): msg for msg in messages}
+        done, _ = await asyncio.wait(list(futures.keys()), timeout=timeout_seconds,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if len(done) == 0:
+            return None
+
+        future = done.pop()
+        msg = futures[future]
+        broker.forget_result(msg)
+        return msg, future.result()
+
+    def _wait_for_any_result(self, messages: List[dramatiq.Message],
+                             timeout_seconds: float) -> Optional[Tuple[dramatiq.Message, Any]]:
+        client = getattr(self.result_backend, 'client', None)
+
+        if client is None:
+            # Backends without a Redis client (i.e. the StubBackend) cannot block on several messages
+            for msg in messages:
+                try:
+                    return msg, msg.get_result(backend=self.result_backend)
+                except ResultMissing:
+                    pass
+            time.sleep(min(timeout_seconds, 0.05))
+            return None
+
+        message_keys = {self.result_backend.build_message_key(msg): msg for msg in messages}
+        deadline = time.monotonic() + timeout_seconds
+        while True:
+            # Blocking in short slices keeps each read below the socket timeout of the connection, which some
+            # redis-py versions derive from the connect timeout. A timeout of 0 would block indefinitely and Redis
+            # versions before 6 only support integral timeouts.
+            blocking_seconds = min(deadline - time.monotonic(), self._blocking_slice_seconds)
+            popped = client.blpop(list(message_keys.keys()), timeout=max(1, math.ceil(blocking_seconds)))
+            if popped is not None or time.monotonic() >= deadline:
+                break
+
+        if popped is None:
+            return None
+
+        message_key, data = popped
+        return message_keys[message_key.decode('utf-8')], self._decode_result(data)
+
+    def _decode_result(self, data: bytes) -> Any:
+        result = self.result_backend.encoder.decode(data)
+
+        # Newer Dramatiq versions wrap results, so that exceptions can be stored as well
+        if hasattr(self.result_backend, 'unwrap_result'):
+            result = self.result_backend.unwrap_result(result)
+        return result
+
+    def store_model(self, model_hash: str, model_dict: Dict[str, Any], ttl: int = 604800) -> bool:
+        """Stores a serialized model on the broker under its content hash
+
+        If the model is already stored, only its expiry is refreshed and the model is not transferred again.
+
+        Args:
+            model_hash: Content hash of the model, see :meth:`~model.Model.content_hash`
+            model_dict: Serialized model, see :meth:`~model.Model.to_dict`
+            ttl: Time in seconds after which the stored model expires
+
+        Returns:
+            `True` if the model was transferred, `False` if it was already stored
+        """
+        key = _model_key(model_hash)
+        client = getattr(self.result_backend, 'client', None)
+
+        if client is None:
+            if key in self.stub_model_store:
+                return False
+            self.stub_model_store[key] = self.result_backend.encoder.encode(model_dict)
+            return True
+
+        if client.expire(key, ttl):
+            return False
+        client.set(key, self.result_backend.encoder.encode(model_dict), ex=ttl)
+        return True
+
+    def load_model(self, model_hash: str) -> Optional[Dict[str, Any]]:
+        """Loads a serialized model that was stored with :meth:`~Broker.store_model`
+
+        Args:
+            model_hash: Content hash of the model
+
+        Returns:
+            The serialized model or `None` if no model is stored under the hash
+        """
+        key = _model_key(model_hash)
+        client = getattr(self.result_backend, 'client', None)
+
+        data = self.stub_model_store.get(key) if client is None else client.get(key)
+        if data is None:
+            return None
+        return self.result_backend.encoder.decode(data)
+
+    def publish_progress(self, update: Dict[str, Any]) -> None:
+        """Publishes a progress update of a running job
+
+        Updates are not stored, i.e. they are dropped if there is no subscriber, see :meth:`~Broker._publish`.
+
+        Args:
+            update: Progress update, see :meth:`~csaopt.worker.worker.OptimizationWorker.run_optimization`
+        """
+        self._publish(_PROGRESS_CHANNEL, update)
 
-    def broadcast(self, command: WorkerCommand, payload: Dict[str, Any]) -> None:
+    def subscribe_progress(self, callback: Callable[[Dict[str, Any]], None]) -> Callable[[], None]:
+        """Subscribes to the progress updates published by workers
+
+        Args:
+            callback: Function called with each update, see :meth:`~Broker._subscribe`
+
+        Returns:
+            A function that ends the subscription
+        """
+        return self._subscribe(_PROGRESS_CHANNEL, callback)
+
+    def send_control(self, command: WorkerCommand, payload: Dict[str, Any]) -> None:
+        """Sends a command to all workers, bypassing their queues
+
+        Other than messages sent to queues, control commands reach workers while they are running a job. They are not
+        stored, i.e. only workers that are subscribed at the time receive them, see :meth:`~Broker.subscribe_control`.
+
+        Args:
+            command: Command, e.g. :attr:`WorkerCommand.Cancel`
+            payload: Payload of the command
+        """
+        self._publish(_CONTROL_CHANNEL, {'command': command.value, 'payload': payload})
+
+    def subscribe_control(self, callback: Callable[[str, Dict[str, Any]], Any]) -> Callable[[], None]:
+        """Subscribes to control commands sent by the application master
+
+        Args:
+            callback: Function called with the command and payload of each control command, see
+                :meth:`~Broker._subscribe`. Its return value is ignored.
+
+        Returns:
+            A function that ends the subscription
+        """
+        return self._subscribe(_CONTROL_CHANNEL, lambda message: callback(message['command'], message['payload']))
+
+    def _publish(self, channel: str, message: Dict[str, Any]) -> None:
+        """Publishes a message to all subscribers of a channel
+
+        With Redis, messages are sent through pub/sub, otherwise they are passed to the subscribers in this process.
+        """
+        client = getattr(self.result_backend, 'client', None)
+        if client is None:
+            for callback in list(self.subscribers[channel]):
+                callback(message)
+            return
+
+        client.publish(channel, self.encoder.pack(message))
+
+    def _subscribe(self, channel: str, callback: Callable[[Dict[str, Any]], None]) -> Callable[[], None]:
+        """Subscribes to a channel
+
+        The callback is called from a background thread with Redis, or from the publishing thread otherwise, so it
+        needs to be thread-safe.
+        """
+        client = getattr(self.result_backend, 'client', None)
+        if client is None:
+            self.subscribers[channel].append(callback)
+            return lambda: self.subscribers[channel].remove(callback)
+
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(channel)
+        stopped = threading.Event()
+
+        def listen() -> None:
+            while not stopped.is_set():
+                try:
+                    message = pubsub.get_message(timeout=0.2)
+                except redis.RedisError:
+                    log.exception('Error while receiving messages on {}'.format(channel))
+                    stopped.wait(1.0)
+                    continue
+                if message is not None and message['type'] == 'message':
+                    callback(self.encoder.decode(message['data']))
+            pubsub.close()
+
+        threading.Thread(target=listen, name='csaopt-subscriber', daemon=True).start()
+        return stopped.set
+
+    def broadcast(self, command: WorkerCommand, payload: Dict[str, Any]) -> List[dramatiq.Message]:
         """Send a command and payload to all registered queues.
 
+        The payload is encoded only once and all messages are enqueued in a single round trip, see
+        :meth:`~Broker.send_to_queues`.
+
         Args:
             command: Command
             payload: Any dictionary that can be serialized by msgpack (and msgpack-numpy)
 
         Returns:
-            Nothing
+            The enqueued messages, in the order of the queue ids
         """
-        log.debug('Broadcasting cmd [{}] and payload [{}] to queue ids: {}', command, payload, self.queue_ids)
-        for queue_id in self.queue_ids:
-            self.send_to_queue(queue_id, command, payload)
+        log.debug('Broadcasting cmd [{}] and payload [{}] to queue ids: {}'.format(command, payload, self.queue_ids))
+        return self.send_to_queues([(queue_id, command, payload) for queue_id in self.queue_ids])
 
-    def send_to_queue(self, queue: Union[str, int], command: WorkerCommand, payload: Dict[str, Any]) -> None:
+    def send_to_queue(self, queue: Union[str, int], command: WorkerCommand,
+                      payload: Dict[str, Any]) -> dramatiq.Message:
         """Send a command and payload to a queue.
 
         Args:
@@ -253,20 +784,85 @@ class Broker():
             payload: Any dictionary that can be serialized by msgpack (and msgpack-numpy)
 
         Returns:
-            Nothing
+            The enqueued message
         """
-        queue_id = self.__extract_queue_id(queue)
+        return self.send_to_queues([(queue, command, payload)])[0]
 
-        msg = self.dramatiq_broker.enqueue(
+    def send_to_queues(self, submissions: Sequence[Tuple[Union[str, int], WorkerCommand, Dict[str, Any]]]
+                       ) -> List[dramatiq.Message]:
+        """Send commands and payloads to several queues at once.
+
+        On Redis, all messages are enqueued in one pipeline, i.e. in a single round trip to the broker instead of one
+        per message. Payloads are encoded once per payload object, so sending the same payload to many queues does
+        not re-encode it for every queue. Dramatiq versions without the internals this relies on fall back to
+        enqueueing one message at a time. All messages are tracked and awaited in the next call to
+        :meth:`~Broker.get_results`.
+
+        Args:
+            submissions: List of (queue index or id, command, payload) tuples
+
+        Returns:
+            The enqueued messages, in the order of the submissions
+        """
+        messages: List[dramatiq.Message] = [
             Message(
-                queue_name=queue_id,
+                queue_name=self.__extract_queue_id(queue),
                 actor_name='OptimizationActor',
                 args=(command.value, payload),
                 kwargs={},
                 options={},
-            ))
-        log.debug('Appending msg[{}] to queued_messages'.format(msg))
-        self.queue_messages[queue_id].append(msg)
+            ) for queue, command, payload in submissions
+        ]
+
+        if isinstance(self.dramatiq_broker, RedisBroker) and _supports_pipelined_enqueue(self.dramatiq_broker):
+            messages = self._enqueue_pipelined(self.dramatiq_broker, messages)
+        else:
+            messages = [self.dramatiq_broker.enqueue(msg) for msg in messages]
+
+        for msg in messages:
+            log.debug('Appending msg[{}] to queued_messages'.format(msg))
+            self.queue_messages[msg.queue_name].append(msg)
+
+        return messages
+
+    def _enqueue_pipelined(self, broker: RedisBroker, messages: List[dramatiq.Message]) -> List[dramatiq.Message]:
+        """Enqueues messages on the Redis broker in a single pipeline
+
+        This mirrors :meth:`dramatiq.brokers.redis.RedisBroker.enqueue`, except that the dispatch script is executed
+        on a pipeline and that message args are packed once per distinct payload.
+        """
+        encoder = self.encoder
+        pipeline = broker.client.pipeline(transaction=False)
+        enqueue = self._pipelined_enqueue(broker, pipeline)
+
+        packed_args: Dict[int, bytes] = {}
+        enqueued: List[dramatiq.Message] = []
+        for msg in messages:
+            # Redis needs a unique id per enqueued message, see RedisBroker.enqueue
+            msg = msg.copy(options={'redis_message_id': str(uuid.uuid4())})
+            payload_id = id(msg.args[1])
+            if payload_id not in packed_args:
+                packed_args[payload_id] = encoder.pack(msg.args)
+
+            broker.emit_before('enqueue', msg, None)
+            enqueue(msg.queue_name, msg.options['redis_message_id'],
+                    encoder.encode_with_packed_args(msg.asdict(), packed_args[payload_id]))
+            enqueued.append(msg)
+
+        pipeline.execute()
+        for msg in enqueued:
+            broker.emit_after('enqueue', msg, None)
+
+        log.debug('Enqueued {} messages with {} distinct payloads in one pipeline'.format(
+            len(enqueued), len(packed_args)))
+        return enqueued
+
+    def _pipelined_enqueue(self, broker: RedisBroker, pipeline) -> Callable[..., Any]:
+        """Returns Dramatiq's enqueue dispatcher, bound to a Redis pipeline instead of the client"""
+        broker = copy.copy(broker)
+        dispatch = functools.partial(broker.scripts['dispatch'], client=pipeline)
+        broker.scripts = dict(broker.scripts, dispatch=dispatch)
+        return broker.do_enqueue
 
     def __extract_queue_id(self, queue: Union[str, int]) -> str:
         """Retrieves the queue id for a given index or id
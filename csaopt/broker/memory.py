@@ -0,0 +1,156 @@
+import asyncio
+import functools
+import logging
+
+import dramatiq
+
+from collections import defaultdict
+from dramatiq import Message
+from dramatiq.errors import QueueNotFound
+from typing import Dict, Any, List, Optional
+
+log = logging.getLogger(__name__)
+
+
+class MemoryBroker(dramatiq.Broker):
+    """Dramatiq broker delivering messages to actors in the same process
+
+    Each queue is an asyncio queue, which is consumed by a task that runs the actors in the default executor, i.e.
+    messages of a queue are processed one after another, like by a worker with a single thread. Results are resolved
+    as asyncio futures. Messages are passed by reference, so nothing is serialized and no sockets are involved.
+
+    Other than with Dramatiq's brokers, actors are looked up by queue and name. This allows declaring the same
+    actors (e.g. `PingActor`) for several queues, each backed by a different worker.
+
+    Note:
+        The broker is bound to the event loop that is running when the first message is enqueued. Messages can only
+        be enqueued from that event loop's thread.
+    """
+
+    def __init__(self, middleware: Optional[List[dramatiq.Middleware]] = None) -> None:
+        super().__init__(middleware=middleware)
+        # Queues are created once the event loop is known, see _get_queue
+        self.queues: Dict[str, Optional[asyncio.Queue]] = {}
+        self.queue_actors: Dict[str, Dict[str, dramatiq.Actor]] = defaultdict(dict)
+        self.results: Dict[str, asyncio.Future] = {}
+        self.consumers: Dict[str, asyncio.Future] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def declare_actor(self, actor: dramatiq.Actor) -> None:
+        """Declares an actor for its queue
+
+        The actor is deliberately not registered by name only, see :class:`MemoryBroker`.
+
+        Args:
+            actor: The actor being declared
+        """
+        self.emit_before('declare_actor', actor)
+        self.declare_queue(actor.queue_name)
+        self.queue_actors[actor.queue_name][actor.actor_name] = actor
+        self.emit_after('declare_actor', actor)
+
+    def declare_queue(self, queue_name: str) -> None:
+        """Declares a queue, this is idempotent
+
+        Args:
+            queue_name: Name of the queue
+        """
+        if queue_name not in self.queues:
+            self.emit_before('declare_queue', queue_name)
+            self.queues[queue_name] = None
+            self.emit_after('declare_queue', queue_name)
+
+    def get_declared_queues(self) -> set:
+        return set(self.queues.keys())
+
+    def get_declared_delay_queues(self) -> set:
+        return set()
+
+    def enqueue(self, message: Message, *, delay: Optional[int] = None) -> Message:
+        """Enqueues a message
+
+        Args:
+            message: The message to enqueue
+            delay: Not supported, must be `None`
+
+        Returns:
+            The enqueued message
+
+        Raises:
+            QueueNotFound if the queue of the message has not been declared
+        """
+        if delay is not None:
+            raise AssertionError('Delayed messages are not supported by {}'.format(type(self).__name__))
+        if message.queue_name not in self.queues:
+            raise QueueNotFound(message.queue_name)
+
+        self.emit_before('enqueue', message, delay)
+        queue = self._get_queue(message.queue_name)
+        self.results[message.message_id] = self.loop.create_future()  # type: ignore
+        queue.put_nowait(message)
+        self.emit_after('enqueue', message, delay)
+        return message
+
+    def get_result_future(self, message: Message) -> asyncio.Future:
+        """Returns the future that is resolved with the result of a message
+
+        Args:
+            message: An enqueued message
+
+        Returns:
+            The future resolving to the value returned by the actor, or raising the exception it raised
+        """
+        return self.results[message.message_id]
+
+    def forget_result(self, message: Message) -> None:
+        """Discards the result of a message, e.g. after it has been retrieved
+
+        Args:
+            message: An enqueued message
+        """
+        self.results.pop(message.message_id, None)
+
+    def consume(self, queue_name: str, prefetch: int = 1, timeout: int = 5000) -> dramatiq.Consumer:
+        raise AssertionError('{} delivers messages itself and cannot be consumed by workers'.format(
+            type(self).__name__))
+
+    def close(self) -> None:
+        """Stops consuming messages and cancels pending results"""
+        for consumer in self.consumers.values():
+            consumer.cancel()
+        for result in self.results.values():
+            result.cancel()
+        self.consumers.clear()
+        self.results.clear()
+
+    def _get_queue(self, queue_name: str) -> asyncio.Queue:
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+
+        queue = self.queues[queue_name]
+        if queue is None:
+            self.queues[queue_name] = queue = asyncio.Queue()
+            self.consumers[queue_name] = asyncio.ensure_future(self._consume(queue, queue_name))
+
+        return queue
+
+    async def _consume(self, queue: asyncio.Queue, queue_name: str) -> None:
+        while True:
+            message = await queue.get()
+            result = self.results.get(message.message_id)
+
+            try:
+                actor = self.queue_actors[queue_name].get(message.actor_name)
+                if actor is None:
+                    raise dramatiq.ActorNotFound(message.actor_name)
+
+                value: Any = await self.loop.run_in_executor(  # type: ignore
+                    None, functools.partial(actor.fn, *message.args, **message.kwargs))
+                if result is not None and not result.done():
+                    result.set_result(value)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.exception('Exception occurred while processing message {}'.format(message.message_id))
+                if result is not None and not result.done():
+                    result.set_exception(e)
@@ -0,0 +1,111 @@
+"""
+This module provides in-process execution of optimization models, i.e. running a :class:`~model.Model` without a
+broker or any worker instances.
+
+The model functions are transmitted as source code (see :meth:`model.Model.to_dict`). Before they can be executed,
+they are compiled into a namespace that provides the names a model can rely on without importing them (`math`, `pi`,
+`clamp`, `cuda`, the typing helpers and the model enums), since only the globals section and the required functions
+are carried over from the model file.
+"""
+
+import builtins
+import math
+import textwrap
+import typing
+import numpy as np
+
+from typing import Dict, Callable, Any, Optional
+
+from ..model import Model, RequiredFunctions, Precision, RandomDistribution
+from ..utils import clamp, FakeCuda
+
+__all__ = ['engine', 'numpy_engine', 'numba_engine', 'preflight']
+
+
+class _VectorizedMath():
+    """Drop-in replacement for the `math` module operating on numpy arrays
+
+    Functions that numpy provides as ufuncs are looked up on numpy first, everything else (e.g. constants) falls back
+    to the `math` module.
+    """
+
+    _renamed = {'pow': 'power', 'atan': 'arctan', 'atan2': 'arctan2', 'asin': 'arcsin', 'acos': 'arccos'}
+    _constants = ('pi', 'e', 'inf', 'nan', 'tau')
+
+    def __getattr__(self, name: str) -> Any:
+        np_name = self._renamed.get(name, name)
+        if name not in self._constants and hasattr(np, np_name):
+            return getattr(np, np_name)
+        return getattr(math, name)
+
+
+def _vectorized_clamp(min_val, val, max_val):
+    return np.clip(val, min_val, max_val)
+
+
+def _create_namespace(vectorized: bool) -> Dict[str, Any]:
+    namespace: Dict[str, Any] = {name: getattr(typing, name) for name in typing.__all__}
+    namespace.update({
+        '__builtins__': builtins,
+        'math': _VectorizedMath() if vectorized else math,
+        'pi': math.pi,
+        'clamp': _vectorized_clamp if vectorized else clamp,
+        'cuda': FakeCuda,
+        'Precision': Precision,
+        'RandomDistribution': RandomDistribution
+    })
+    return namespace
+
+
+def compile_model(model: Model, vectorized: bool = False, decorator: Optional[Callable] = None,
+                  **overrides: Any) -> Dict[str, Callable]:
+    """Compiles the globals and function sources of a model into python functions
+
+    Args:
+        model: Model to be compiled
+        vectorized: If `True`, `math` and `clamp` will operate element-wise on numpy arrays
+        decorator: Optional decorator (e.g. a JIT compiler) applied to each function. The decorated function also
+            replaces the original in the namespace, so calls between model functions use the decorated version.
+        overrides: Names that should replace the defaults provided to the model, e.g. `cuda`
+
+    Returns:
+        Dictionary mapping the name of each required function to the compiled function object
+    """
+    namespace = _create_namespace(vectorized)
+    namespace.update(overrides)
+
+    exec(compile(model.globals or '', '<{}:globals>'.format(model.name), 'exec'), namespace)
+    for name, source in model.functions.items():
+        exec(compile(textwrap.dedent(source), '<{}:{}>'.format(model.name, name), 'exec'), namespace)
+        if decorator is not None:
+            namespace[name] = decorator(namespace[name])
+
+    return {func.value: namespace[func.value] for func in RequiredFunctions}
+
+
+def get_dtype(model: Model) -> np.dtype:
+    """Returns the numpy dtype corresponding to the precision of a model"""
+    return np.dtype(Precision(model.precision).value)
+
+
+def create_engine(backend: str, model: Model, opt_conf: Dict[str, Any]):
+    """Creates an engine for the requested backend
+
+    The engine modules are imported lazily, since the `numba` backend requires numba to be installed.
+
+    Args:
+        backend: Name of the engine backend, currently `numpy` or `numba`
+        model: Model to be optimized
+        opt_conf: The `optimization` section of a configuration
+
+    Returns:
+        An :class:`~engine.engine.Engine` for the given model
+    """
+    if backend == 'numpy':
+        from .numpy_engine import NumpyEngine
+        return NumpyEngine(model, opt_conf)
+    elif backend == 'numba':
+        from .numba_engine import NumbaEngine
+        return NumbaEngine(model, opt_conf)
+    else:
+        raise AttributeError('Engine backend ' + backend + ' unrecognized.')
@@ -0,0 +1,77 @@
+import abc
+import numpy as np
+
+from typing import Dict, Any, Optional, Callable
+
+from . import get_dtype
+from ..model import Model
+
+# Called with step, temperature, best value and acceptance rate since the last call
+ProgressCallback = Callable[[int, float, float, float], None]
+
+# Returns True if the optimization should stop early
+CancelledCallback = Callable[[], bool]
+
+
+class Engine(abc.ABC):
+    """Abstract class for engines executing an optimization model in-process.
+
+    An engine runs `thread_count` independent annealing chains of a model and returns, for each chain, the best value
+    and the state at which it was evaluated. The result has the same shape as the result messages sent by workers, i.e.
+    a dictionary with `values` and `states`, so it can be consumed wherever worker results are consumed.
+
+    Args:
+        model: Model to be optimized
+        opt_conf: The `optimization` section of a configuration, requires `thread_count`, `max_steps` and
+            `initial_temp`. `min_temp`, `random_seed` and `target_value` are optional. Chains stop as soon as
+            the best value of any chain is at or below `target_value`.
+    """
+
+    required_params = ['thread_count', 'max_steps', 'initial_temp']
+
+    def __init__(self, model: Model, opt_conf: Dict[str, Any]) -> None:
+        for param in self.required_params:
+            if param not in opt_conf:
+                raise AssertionError('`{}` parameter must be provided in optimization configuration'.format(param))
+
+        self.model: Model = model
+        self.dtype: np.dtype = get_dtype(model)
+        self.thread_count: int = int(opt_conf['thread_count'])
+        self.max_steps: int = int(opt_conf['max_steps'])
+        self.initial_temp: float = float(opt_conf['initial_temp'])
+        self.min_temp: float = float(opt_conf.get('min_temp', 0.0))
+        self.random_seed = opt_conf.get('random_seed', None)
+        target_value = opt_conf.get('target_value', None)
+        self.target_value: Optional[float] = float(target_value) if target_value is not None else None
+
+    def _resumed_temp(self, cool, start_step: int) -> float:
+        """Returns the temperature reached by the cooling schedule after `start_step` steps"""
+        temp = self.initial_temp
+        for step in range(start_step):
+            temp = cool(self.initial_temp, temp, step)
+        return temp
+
+    def _should_stop(self, best_value: float, cancelled: Optional[CancelledCallback]) -> bool:
+        """Returns `True` if the target value was reached or the optimization was cancelled"""
+        if self.target_value is not None and best_value <= self.target_value:
+            return True
+        return cancelled is not None and cancelled()
+
+    @abc.abstractmethod
+    def run(self, initial_states: Optional[np.ndarray] = None, start_step: int = 0,
+            progress: Optional[ProgressCallback] = None, progress_steps: int = 100,
+            cancelled: Optional[CancelledCallback] = None) -> Dict[str, np.ndarray]:
+        """Run the optimization and return a dictionary containing `values` and `states` of all chains
+
+        If the optimization stops early, i.e. if `target_value` is reached or `cancelled` returns `True`, the best
+        values and states found so far are returned.
+
+        Args:
+            initial_states: States to resume from instead of initializing the chains. If there are fewer states
+                than chains, chains are assigned the states round-robin.
+            start_step: Number of steps already performed by the resumed chains. The cooling schedule and the
+                step counter continue from this step.
+            progress: Optional callback reporting the progress of all chains, see :data:`ProgressCallback`
+            progress_steps: Number of steps between calls of `progress` and checks whether to stop early
+            cancelled: Optional callback, returning `True` if the optimization should stop early
+        """
@@ -0,0 +1,206 @@
+import logging
+import numba
+import numpy as np
+
+from typing import Dict, Any, Callable, Tuple, Optional
+
+from . import compile_model
+from .engine import Engine, ProgressCallback, CancelledCallback
+from ..model import Model, RandomDistribution
+from ..utils import clamp
+
+log = logging.getLogger(__name__)
+
+# Compiled functions and kernels by model content hash. Numba compiles lazily and keeps the machine code on the
+# dispatcher, so re-using the kernel skips the JIT compilation for subsequent runs of the same model.
+_kernels: Dict[str, Tuple[Dict[str, Callable], Callable]] = {}
+
+
+class _NumbaCuda():
+    """Stand-in for `numba.cuda` that compiles device functions for the CPU"""
+
+    @staticmethod
+    def jit(*args, **kwargs):
+        def f(fun):
+            return numba.njit(fun)
+
+        return f
+
+
+def _create_kernel(functions: Dict[str, Callable]) -> Callable:
+    """Fuses the model functions into one parallel annealing kernel
+
+    Each chain runs the annealing loop in its own `prange` iteration, so chains are distributed across all available
+    cores. Since the model functions are themselves numba-compiled, they get inlined into the kernel.
+
+    The kernel runs `steps` steps from `start_step` on, starting at temperature `temp`. The current `states` are
+    updated in place, so that subsequent calls continue the chains, e.g. after reporting progress.
+
+    Args:
+        functions: Dictionary of numba-compiled model functions
+
+    Returns:
+        The (lazily compiled) kernel
+    """
+    initialize = functions['initialize']
+    generate_next = functions['generate_next']
+    evaluate = functions['evaluate']
+    acceptance_func = functions['acceptance_func']
+    cool = functions['cool']
+
+    @numba.njit
+    def fill_randoms(randoms, normal):
+        for i in range(randoms.shape[0]):
+            randoms[i] = np.random.standard_normal() if normal else np.random.random()
+
+    @numba.njit(parallel=True)
+    def kernel(states, best_states, best_values, accepted, initialize_states, initial_temp, temp, min_temp,
+               start_step, steps, normal):
+        thread_count, dimensions = states.shape
+        for chain in numba.prange(thread_count):
+            state = states[chain]
+            new_state = np.empty_like(state)
+            randoms = np.empty_like(state)
+
+            if initialize_states:
+                fill_randoms(randoms, normal)
+                initialize(state, randoms)
+            e_old = evaluate(state)
+
+            if e_old < best_values[chain]:
+                best_states[chain, :] = state
+                best_values[chain] = e_old
+
+            chain_temp = temp
+            for step in range(start_step, start_step + steps):
+                new_state[:] = state
+                fill_randoms(randoms, normal)
+                generate_next(state, new_state, randoms, step)
+                e_new = evaluate(new_state)
+
+                if acceptance_func(e_old, e_new, chain_temp, np.random.random()):
+                    state[:] = new_state
+                    e_old = e_new
+                    accepted[chain] += 1
+
+                    if e_old < best_values[chain]:
+                        best_states[chain, :] = state
+                        best_values[chain] = e_old
+
+                chain_temp = cool(initial_temp, chain_temp, step)
+                if chain_temp < min_temp:
+                    break
+
+    return kernel
+
+
+def compile_numba_model(model: Model) -> Tuple[Dict[str, Callable], Callable]:
+    """Compiles the functions of a model and the annealing kernel with numba, for the CPU
+
+    Numba compiles lazily, i.e. on the first call of each function, and the results are cached per model content hash
+    for the lifetime of the process.
+
+    Args:
+        model: Model to be compiled
+
+    Returns:
+        A tuple of the compiled model functions by name and the kernel
+    """
+    model_hash = model.content_hash()
+    if model_hash not in _kernels:
+        functions = compile_model(model, decorator=numba.njit, cuda=_NumbaCuda, clamp=numba.njit(clamp))
+        _kernels[model_hash] = functions, _create_kernel(functions)
+    else:
+        log.debug('Re-using kernel of model {}'.format(model.name))
+
+    return _kernels[model_hash]
+
+
+class NumbaEngine(Engine):
+    """Engine compiling the model into a fused, multi-threaded annealing kernel with numba
+
+    Model helpers decorated with `cuda.jit` are compiled for the CPU. In contrast to the CUDA simulator, this runs
+    at native speed, which makes it suitable for debugging and CPU-only deployments.
+
+    Kernels are cached per model content hash for the lifetime of the process, so only the first run of a model pays
+    for the compilation.
+
+    Note:
+        Random numbers are drawn from numba's per-thread generators. `random_seed` therefore only makes runs
+        reproducible when numba is restricted to a single thread.
+
+    Args:
+        model: Model to be optimized
+        opt_conf: The `optimization` section of a configuration
+    """
+
+    def __init__(self, model: Model, opt_conf: Dict[str, Any]) -> None:
+        super().__init__(model, opt_conf)
+
+        self.functions: Dict[str, Callable]
+        self.kernel: Callable
+        self.functions, self.kernel = compile_numba_model(model)
+
+        if self.random_seed is not None:
+            _seed(int(self.random_seed))
+
+    def run(self, initial_states: Optional[np.ndarray] = None, start_step: int = 0,
+            progress: Optional[ProgressCallback] = None, progress_steps: int = 100,
+            cancelled: Optional[CancelledCallback] = None) -> Dict[str, np.ndarray]:
+        """Run the optimization
+
+        The kernel is compiled on the first run of a model, subsequent runs re-use the compiled kernel. If progress
+        is reported or the optimization may stop early, the kernel runs `progress_steps` steps at a time and reports
+        progress and checks whether to stop between these calls.
+
+        Args:
+            initial_states: Optional states to resume from, see :meth:`~engine.Engine.run`
+            start_step: Number of steps already performed by the resumed chains
+            progress: Optional progress callback, see :meth:`~engine.Engine.run`
+            progress_steps: Number of steps between calls of `progress` and checks whether to stop early
+            cancelled: Optional callback, returning `True` if the optimization should stop early
+
+        Returns:
+            Dictionary containing the best `values` and corresponding `states` of all chains
+        """
+        dimensions = self.model.dimensions
+        if initial_states is not None:
+            chains = np.arange(self.thread_count) % len(initial_states)
+            states = np.ascontiguousarray(np.asarray(initial_states, dtype=self.dtype)[chains])
+        else:
+            states = np.zeros((self.thread_count, dimensions), dtype=self.dtype)
+        best_states = np.empty((self.thread_count, dimensions), dtype=self.dtype)
+        best_values = np.full(self.thread_count, np.inf, dtype=self.dtype)
+        accepted = np.zeros(self.thread_count, dtype=np.int64)
+        normal = RandomDistribution(self.model.distribution) is RandomDistribution.Normal
+        cool = self.functions['cool']
+
+        chunked = progress is not None or cancelled is not None or self.target_value is not None
+        initialize_states = initial_states is None
+        temp = self._resumed_temp(cool, start_step)
+        step, end = start_step, start_step + self.max_steps
+        while step < end:
+            steps = min(progress_steps, end - step) if chunked else end - step
+            self.kernel(states, best_states, best_values, accepted, initialize_states, self.initial_temp, temp,
+                        self.min_temp, step, steps, normal)
+            initialize_states = False
+
+            for cooled_step in range(step, step + steps):
+                temp = cool(self.initial_temp, temp, cooled_step)
+            step += steps
+
+            if progress is not None:
+                progress(step, float(temp), float(best_values.min()), accepted.sum() / (steps * self.thread_count))
+                accepted[:] = 0
+            if temp < self.min_temp:
+                break
+            if self._should_stop(float(best_values.min()), cancelled):
+                log.debug('Stopped early after {} steps'.format(step))
+                break
+
+        return {'values': best_values, 'states': best_states}
+
+
+@numba.njit
+def _seed(seed):
+    np.random.seed(seed)
@@ -0,0 +1,143 @@
+import logging
+import numpy as np
+
+from typing import Dict, Any, Callable, Optional
+
+from . import compile_model
+from .engine import Engine, ProgressCallback, CancelledCallback
+from ..model import Model, RandomDistribution
+
+log = logging.getLogger(__name__)
+
+# Raised by model functions that cannot operate on arrays, e.g. when branching on a state value
+_vectorization_errors = (TypeError, ValueError)
+
+
+class NumpyEngine(Engine):
+    """Engine running all annealing chains in lockstep as rows of a numpy array
+
+    The model functions are written for a single chain. They are called with transposed views of the chain arrays,
+    so that `state[i]` refers to dimension `i` of all chains at once and arithmetic as well as `math` functions operate
+    element-wise. Functions that cannot be vectorized this way (e.g. functions branching on state values) fall back to
+    being called once per chain.
+
+    Args:
+        model: Model to be optimized
+        opt_conf: The `optimization` section of a configuration
+    """
+
+    def __init__(self, model: Model, opt_conf: Dict[str, Any]) -> None:
+        super().__init__(model, opt_conf)
+
+        self.vectorized_functions: Dict[str, Callable] = compile_model(model, vectorized=True)
+        self.functions: Dict[str, Callable] = compile_model(model)
+        self.vectorizable: Dict[str, bool] = {}
+        self.random_state = np.random.RandomState(self.random_seed)
+
+    def _randoms(self, dimensions: int) -> np.ndarray:
+        shape = (self.thread_count, dimensions)
+        if RandomDistribution(self.model.distribution) is RandomDistribution.Normal:
+            return self.random_state.standard_normal(shape).astype(self.dtype)
+        return self.random_state.random_sample(shape).astype(self.dtype)
+
+    def _call_per_chain(self, name: str, *args: Any) -> np.ndarray:
+        fun = self.functions[name]
+        per_chain_args = [arg if isinstance(arg, np.ndarray) else [arg] * self.thread_count for arg in args]
+        return np.asarray([fun(*chain_args) for chain_args in zip(*per_chain_args)])
+
+    def _call(self, name: str, *args: Any) -> np.ndarray:
+        """Calls a model function on all chains
+
+        Array arguments are passed transposed so that the model function sees one dimension of all chains per index,
+        scalar arguments are shared by all chains. On the first call of each function, the vectorized call is
+        verified and the arguments are restored if the function has to fall back to per-chain calls.
+        """
+        if name not in self.vectorizable:
+            backups = [np.copy(arg) if isinstance(arg, np.ndarray) else arg for arg in args]
+            try:
+                result = self._call_vectorized(name, *args)
+                if result is None or np.shape(result) == (self.thread_count, ):
+                    self.vectorizable[name] = True
+                    return result
+            except _vectorization_errors:
+                pass
+
+            log.debug('Function `{}` cannot be vectorized, falling back to per-chain calls'.format(name))
+            self.vectorizable[name] = False
+            for arg, backup in zip(args, backups):
+                if isinstance(arg, np.ndarray):
+                    np.copyto(arg, backup)
+        elif self.vectorizable[name]:
+            return self._call_vectorized(name, *args)
+
+        return self._call_per_chain(name, *args)
+
+    def _call_vectorized(self, name: str, *args: Any) -> Any:
+        return self.vectorized_functions[name](*[arg.T if isinstance(arg, np.ndarray) else arg for arg in args])
+
+    def _evaluate(self, states: np.ndarray) -> np.ndarray:
+        return np.asarray(self._call('evaluate', states), dtype=self.dtype)
+
+    def run(self, initial_states: Optional[np.ndarray] = None, start_step: int = 0,
+            progress: Optional[ProgressCallback] = None, progress_steps: int = 100,
+            cancelled: Optional[CancelledCallback] = None) -> Dict[str, np.ndarray]:
+        """Run the optimization
+
+        Args:
+            initial_states: Optional states to resume from, see :meth:`~engine.Engine.run`
+            start_step: Number of steps already performed by the resumed chains
+            progress: Optional progress callback, see :meth:`~engine.Engine.run`
+            progress_steps: Number of steps between calls of `progress` and checks whether to stop early
+            cancelled: Optional callback, returning `True` if the optimization should stop early
+
+        Returns:
+            Dictionary containing the best `values` and corresponding `states` of all chains
+        """
+        dimensions = self.model.dimensions
+        cool = self.functions['cool']
+
+        if initial_states is not None:
+            chains = np.arange(self.thread_count) % len(initial_states)
+            states = np.asarray(initial_states, dtype=self.dtype)[chains]
+        else:
+            states = np.zeros((self.thread_count, dimensions), dtype=self.dtype)
+            self._call('initialize', states, self._randoms(dimensions))
+        values = self._evaluate(states)
+
+        best_states = states.copy()
+        best_values = values.copy()
+        new_states = np.empty_like(states)
+
+        accepted_count = 0
+        temp = self._resumed_temp(cool, start_step)
+        for step in range(start_step, start_step + self.max_steps):
+            np.copyto(new_states, states)
+            self._call('generate_next', states, new_states, self._randoms(dimensions), step)
+            new_values = self._evaluate(new_states)
+
+            rnds = self.random_state.random_sample(self.thread_count).astype(self.dtype)
+            accepted = np.asarray(self._call('acceptance_func', values, new_values, temp, rnds), dtype=bool)
+
+            states[accepted] = new_states[accepted]
+            values[accepted] = new_values[accepted]
+            accepted_count += int(np.count_nonzero(accepted))
+
+            improved = values < best_values
+            best_states[improved] = states[improved]
+            best_values[improved] = values[improved]
+
+            temp = cool(self.initial_temp, temp, step)
+            if (step + 1 - start_step) % progress_steps == 0:
+                if progress is not None:
+                    progress(step + 1, float(temp), float(best_values.min()),
+                             accepted_count / (progress_steps * self.thread_count))
+                    accepted_count = 0
+                if self._should_stop(float(best_values.min()), cancelled):
+                    log.debug('Stopped early after {} steps'.format(step + 1))
+                    break
+
+            if temp < self.min_temp:
+                log.debug('Temperature fell below min_temp after {} steps'.format(step + 1))
+                break
+
+        return {'values': best_values, 'states': best_states}
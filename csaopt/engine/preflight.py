@@ -0,0 +1,126 @@
+"""
+This module provides a local pre-flight check of models, see :func:`preflight_model`. It requires numba.
+"""
+
+import logging
+import time
+import numpy as np
+
+from typing import Dict, Any, Optional
+
+from . import get_dtype
+from .numba_engine import NumbaEngine, compile_numba_model
+from ..model import Model, RandomDistribution
+
+log = logging.getLogger(__name__)
+
+
+class PreflightReport():
+    """Results of a pre-flight check, see :func:`preflight_model`
+
+    Args:
+        steps: Number of annealing steps that were requested
+        thread_count: Number of annealing chains
+
+    Attributes:
+        steps: Number of annealing steps that were requested
+        thread_count: Number of annealing chains
+        compile_times: Seconds taken by the first call of each model function, including its compilation
+        errors: Error messages by model function name, or `kernel` for errors of the fused annealing kernel
+        kernel_compile_time: Seconds taken to compile the kernel and run a single step, `None` if not compiled
+        step_time: Seconds per annealing step of all chains, `None` if the steps did not run
+        best_value: Best value found by the annealing steps, `None` if the steps did not run
+    """
+
+    def __init__(self, steps: int, thread_count: int) -> None:
+        self.steps: int = steps
+        self.thread_count: int = thread_count
+        self.compile_times: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.kernel_compile_time: Optional[float] = None
+        self.step_time: Optional[float] = None
+        self.best_value: Optional[float] = None
+
+    @property
+    def passed(self) -> bool:
+        return len(self.errors) == 0
+
+
+def _compile_functions(model: Model, opt_conf: Dict[str, Any], report: PreflightReport) -> None:
+    """Compiles each model function by calling it once with synthetic arguments, as the kernel would"""
+    functions, _ = compile_numba_model(model)
+
+    dtype = get_dtype(model)
+    random_state = np.random.RandomState(opt_conf.get('random_seed', None))
+    if RandomDistribution(model.distribution) is RandomDistribution.Normal:
+        randoms = random_state.standard_normal(model.dimensions).astype(dtype)
+    else:
+        randoms = random_state.random_sample(model.dimensions).astype(dtype)
+    state = np.zeros(model.dimensions, dtype=dtype)
+    new_state = np.zeros(model.dimensions, dtype=dtype)
+    value = dtype.type(0.0)
+    initial_temp = float(opt_conf['initial_temp'])
+
+    # `empty_state` is only called on the application master and not compiled by workers
+    calls = [
+        ('initialize', lambda: functions['initialize'](state, randoms)),
+        ('evaluate', lambda: functions['evaluate'](state)),
+        ('generate_next', lambda: functions['generate_next'](state, new_state, randoms, 0)),
+        ('acceptance_func', lambda: functions['acceptance_func'](value, value, initial_temp, 0.5)),
+        ('cool', lambda: functions['cool'](initial_temp, initial_temp, 0))
+    ]
+    for name, call in calls:
+        start = time.perf_counter()
+        try:
+            call()
+        except Exception as e:
+            log.debug('Function `{}` of model {} failed'.format(name, model.name), exc_info=True)
+            report.errors[name] = '{}: {}'.format(type(e).__name__, e)
+            continue
+        report.compile_times[name] = time.perf_counter() - start
+
+
+def preflight_model(model: Model, opt_conf: Dict[str, Any], steps: int = 100,
+                    thread_count: int = 64) -> PreflightReport:
+    """Compiles a model with numba for the CPU, as workers using the `numba` engine do, and runs a few steps
+
+    Each model function is compiled and called once with synthetic arguments first, so that compilation errors are
+    reported per function. If all functions compile, the fused annealing kernel (see
+    :class:`~engine.numba_engine.NumbaEngine`) is compiled and runs `steps` steps of `thread_count` chains to measure
+    the cost per step. This finds models that cannot be compiled before any instances are started.
+
+    Args:
+        model: Model to be checked
+        opt_conf: The `optimization` section of a configuration, requires `initial_temp`. `max_steps`, `thread_count`
+            and `target_value` are replaced for the check.
+        steps: Number of annealing steps to run
+        thread_count: Number of annealing chains
+
+    Returns:
+        The report of the check, which passed if it contains no errors
+    """
+    report = PreflightReport(steps, thread_count)
+    if 'initial_temp' not in opt_conf:
+        raise AssertionError('`initial_temp` parameter must be provided in optimization configuration')
+
+    _compile_functions(model, opt_conf, report)
+    if not report.passed:
+        return report
+
+    engine = NumbaEngine(model, dict(opt_conf, thread_count=thread_count, max_steps=1, target_value=None))
+    try:
+        start = time.perf_counter()
+        engine.run()
+        report.kernel_compile_time = time.perf_counter() - start
+
+        engine.max_steps = steps
+        start = time.perf_counter()
+        results = engine.run()
+        report.step_time = (time.perf_counter() - start) / steps
+    except Exception as e:
+        log.debug('Annealing kernel of model {} failed'.format(model.name), exc_info=True)
+        report.errors['kernel'] = '{}: {}'.format(type(e).__name__, e)
+        return report
+
+    report.best_value = float(results['values'].min())
+    return report
@@ -25,7 +25,7 @@ class Instance():
     """
 
     def __init__(self, inst_id: str, public_ip: str, port=-1, is_broker: bool = False,
-                 **kwargs: Dict[str, Any]) -> None:
+                 **kwargs: Any) -> None:
         self.public_ip = public_ip
         self.port: int = port
         self.inst_id: str = inst_id
@@ -0,0 +1,86 @@
+import logging
+
+from pyhocon import ConfigTree
+from typing import Tuple, List, Optional
+
+from .instancemanager import InstanceManager
+from . import Instance
+from ..broker import Broker
+from ..utils import random_str
+from ..worker.worker import OptimizationWorker, declare_actors
+
+log = logging.getLogger()
+
+
+class InMemory(InstanceManager[None, OptimizationWorker]):
+    """InstanceManager running workers inside the CSAOpt process, without Redis
+
+    Workers are instances of the reference worker (see :mod:`~csaopt.worker`), which receive messages through a
+    broker in memory mode (see :class:`~csaopt.broker.memory.MemoryBroker`). Since the broker is created after the
+    instances are started, workers are declared on it with :meth:`~InMemory.declare_workers`.
+
+    Args:
+        conf: Configuration of optimization run
+        internal_conf: Internal CSAOpt configuration
+    """
+
+    def __init__(self, conf: ConfigTree, internal_conf: ConfigTree) -> None:
+        self.run_id = run_id = random_str(8)
+
+        self.worker_count: int = conf.get('remote.memory.worker_count', internal_conf['remote.memory.worker_count'])
+        self.engine: str = conf.get('remote.memory.engine', internal_conf['remote.memory.engine'])
+
+        self.queue_ids: List[str] = ['CSAOpt-Worker-{}-{}'.format(run_id, n) for n in range(self.worker_count)]
+        self.workers: List[OptimizationWorker] = []
+        self.broker: Optional[Broker] = None
+
+    def _provision_instances(self, timeout_ms, count=2, **kwargs) -> Tuple[None, List[OptimizationWorker]]:
+        """Create workers
+
+        Args:
+            timeout_ms: Ignored, workers are available immediately
+            count: Number of workers
+            kwargs: Any other parameters are ignored
+        """
+        return None, [OptimizationWorker(self.engine) for _ in range(count)]
+
+    def declare_workers(self, broker: Broker) -> None:
+        """Declares the workers' actors on a broker in memory mode and subscribes them to control commands
+
+        Args:
+            broker: Broker created with `in_memory=True`
+        """
+        self.broker = broker
+        for queue_id, worker in zip(self.queue_ids, self.workers):
+            worker.broker = broker
+            declare_actors(broker, queue_id, worker)
+            broker.subscribe_control(worker.handle)
+
+    def get_running_instances(self) -> Tuple[Instance, List[Instance]]:
+        """Returns the currently managed instances
+
+        Returns:
+            A tuple of broker, [worker]. The broker instance is flagged with `in_memory`.
+        """
+        broker_instance = Instance('CSAOpt-Broker-' + self.run_id, '127.0.0.1', is_broker=True, in_memory=True)
+        worker_instances = [
+            Instance(queue_id, '127.0.0.1', queue_id=queue_id) for queue_id in self.queue_ids[:len(self.workers)]
+        ]
+
+        return broker_instance, worker_instances
+
+    def _terminate_instances(self, timeout_ms) -> None:
+        """Stop delivering messages to the workers"""
+        if self.broker is not None:
+            self.broker.dramatiq_broker.close()
+        self.workers = []
+
+    def _run_start_scripts(self, timeout_ms) -> None:
+        pass
+
+    def __enter__(self) -> InstanceManager:
+        _, self.workers = self._provision_instances(timeout_ms=0, count=self.worker_count)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._terminate_instances(timeout_ms=0)
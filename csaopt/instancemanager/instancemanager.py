@@ -1,13 +1,14 @@
 import abc
 
-from typing import List, Tuple, Any, TypeVar, Generic
+from typing import List, Tuple, Any, TypeVar, Generic, Optional
 
 from . import Instance
 
-T = TypeVar('T')
+BrokerT = TypeVar('BrokerT')
+WorkerT = TypeVar('WorkerT')
 
 
-class InstanceManager(abc.ABC, Generic[T]):
+class InstanceManager(abc.ABC, Generic[BrokerT, WorkerT]):
     """Abstract class for the instance management performed by CSAOpt.
 
     This class provides calls that are usually required for privisioning and configuration of instances running broker
@@ -15,13 +16,15 @@ class InstanceManager(abc.ABC, Generic[T]):
     here to make the developer think about what steps are usually required for a complete setup of cloud or docker
     instances. The public methods of this class are :meth:`~InstanceManager.get_running_instances` as well as it's
     context manager methods, `__enter__` and `__exit__`.
+
+    The type parameters are the types of the broker and worker instances handled by an instance manager.
     """
 
     def __init__(self):
         pass
 
     @abc.abstractmethod
-    def _provision_instances(self, timeout_ms, count=2, **kwargs) -> Tuple[T, List[T]]:
+    def _provision_instances(self, timeout_ms, count=2, **kwargs) -> Tuple[BrokerT, List[WorkerT]]:
         """Start and configure instances, return queue and list of workers"""
 
     @abc.abstractmethod
@@ -43,5 +46,5 @@ class InstanceManager(abc.ABC, Generic[T]):
         # However, Instancemanager cannot be referenced before the class has been evaluated.
 
     @abc.abstractmethod
-    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+    def __exit__(self, exc_type, exc_value, traceback) -> Optional[bool]:
         """Cleanup resources on exit"""
@@ -22,7 +22,7 @@ try:
     import docker
     DockerContainerT = Type[docker.models.containers.Container]
 
-    class Local(InstanceManager[DockerContainerT]):  # type: ignore
+    class Local(InstanceManager[DockerContainerT, DockerContainerT]):  # type: ignore
         def __init__(self, conf: ConfigTree, internal_conf: ConfigTree) -> None:
             if not docker_available():
                 raise AssertionError('Trying to instantiate Local InstanceManager, but docker-py is not available.')
@@ -53,8 +53,8 @@ try:
                 environment={'ALLOW_EMPTY_PASSWORD': 'yes'},
                 name=self.broker_container_name)
 
-            # Sleeping here to give Redis a chance to start up
-            time.sleep(3)
+            # Workers connect to the broker on startup, so Redis needs to accept connections first
+            self._wait_for_broker(timeout_ms)
 
             # Being on the same docker network means that it automagically
             # handles DNS and the broker container name is also its DNS name.
@@ -75,6 +75,13 @@ try:
 
             return self.broker, [self.worker]
 
+        def _wait_for_broker(self, timeout_ms) -> None:
+            deadline = time.time() + timeout_ms / 1000.0
+            while b'Ready to accept connections' not in self.broker.logs():
+                if time.time() > deadline:
+                    raise TimeoutError('Timed out waiting for broker container to accept connections')
+                time.sleep(0.1)
+
         def __refresh_containers(self) -> Tuple[DockerContainerT, DockerContainerT]:
             broker = self.docker_client.containers.get(self.broker_container_name)
             worker = self.docker_client.containers.get(self.worker_container_name)
@@ -120,7 +127,7 @@ try:
                 log.exception('An exception occured while starting docker containers')
                 raise SystemError('An exception occured while starting docker containers: {}'.format(repr(e)))
 
-        def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        def __exit__(self, exc_type, exc_value, traceback) -> None:
             try:
                 log.debug('Broker logs: \n' + self.broker.logs().decode('utf-8'))
                 log.debug('Worker logs: \n' + self.worker.logs().decode('utf-8'))
@@ -129,7 +136,6 @@ try:
                 log.warning('An exception occured while killing docker containers: ' + str(e))
             finally:
                 self.docker_network.remove()
-            return False
 
 except Exception:
     pass
@@ -0,0 +1,170 @@
+import logging
+import multiprocessing
+import multiprocessing.process
+import os
+import shutil
+import socket
+import subprocess
+import time
+
+from pyhocon import ConfigTree
+from typing import Tuple, List, Optional
+
+from .instancemanager import InstanceManager
+from . import Instance
+from ..utils import get_free_tcp_port, random_str
+from ..worker.worker import run_worker
+
+log = logging.getLogger()
+
+
+def _wait_for_port(host: str, port: int, timeout_ms: int) -> None:
+    deadline = time.time() + timeout_ms / 1000.0
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError('Timed out waiting for broker on {}:{}'.format(host, port))
+
+
+class LocalProcesses(InstanceManager[Optional[subprocess.Popen], multiprocessing.process.BaseProcess]):
+    """InstanceManager running workers as local processes, without docker
+
+    Each worker is a separate process running the reference worker (see :mod:`~csaopt.worker`) with its own queue id.
+    By default, one worker per core is started. If no broker is configured, a `redis-server` process is started on a
+    free port, which requires Redis to be installed locally.
+
+    Args:
+        conf: Configuration of optimization run
+        internal_conf: Internal CSAOpt configuration
+    """
+
+    def __init__(self, conf: ConfigTree, internal_conf: ConfigTree) -> None:
+        self.run_id = run_id = random_str(8)
+
+        self.worker_count: int = conf.get('remote.local.worker_count', os.cpu_count() or 1)
+        self.engine: str = conf.get('remote.local.engine', internal_conf['remote.local.engine'])
+        self.timeout_startup: int = conf.get('remote.local.timeout_startup',
+                                             internal_conf['remote.local.timeout_startup'])
+
+        self.broker_host: str = conf.get('remote.local.broker_host', '127.0.0.1')
+        self.broker_port: Optional[int] = conf.get('remote.local.broker_port', None)
+        # Not named broker_password, since the Runner prints that for re-using (cloud) instances
+        self.redis_password: Optional[str] = conf.get('remote.local.broker_password', None)
+        self.start_broker: bool = self.broker_port is None
+        self.compression: Optional[str] = conf.get('broker.compression.codec',
+                                                   internal_conf['broker.compression.codec'])
+        self.compression_level: Optional[int] = conf.get('broker.compression.level',
+                                                         internal_conf['broker.compression.level'])
+
+        self.queue_ids: List[str] = ['CSAOpt-Worker-{}-{}'.format(run_id, n) for n in range(self.worker_count)]
+        self.broker: Optional[subprocess.Popen] = None
+        self.workers: List[multiprocessing.process.BaseProcess] = []
+
+    def _start_broker(self, timeout_ms: int) -> subprocess.Popen:
+        redis_server = shutil.which('redis-server')
+        if redis_server is None:
+            raise AssertionError('No broker configured and redis-server could not be found on the PATH.')
+
+        self.broker_port = get_free_tcp_port()
+        # Stored right away, so the broker is terminated if it does not come up in time
+        self.broker = broker = subprocess.Popen(
+            [redis_server, '--bind', self.broker_host, '--port', str(self.broker_port), '--save', '',
+             '--appendonly', 'no'],
+            stdout=subprocess.DEVNULL)
+
+        _wait_for_port(self.broker_host, self.broker_port, timeout_ms)  # type: ignore
+        return broker
+
+    def _provision_instances(self, timeout_ms, count=2,
+                             **kwargs) -> Tuple[Optional[subprocess.Popen], List[multiprocessing.process.BaseProcess]]:
+        """Start broker (if required) and worker processes
+
+        Processes are tracked in `broker` and `workers` as soon as they are started, so that they are terminated by
+        :meth:`~LocalProcesses.__exit__` if starting a later process fails.
+
+        Args:
+            timeout_ms: Timeout for the broker to accept connections
+            count: Number of worker processes
+            kwargs: Any other parameters are ignored
+        """
+        broker = self._start_broker(timeout_ms) if self.start_broker else None
+
+        # Spawn instead of fork, so workers don't inherit the master's event loop and scheduler threads
+        ctx = multiprocessing.get_context('spawn')
+        workers: List[multiprocessing.process.BaseProcess] = []
+        self.workers = workers
+        for queue_id in self.queue_ids[:count]:
+            worker = ctx.Process(
+                target=run_worker,
+                name=queue_id,
+                kwargs={
+                    'queue_id': queue_id,
+                    'host': self.broker_host,
+                    'port': self.broker_port,
+                    'password': self.redis_password,
+                    'engine': self.engine,
+                    'compression': self.compression,
+                    'compression_level': self.compression_level
+                },
+                daemon=True)
+            worker.start()
+            workers.append(worker)
+
+        return broker, workers
+
+    def get_running_instances(self) -> Tuple[Instance, List[Instance]]:
+        """Returns the currently managed instances
+
+        Returns:
+            A tuple of broker, [worker]. Workers that exited are not included.
+        """
+        broker_instance = Instance(
+            'CSAOpt-Broker-' + self.run_id,
+            self.broker_host,
+            port=self.broker_port,
+            is_broker=True,
+            password=self.redis_password)
+        worker_instances = [
+            Instance(worker.name, '127.0.0.1', queue_id=worker.name, pid=worker.pid) for worker in self.workers
+            if worker.is_alive()
+        ]
+
+        return broker_instance, worker_instances
+
+    def _terminate_instances(self, timeout_ms) -> None:
+        """Terminate worker processes and the broker, if it was started by this instance manager"""
+        for worker in self.workers:
+            worker.terminate()
+
+        deadline = time.time() + timeout_ms / 1000.0
+        for worker in self.workers:
+            worker.join(max(0.0, deadline - time.time()))
+            if worker.is_alive():
+                log.warning('Worker {} did not stop in time, killing it'.format(worker.name))
+                worker.kill()
+
+        if self.broker is not None:
+            self.broker.terminate()
+            self.broker.wait(timeout_ms / 1000.0)
+
+    def _run_start_scripts(self, timeout_ms) -> None:
+        pass
+
+    def __enter__(self) -> InstanceManager:
+        try:
+            self.broker, self.workers = self._provision_instances(timeout_ms=self.timeout_startup,
+                                                                  count=self.worker_count)
+        except Exception:
+            # __exit__ is not called if entering fails, processes that were started are terminated here
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            self._terminate_instances(timeout_ms=5000)
+        except Exception as e:
+            log.warning('An exception occured while terminating local worker processes: ' + str(e))
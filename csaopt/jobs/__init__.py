@@ -1,13 +1,13 @@
 import uuid
-import os
 import numpy as np
 
 from enum import Enum
 from typing import Dict, List, Any, Tuple, Optional, Type
 
 from ..model import Model
+from .sweep import SweepPoint
 
-__all__ = ['jobmanager']
+__all__ = ['jobmanager', 'scheduler', 'sweep', 'aggregation', 'output']
 
 Failure = Optional[Tuple[Optional[Type[BaseException]], Optional[BaseException], str]]
 
@@ -23,24 +23,35 @@ class ExecutionType(Enum):
 
 
 class Job():
-    def __init__(self, model: Model, opt_params: Dict[str, Any]) -> None:
+    def __init__(self, model: Model, opt_params: Dict[str, Any], sweep_point: Optional[SweepPoint] = None) -> None:
         self.id = str(uuid.uuid4())
         self.message_id: str = ''
         self.queue_id: str = ''
         self.model: Model = model
-        self.results: List[np.array] = []
-        self.values: List[float] = []
+        self.results: np.ndarray = np.empty((0, 0))
+        self.values: np.ndarray = np.empty(0)
         self.completed: bool = False
+        self.cancelled: bool = False
         self.failure: Failure = None
         self.submitted_to: List[str] = []
         self.params: Dict[str, Any] = opt_params
+        self.sweep_point: Optional[SweepPoint] = sweep_point
+        self.steps_done: int = 0
+        self.resume: Optional[Dict[str, Any]] = None
+        self.progress: Optional[Dict[str, Any]] = None
+        self.stats: Optional[Dict[str, float]] = None
 
     def __repr__(self):
-        return 'Job[{}]: Model={}, Queues={}, Completed={}, Params={}'.format(
-            self.id, self.model.name, self.submitted_to, self.completed, self.params)
+        return 'Job[{}]: Model={}, Queues={}, Completed={}, Params={}, SweepPoint={}'.format(
+            self.id, self.model.name, self.submitted_to, self.completed, self.params, self.sweep_point)
 
     def to_dict(self):
-        return {'id': self.id, 'params': self.params, 'model': self.model.name}
+        job_dict = {'id': self.id, 'params': self.params, 'model': self.model.name}
+        if self.resume is not None:
+            job_dict['resume'] = self.resume
+        if self.progress is not None:
+            job_dict['progress'] = self.progress
+        return job_dict
 
     def get_best_results(self) -> Tuple[float, np.array]:
         values_arr = np.asarray(self.values)
@@ -48,24 +59,3 @@ class Job():
         val_min = values_arr[ind]
         best_res = self.results[ind]
         return val_min, best_res
-
-    def write_files(self, path: str, binary: bool = False, only_best: bool = False) -> None:
-        suffix: str = 'bin' if binary else 'txt'
-
-        if (os.path.isdir(path)):
-            if only_best:
-                best_val, best_state = self.get_best_results()
-                self._write_file('{}_values_{}.{}'.format(self.id, 'best', suffix), path, binary,
-                                 np.asarray([best_val]))
-                self._write_file('{}_states_{}.{}'.format(self.id, 'best', suffix), path, binary, best_state)
-            else:
-                for idx, result in enumerate(self.results):
-                    self._write_file('{}_values_{}.{}'.format(self.id, idx, suffix), path, binary,
-                                     np.asarray([self.values[idx]]))
-                    self._write_file('{}_states_{}.{}'.format(self.id, idx, suffix), path, binary, self.results[idx])
-        else:
-            raise AttributeError('Cannot write to {}: not a directory.'.format(path))
-
-    def _write_file(self, name: str, path: str, binary: bool, arr: np.array) -> None:
-        output_file = os.path.join(path, name)
-        arr.tofile(output_file, sep=('' if binary else ','))
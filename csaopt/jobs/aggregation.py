@@ -0,0 +1,106 @@
+import heapq
+import itertools
+import math
+import numpy as np
+
+from typing import Dict, List, Tuple, Optional
+
+from . import Job
+
+JobStats = Dict[str, float]
+
+
+class TopKAggregator():
+    """Keeps the best `k` results across all jobs as they arrive
+
+    Results are added job by job, e.g. whenever a worker returns a result. Only the `k` best values and their states
+    are kept, in a bounded max-heap, so that memory does not grow with the number of jobs, chains or results. States
+    are copied, i.e. the kept rows do not keep the (possibly much larger) received result buffers alive.
+
+    Args:
+        k: Number of results to keep
+    """
+
+    def __init__(self, k: int) -> None:
+        if k < 1:
+            raise AssertionError('k needs to be at least 1, but is {}'.format(k))
+
+        self.k = k
+        # Entries are (-value, sequence, job, state), so the worst kept result is on top of the heap. The sequence
+        # breaks ties, since neither jobs nor arrays are comparable.
+        self._heap: List[Tuple[float, int, Job, np.ndarray]] = []
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def add(self, job: Job, values: np.ndarray, states: np.ndarray) -> None:
+        """Adds the results of a job
+
+        Args:
+            job: Job the results belong to
+            values: Values of all chains
+            states: States of all chains, one row per chain
+        """
+        values = np.asarray(values)
+        candidates = np.argpartition(values, self.k - 1)[:self.k] if len(values) > self.k else range(len(values))
+        for idx in candidates:
+            value = float(values[idx])
+            if len(self._heap) < self.k:
+                heapq.heappush(self._heap, (-value, next(self._sequence), job, np.array(states[idx])))
+            elif value < -self._heap[0][0]:
+                heapq.heapreplace(self._heap, (-value, next(self._sequence), job, np.array(states[idx])))
+
+    def results(self) -> List[Tuple[float, np.ndarray, Job]]:
+        """Get the kept results
+
+        Returns:
+            A list of tuples of value, state and job, ordered from best to worst
+        """
+        entries = sorted(self._heap, key=lambda entry: (-entry[0], entry[1]))
+        return [(-neg_value, state, job) for neg_value, _, job, state in entries]
+
+
+def summarize_values(values: np.ndarray) -> JobStats:
+    """Computes summary statistics of the values of a job
+
+    Args:
+        values: Values of all chains
+
+    Returns:
+        Dictionary containing `count`, `min`, `max`, `mean` and `std`
+    """
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        'count': len(values),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'mean': float(values.mean()),
+        'std': float(values.std())
+    }
+
+
+def merge_stats(stats: Optional[JobStats], other: JobStats) -> JobStats:
+    """Merges the summary statistics of two sets of values, e.g. the results of several workers for the same job
+
+    Args:
+        stats: Statistics computed so far, or `None`
+        other: Statistics of further values, see :func:`summarize_values`
+
+    Returns:
+        The statistics of the combined values
+    """
+    if stats is None:
+        return dict(other)
+
+    count = stats['count'] + other['count']
+    delta = other['mean'] - stats['mean']
+    squares = stats['std']**2 * stats['count'] + other['std']**2 * other['count'] + \
+        delta**2 * stats['count'] * other['count'] / count
+    return {
+        'count': count,
+        'min': min(stats['min'], other['min']),
+        'max': max(stats['max'], other['max']),
+        'mean': stats['mean'] + delta * other['count'] / count,
+        'std': math.sqrt(squares / count)
+    }
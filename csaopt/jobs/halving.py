@@ -0,0 +1,110 @@
+import logging
+import numpy as np
+
+from typing import Dict, List, Optional
+
+from . import Job
+from .sweep import apply_sweep_point
+from ..broker import pack_results, unpack_results
+
+log = logging.getLogger(__name__)
+
+
+class SuccessiveHalving():
+    """Allocates the step budget of a set of candidate jobs by successive halving
+
+    All candidates first run for `initial_steps` steps. After each round, the best `keep_fraction` of the candidates
+    (ranked by their best value) are resumed from the states they returned, with `growth` times the steps of the
+    previous round. The others keep the results of their last round. Once a single candidate is left, it runs the
+    rest of its budget in one round.
+
+    The budget of each candidate is the `max_steps` value of its configuration, i.e. no candidate runs for more steps
+    than it would without successive halving. Resumed chains start from the best states of the previous round and
+    continue the cooling schedule where it stopped, instead of restarting at `initial_temp`.
+
+    Args:
+        initial_steps: Steps of the first round
+        keep_fraction: Fraction of candidates that advance to the next round, at least one candidate is kept
+        growth: Factor by which the steps grow from round to round
+    """
+
+    def __init__(self, initial_steps: int, keep_fraction: float = 0.5, growth: float = 2.0) -> None:
+        if initial_steps < 1:
+            raise AssertionError('initial_steps needs to be at least 1, but is {}'.format(initial_steps))
+        if not 0.0 < keep_fraction < 1.0:
+            raise AssertionError('keep_fraction needs to be between 0 and 1, but is {}'.format(keep_fraction))
+        if growth < 1.0:
+            raise AssertionError('growth needs to be at least 1, but is {}'.format(growth))
+
+        self.initial_steps = initial_steps
+        self.keep_fraction = keep_fraction
+        self.growth = growth
+        self.round = 0
+        self.candidates: List[Job] = []
+        self.budgets: Dict[str, int] = {}
+        self.round_steps: Dict[str, int] = {}
+
+    def start(self, jobs: List[Job]) -> List[Job]:
+        """Prepares the first round
+
+        Args:
+            jobs: Candidate jobs, their configurations need to contain `optimization.max_steps`
+
+        Returns:
+            The jobs, limited to the steps of the first round
+        """
+        self.round = 0
+        self.candidates = list(jobs)
+        for job in jobs:
+            self.budgets[job.id] = int(job.params['optimization']['max_steps'])
+            self._assign(job, self.initial_steps)
+
+        return self.candidates
+
+    def next_round(self) -> List[Job]:
+        """Selects the candidates of the next round, once all jobs of the current round completed
+
+        Returns:
+            The jobs to run in the next round, resuming from their previous results. Empty if all budgets are spent.
+        """
+        ranked: List[Job] = []
+        for job in self.candidates:
+            job_steps = self.round_steps.pop(job.id, 0)
+            if job.completed:
+                job.steps_done += job_steps
+                ranked.append(job)
+            elif job.resume is not None:
+                # Failed candidates drop out, but keep the results of the last round they completed
+                job.values, job.results = unpack_results(job.resume)
+                job.completed = True
+
+        ranked.sort(key=lambda job: job.get_best_results()[0])
+        if len(ranked) < len(self.candidates):
+            log.warning('{} candidates failed in round {}'.format(len(self.candidates) - len(ranked), self.round))
+
+        keep = max(1, int(len(ranked) * self.keep_fraction))
+        survivors = [job for job in ranked[:keep] if job.steps_done < self.budgets[job.id]]
+        if len(survivors) == 0:
+            return []
+
+        self.round += 1
+        steps: Optional[int] = None if len(survivors) == 1 else int(self.initial_steps * self.growth**self.round)
+        for job in survivors:
+            self._assign(job, steps)
+
+        log.debug('Successive halving round {}: {} of {} candidates advance'.format(
+            self.round, len(survivors), len(self.candidates)))
+        self.candidates = survivors
+        return survivors
+
+    def _assign(self, job: Job, steps: Optional[int]) -> None:
+        remaining = self.budgets[job.id] - job.steps_done
+        steps = remaining if steps is None else min(steps, remaining)
+
+        if job.completed:
+            job.resume = dict(start_step=job.steps_done, **pack_results(job.values, job.results, job.results.dtype))
+            job.values, job.results = np.empty(0), np.empty((0, 0))
+            job.completed = False
+
+        job.params = apply_sweep_point(job.params, {'max_steps': steps})
+        self.round_steps[job.id] = steps
@@ -1,15 +1,20 @@
 import asyncio
 import logging
+import math
 import numpy as np
 
-from typing import List, Dict, Tuple, Any
+from dramatiq import Message
+from typing import List, Dict, Tuple, Any, Optional, Callable, AsyncIterator
 from pyhocon import ConfigTree
 
 from . import Job, ExecutionType
+from .scheduler import JobScheduler
+from .sweep import SweepPoint, expand_sweep, apply_sweep_point
+from .halving import SuccessiveHalving
+from .aggregation import TopKAggregator, summarize_values, merge_stats
+from .output import StreamingResultWriter
 from ..model import Model
-from ..broker import Broker, WorkerCommand
-
-# TODO: this (or somebody else) needs to check for n Models == n Workers in several cases
+from ..broker import Broker, WorkerCommand, unpack_results, parse_result_return
 
 log = logging.getLogger(__name__)
 
@@ -30,41 +35,123 @@ class JobManager():
         self.configs = configs
         self.execution_type: ExecutionType = self._get_execution_type(models, configs)
         self.jobs: List[Job] = []
-        self.worker_join_retry_delay = ctx.internal_config['broker.worker_join_retry_delay']
-        self.worker_join_retry_count = ctx.internal_config['broker.worker_join_retry_count']
+        self.worker_join_timeout: float = ctx.internal_config['broker.worker_join_timeout']
+        self.worker_join_grace_period: float = ctx.internal_config['broker.worker_join_grace_period']
+        self.worker_join_quorum: float = ctx.internal_config['broker.worker_join_quorum']
+        self.model_cache: bool = ctx.internal_config['broker.model_cache']
+        self.max_in_flight: int = ctx.internal_config['jobs.max_in_flight']
+        self.scheduler: Optional[JobScheduler] = None
+        self.broadcast_messages: List[Message] = []
+        self.cancelled = False
+        self.model_cache_ttl: int = ctx.internal_config['broker.model_cache_ttl']
+        if isinstance(configs[0], dict):
+            self.worker_join_quorum = configs[0].get('broker.worker_join_quorum', self.worker_join_quorum)
+            self.model_cache = configs[0].get('broker.model_cache', self.model_cache)
+            self.max_in_flight = configs[0].get('jobs.max_in_flight', self.max_in_flight)
+        self.sweep_points: List[SweepPoint] = []
+        if isinstance(configs[0], dict) and configs[0].get('sweep', None) is not None:
+            if self.execution_type is not ExecutionType.SingleModelSingleConf:
+                raise AssertionError('Parameter sweeps require a single model and a single configuration')
+            self.sweep_points = expand_sweep(configs[0]['sweep'])
+            log.debug('Expanded sweep into {} parameter points'.format(len(self.sweep_points)))
+        self.halving: Optional[SuccessiveHalving] = None
+        if isinstance(configs[0], dict) and configs[0].get('halving', None) is not None:
+            if self.execution_type is ExecutionType.SingleModelSingleConf and len(self.sweep_points) == 0:
+                raise AssertionError('Successive halving requires several candidates, i.e. configurations, models or '
+                                     'a sweep')
+            halving_conf = configs[0]['halving']
+            self.halving = SuccessiveHalving(
+                halving_conf['initial_steps'],
+                keep_fraction=halving_conf.get('keep_fraction', ctx.internal_config['jobs.halving.keep_fraction']),
+                growth=halving_conf.get('growth', ctx.internal_config['jobs.halving.growth']))
+        progress_conf = configs[0].get('progress', None) if isinstance(configs[0], dict) else None
+        self.progress_enabled: bool = ctx.internal_config['jobs.progress.enabled']
+        self.progress_settings: Dict[str, Any] = {
+            key: ctx.internal_config['jobs.progress.' + key] for key in ('interval', 'steps', 'buffer_size')
+        }
+        if progress_conf is not None:
+            self.progress_enabled = progress_conf.get('enabled', True)
+            self.progress_settings.update({key: progress_conf[key] for key in self.progress_settings
+                                           if key in progress_conf})
+        results_conf = configs[0].get('results', None) if isinstance(configs[0], dict) else None
+        results_conf = results_conf if results_conf is not None else {}
+        aggregation = results_conf.get('aggregation', ctx.internal_config['jobs.results.aggregation'])
+        self.job_stats: bool = results_conf.get('job_stats', ctx.internal_config['jobs.results.job_stats'])
+        # Workers read `results.return` from the job params, it is validated here to fail before submitting jobs
+        self.result_count: Optional[int] = parse_result_return(results_conf.get('return', None))
+        self.aggregator: Optional[TopKAggregator] = None
+        if aggregation == 'top_k':
+            if self.halving is not None:
+                raise AssertionError('Top-k aggregation cannot be combined with successive halving, which resumes '
+                                     'jobs from all their states')
+            self.aggregator = TopKAggregator(results_conf.get('top_k', ctx.internal_config['jobs.results.top_k']))
+        elif aggregation != 'all':
+            raise AssertionError('Result aggregation needs to be all or top_k, but is {}'.format(aggregation))
+        # Persists results as they arrive if set, see :class:`~output.StreamingResultWriter`
+        self.result_writer: Optional[StreamingResultWriter] = None
         if self.broker is not None:
             self.queue_models_deployed: Dict[str, bool] = {queue_id: False for queue_id in self.broker.queue_ids}
 
-    async def wait_for_worker_join(self, retry_count=0) -> List[str]:
-        """Send ping to each worker and wait for response.
+    async def wait_for_worker_join(self, on_join: Optional[Callable[[str], None]] = None) -> List[str]:
+        """Send ping to each worker and wait for responses.
+
+        All queues are pinged at once and each worker is tracked individually, so workers that joined are never
+        pinged again and the overall waiting time is bounded by the slowest worker instead of the sum of all workers.
+        Since ping messages stay on the queue until the worker consumes them, workers that are still starting up
+        will respond as soon as they are ready.
 
-        Workers are expected to join immediately as the jobmanager will be called only after the
-        instances are initialized. To be somewhat relaxed regarding the startup of instances,
-        the ping operation will be retried once after a retry delay specified in the internal configuration.
+        The run may proceed once a quorum of workers joined, since jobs are distributed across whichever workers are
+        available. Remaining workers get a grace period, after which their queues are dropped.
 
         Args:
-            is_retry: Indicate if call is a retry (i.e. this method calls itself recursively when retrying)
+            on_join: Optional callback, called with the queue id of each worker as it joins
 
         Returns:
             A list of worker IDs of the joined workers
-        """
-        joined_workers = []
-        for queue_id in self.broker.queue_ids:
-            try:
-                if self.broker.ping(queue_id) is True:
-                    joined_workers.append(queue_id)
-                else:
-                    raise AssertionError('Worker {} failed to join'.format(queue_id))
-            except Exception as e:
-                if retry_count >= self.worker_join_retry_count:
-                    log.exception('Exception occurred while waiting for workers to join')
-                    raise e
 
-                log.debug('Retrying to contact broker in order to ping workers')
-                await asyncio.sleep(self.worker_join_retry_delay)
-                await self.wait_for_worker_join(retry_count + 1)
+        Raises:
+            AssertionError if not enough workers joined within the timeout
+        """
+        queue_ids = list(self.broker.queue_ids)
+        required = max(1, math.ceil(self.worker_join_quorum * len(queue_ids)))
+
+        pings: Dict[str, Message] = {}
+        for queue_id in queue_ids:
+            msg = self.broker.send_ping(queue_id)
+            pings[msg.message_id] = msg
+
+        joined_workers: List[str] = []
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.worker_join_timeout
+        while len(pings) > 0 and loop.time() < deadline:
+            completed = await self.broker.wait_for_any_result(list(pings.values()), deadline - loop.time())
+            if completed is None:
+                continue
+
+            msg, result = completed
+            pings.pop(msg.message_id)
+            if result != 'pong':
+                log.warning('Worker on queue {} responded to ping with {}'.format(msg.queue_name, result))
+                continue
+
+            joined_workers.append(msg.queue_name)
+            if on_join is not None:
+                on_join(msg.queue_name)
+
+            if len(joined_workers) == required and len(pings) > 0:
+                log.debug('Quorum of {} workers reached, waiting {} seconds for remaining workers'.format(
+                    required, self.worker_join_grace_period))
+                deadline = min(deadline, loop.time() + self.worker_join_grace_period)
+
+        if len(joined_workers) < required:
+            raise AssertionError('Only {} of {} required workers joined'.format(len(joined_workers), required))
+
+        for queue_id in queue_ids:
+            if queue_id not in joined_workers:
+                log.warning('Worker {} failed to join, removing its queue'.format(queue_id))
+                self.broker.remove_queue(queue_id)
+                self.queue_models_deployed.pop(queue_id, None)
 
-        self.broker.clear_queue_messages()
         return joined_workers
 
     # TODO: Fix type links in comments
@@ -108,24 +195,36 @@ class JobManager():
         This method will deploy models depending on the execution type (i.e. the configuration).
         - If the execution type is `SingleModelSingleConf` or `SingleModelMultiConf`, the model is broadcast to all
           workers
-        - Otherwise, each worker will receive the deployment information for one model in the same order they were
-          passed to CSAOpt.
+        - Otherwise, all models are deployed to all workers, since jobs are scheduled on whichever worker is free, see
+          :class:`~scheduler.JobScheduler`.
+
+        If the model cache is enabled (`broker.model_cache`), models are stored on the broker once and workers only
+        receive the content hash. Workers that already deployed a model with the same hash re-use it.
+
+        Raises:
+            AssertionError: If several models have the same name, since workers keep deployed models by name
         """
+        model_names = [model.name for model in self.models]
+        if len(set(model_names)) != len(model_names):
+            raise AssertionError('Model names must be unique, got {}'.format(model_names))
+
         if self.execution_type is ExecutionType.SingleModelSingleConf or \
            self.execution_type is ExecutionType.SingleModelMultiConf:
-            self.broker.broadcast(WorkerCommand.DeployModel, self.models[0].to_dict())
+            self.broker.broadcast(*self._deployment(self.models[0]))
         else:
-            for n, queue_id in enumerate(self.broker.queue_ids):
-                log.debug('Deploying model to queue {} with id {}'.format(n, queue_id))
-                self.broker.send_to_queue(queue_id, WorkerCommand.DeployModel, self.models[n].to_dict())
+            deployments = [self._deployment(model) for model in self.models]
+            self.broker.send_to_queues([(queue_id, ) + deployment for deployment in deployments
+                                        for queue_id in self.broker.queue_ids])
 
         all_results = await self.broker.get_all_results(timeout=10)
         for queue_id, results in all_results.items():
+            self.queue_models_deployed[queue_id] = True
             for message in results:
-                if message == 'model_deployed':
-                    self.queue_models_deployed[queue_id] = True
+                if message == 'model_deployed' or message == 'model_cached':
+                    log.debug('Worker on queue {} reported {}'.format(queue_id, message))
                 else:
                     log.warning('Worker on Queue %s didn\'t successfully deploy model: "%s"', queue_id, message)
+                    self.queue_models_deployed[queue_id] = False
 
         assert not any((not model_deployed for queue_id, model_deployed in self.queue_models_deployed.items())), \
             'Not all queues reported a deployed model'
@@ -135,68 +234,230 @@ class JobManager():
         self.models_deployed = True
         self.broker.clear_queue_messages()
 
+    def _deployment(self, model: Model) -> Tuple[WorkerCommand, Dict[str, Any]]:
+        """Returns the deployment command and payload for a model, storing the model on the broker if required"""
+        if not self.model_cache:
+            return WorkerCommand.DeployModel, model.to_dict()
+
+        model_hash = model.content_hash()
+        if self.broker.store_model(model_hash, model.to_dict(), ttl=self.model_cache_ttl):
+            log.debug('Stored model {} on broker with hash {}'.format(model.name, model_hash))
+        return WorkerCommand.DeployCachedModel, {'name': model.name, 'hash': model_hash}
+
     async def submit(self) -> List[Job]:
+        """Submit optimization jobs to workers.
+
+        Jobs are created depending on the execution type:
+        - If the configuration contains a `sweep` section, there is one job per parameter point, tagged with the point
+          as `Job.sweep_point`, see :func:`~sweep.expand_sweep`
+        - If the execution type is `SingleModelSingleConf`, one job is broadcast to all workers
+        - Otherwise, there is one job per configuration and/or model. Jobs are scheduled on the workers as they
+          become free, so there can be more jobs than workers, see :class:`~scheduler.JobScheduler`. The
+          in-flight depth per worker is configured by `jobs.max_in_flight`.
+
+        If progress updates are enabled (`progress.enabled`), workers publish the progress of the jobs, see
+        :meth:`~JobManager.progress`.
+
+        If the configuration contains `results.return` (`best` or `top_k=N`), workers only send back the best results
+        of each job, see :func:`~csaopt.broker.parse_result_return`.
+
+        If the configuration contains a `halving` section, the scheduled jobs are candidates for successive halving,
+        see :class:`~halving.SuccessiveHalving`. Further rounds are submitted by :meth:`~JobManager.wait_for_results`.
+
+        Returns:
+            The submitted jobs
+        """
         if not self.models_deployed:
             raise AssertionError('Trying to submit job without deploying model')
 
-        cmd = WorkerCommand.RunOptimization
-
-        if self.execution_type is ExecutionType.SingleModelSingleConf:
+        if len(self.sweep_points) > 0:
+            jobs = [Job(self.models[0], apply_sweep_point(self.configs[0], point), sweep_point=point)
+                    for point in self.sweep_points]
+        elif self.execution_type is ExecutionType.SingleModelSingleConf:
             job = Job(self.models[0], self.configs[0])
-            self.broker.broadcast(cmd, job.to_dict())
+            job.progress = self._job_progress()
+            self.broadcast_messages = self.broker.broadcast(WorkerCommand.RunOptimization, job.to_dict())
             job.submitted_to.extend(self.broker.queue_ids)
             self.jobs.append(job)
+            return self.jobs
         elif self.execution_type is ExecutionType.SingleModelMultiConf:
-            for n, queue_id in enumerate(self.broker.queue_ids):
-                job = Job(self.models[0], self.configs[n])
-                self.broker.send_to_queue(queue_id, cmd, job.to_dict())
-                job.submitted_to = [queue_id]
-                self.jobs.append(job)
+            jobs = [Job(self.models[0], config) for config in self.configs]
         elif self.execution_type is ExecutionType.MultiModelSingleConf:
-            for n, queue_id in enumerate(self.broker.queue_ids):
-                job = Job(self.models[n], self.configs[0])
-                self.broker.send_to_queue(queue_id, cmd, job.to_dict())
-                job.submitted_to = [queue_id]
-                self.jobs.append(job)
-        elif self.execution_type is ExecutionType.MultiModelMultiConf:
-            for n, queue_id in enumerate(self.broker.queue_ids):
-                job = Job(self.models[n], self.configs[n])
-                self.broker.send_to_queue(queue_id, cmd, job.to_dict())
-                job.submitted_to = [queue_id]
-                self.jobs.append(job)
+            jobs = [Job(model, self.configs[0]) for model in self.models]
+        else:
+            jobs = [Job(model, config) for model, config in zip(self.models, self.configs)]
+
+        for job in jobs:
+            job.progress = self._job_progress()
+        self.jobs.extend(jobs)
+        if self.halving is not None:
+            jobs = self.halving.start(jobs)
+
+        self.scheduler = JobScheduler(self.broker, self.max_in_flight)
+        self.scheduler.submit(jobs)
 
         return self.jobs
 
-    async def wait_for_results(self) -> None:
+    def _job_progress(self) -> Optional[Dict[str, Any]]:
+        if not self.progress_enabled:
+            return None
+        return {'interval': self.progress_settings['interval'], 'steps': self.progress_settings['steps']}
+
+    async def progress(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yields the progress updates of the submitted jobs as they arrive
+
+        Updates are published by workers if progress is enabled, see
+        :meth:`~csaopt.worker.worker.OptimizationWorker.run_optimization`. At most `progress.buffer_size` updates are
+        buffered. If the consumer falls behind, the oldest updates are dropped. Iterating ends the subscription when
+        the iteration is cancelled or closed.
+
+        Returns:
+            Asynchronous iterator of progress updates
         """
+        loop = asyncio.get_event_loop()
+        updates: asyncio.Queue = asyncio.Queue(maxsize=self.progress_settings['buffer_size'])
 
+        def buffer(update: Dict[str, Any]) -> None:
+            if updates.full():
+                updates.get_nowait()
+            updates.put_nowait(update)
+
+        def receive(update: Dict[str, Any]) -> None:
+            # Called from the broker's subscriber thread, the queue is only accessed on the event loop
+            loop.call_soon_threadsafe(buffer, update)
+
+        unsubscribe = self.broker.subscribe_progress(receive)
+        try:
+            while True:
+                update = await updates.get()
+                if any(job.id == update.get('job_id') for job in self.jobs):
+                    yield update
+        finally:
+            unsubscribe()
+
+    async def wait_for_results(self, result_timeout: float = 150.0) -> None:
+        """Wait for the results of all submitted jobs
+
+        Scheduled jobs are dispatched to workers while waiting, as previous jobs complete. With successive halving,
+        this returns after the last round.
+
+        If a job reaches the target value of its configuration (`optimization.target_value`), all other jobs are
+        cancelled, see :meth:`~JobManager.cancel`. Results of cancelled jobs are collected as well.
+
+        If `JobManager.result_writer` is set, results are written to disk as they arrive.
+
+        With top-k aggregation (`results.aggregation = top_k`), results are merged into the global top-k as they
+        arrive and jobs only keep their best result, see :meth:`~JobManager.top_results`. With `results.job_stats`,
+        the summary statistics of the values of each job are kept in `Job.stats`.
+
+        Args:
+            result_timeout: Timeout in seconds. For scheduled jobs, this is the maximum time between two results.
+
+        Raises:
+            TimeoutError if results did not arrive in time
         """
         if not self.models_deployed:
             raise AssertionError('wait_for_results called but no models are deployed')
         if len(self.jobs) == 0:
             raise AssertionError('wait_for_results called but no jobs submitted')
 
-        results = await self.broker.get_all_results(timeout=150.0)
-        log.debug('Received results: {}'.format(results))
-        for job in self.jobs:
-            for queue_id in job.submitted_to:
-                for message in results[queue_id]:
-                    log.debug('Processing message on queue {}, result={}'.format(queue_id, message))
-                    if message.get('failure') is not None:
-                        job.failure = message.get('failure')
-                    else:
-                        job.values = message['values']
-                        job.results = message['states']
+        if self.scheduler is not None:
+            while not self.scheduler.done:
+                completed = await self.scheduler.next_completed(result_timeout)
+                if completed is None:
+                    raise TimeoutError('Timed out while waiting for results')
+                job, result = completed
+                log.debug('Processing result of job {} on queue {}'.format(job.id, job.queue_id))
+                self._process_result(job, result)
+
+                if self.scheduler.done and self.halving is not None and not self.cancelled:
+                    self.scheduler.submit(self.halving.next_round())
+            self.broker.clear_queue_messages()
+            return
+
+        # A broadcast job, its results are collected from all workers
+        job = self.jobs[0]
+        pending = {msg.message_id: msg for msg in self.broadcast_messages}
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + result_timeout
+        while len(pending) > 0:
+            received = await self.broker.wait_for_any_result(list(pending.values()), deadline - loop.time())
+            if received is None:
+                raise TimeoutError('Timed out while waiting for results')
+            msg, result = received
+            pending.pop(msg.message_id)
+            log.debug('Processing result of job {} on queue {}'.format(job.id, msg.queue_name))
+            self._process_result(job, result)
+        self.broker.clear_queue_messages()
+
+    def cancel(self) -> None:
+        """Cancels all submitted jobs
+
+        Jobs that have not been dispatched are dropped. Workers stop running jobs early and return the best results
+        found so far, which are collected by :meth:`~JobManager.wait_for_results` as usual and flagged as
+        `Job.cancelled`.
+        """
+        if self.cancelled:
+            return
+        self.cancelled = True
+
+        if self.scheduler is not None:
+            dropped = self.scheduler.cancel_pending()
+            for job in dropped:
+                job.cancelled = True
+            log.debug('Dropped {} pending jobs'.format(len(dropped)))
+
+        # Broadcast jobs complete with the first result, while other workers may still be running them
+        job_ids = [job.id for job in self.jobs if self.scheduler is None or not job.completed]
+        self.broker.send_control(WorkerCommand.Cancel, {'job_ids': job_ids})
+
+    def _process_result(self, job: Job, result: Dict[str, Any]) -> None:
+        if result.get('cancelled', False):
+            job.cancelled = True
+        if result.get('failure') is not None:
+            job.failure = result.get('failure')
+            return
+        if 'values' not in result:
+            # The job was cancelled before it started
+            return
+
+        values, states = unpack_results(result)
+        if self.result_writer is not None:
+            # Resumed jobs of successive halving replace the results of their previous round
+            self.result_writer.add(job, values, states, replace=job.resume is not None)
+        if self.job_stats and len(values) > 0:
+            job.stats = merge_stats(job.stats, summarize_values(values))
+        if self.aggregator is not None:
+            self.aggregator.add(job, values, states)
+
+        if len(job.values) > 0:
+            # Jobs broadcast to several workers collect the results of all workers
+            values = np.concatenate((job.values, values))
+            states = np.concatenate((job.results, states))
+        if self.aggregator is not None and len(values) > 0:
+            # Only the best result of each job is kept, e.g. for sweep summaries
+            best = int(np.argmin(values))
+            values, states = values[best:best + 1].copy(), states[best:best + 1].copy()
+        job.values, job.results = values, states
+        job.completed = True
+
+        target_value = job.params.get('optimization', {}).get('target_value', None)
+        if target_value is not None and len(values) > 0 and values.min() <= target_value and not self.cancelled:
+            log.info('Job {} reached the target value {}, cancelling all jobs'.format(job.id, target_value))
+            self.cancel()
 
     def scan_for_best_result(self, jobs: List[Job]) -> Tuple[Job, float, np.array]:
         """Get best performing job and it's results from a list of jobs
 
+        Jobs without results, e.g. failed jobs or jobs cancelled before they started, are skipped.
+
         Args:
             jobs: List of jobs to process
 
         Returns:
             A tuple of job, result and state at which the result was evaluated
         """
+        jobs = [job for job in jobs if job.completed]
         if len(jobs) < 1:
             raise AssertionError('Cannot scan for best result on empty jobs list')
 
@@ -212,3 +473,29 @@ class JobManager():
                 best_job = job
 
         return best_job, best_value, best_state
+
+    def summarize_sweep(self, jobs: List[Job]) -> List[Tuple[SweepPoint, float]]:
+        """Get the best value of each parameter point of a sweep
+
+        Args:
+            jobs: List of jobs to process, jobs without parameter point or results are ignored
+
+        Returns:
+            A list of tuples of parameter point and best value, ordered from best to worst
+        """
+        summary = [(job.sweep_point, job.get_best_results()[0]) for job in jobs
+                   if job.sweep_point is not None and job.completed]
+        return sorted(summary, key=lambda entry: entry[1])
+
+    def top_results(self) -> List[Tuple[float, np.ndarray, Job]]:
+        """Get the best results across all jobs, kept by top-k aggregation (`results.aggregation = top_k`)
+
+        Returns:
+            A list of at most `results.top_k` tuples of value, state and job, ordered from best to worst
+
+        Raises:
+            AssertionError if top-k aggregation is disabled
+        """
+        if self.aggregator is None:
+            raise AssertionError('Top results are only kept with top-k aggregation')
+        return self.aggregator.results()
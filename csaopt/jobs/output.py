@@ -0,0 +1,448 @@
+import glob
+import json
+import logging
+import os
+import queue
+import shutil
+import struct
+import threading
+import zipfile
+import numpy as np
+
+from typing import Dict, List, Tuple, Optional
+
+from . import Job
+
+log = logging.getLogger(__name__)
+
+# File extension by output format
+OUTPUT_FORMATS = {'npz': 'npz', 'hdf5': 'h5', 'arrow': 'arrow'}
+
+# Columns with one entry per result, which are memory-mapped by read_results
+_RESULT_COLUMNS = ('values', 'states', 'job_index')
+_MMAP_MODES = ('r', 'r+', 'c')
+
+# Size of the fixed part of a local file header in a zip file, see the .ZIP File Format Specification
+_ZIP_LOCAL_HEADER_SIZE = 30
+
+
+def check_output_format(output_format: str) -> None:
+    """Checks that results can be written in a format, see :func:`write_results`
+
+    Raises:
+        AttributeError if the format is unrecognized
+        AssertionError if the package required for the format is missing
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise AttributeError('Output format ' + output_format + ' unrecognized.')
+    if output_format == 'hdf5':
+        _import_for_format(output_format, 'h5py')
+    elif output_format == 'arrow':
+        _import_for_format(output_format, 'pyarrow')
+
+
+def result_columns(jobs: List[Job], only_best: bool = False) -> Dict[str, np.ndarray]:
+    """Collects the results of jobs into columns
+
+    Results are stored with one row per result. Job level data is stored with one row per job and referenced by the
+    `job_index` of each result. If the states of the jobs have different dimensions, e.g. in runs with several
+    models, shorter states are padded with `NaN`.
+
+    Args:
+        jobs: Jobs to collect, jobs without results are skipped
+        only_best: Only collect the best result of each job
+
+    Returns:
+        Dictionary of `values` (results), `states` (results x dimensions), `job_index` (results), `job_ids` (jobs),
+        `models` (jobs) and `params` (jobs, as JSON)
+    """
+    columns = concat_columns([job_columns(job, job.values, job.results) for job in jobs if job.completed])
+    return best_per_job(columns) if only_best else columns
+
+
+def job_columns(job: Job, values: np.ndarray, states: np.ndarray) -> Dict[str, np.ndarray]:
+    """Collects results of a single job into columns, see :func:`result_columns`
+
+    Args:
+        job: Job the results belong to
+        values: Values of the results
+        states: States of the results, one row per result
+
+    Returns:
+        Dictionary of columns
+    """
+    values = np.asarray(values)
+    return {
+        'values': values,
+        'states': np.asarray(states).reshape((len(values), -1)),
+        'job_index': np.zeros(len(values), dtype=np.int32),
+        'job_ids': np.asarray([job.id], dtype=str),
+        'models': np.asarray([job.model.name], dtype=str),
+        'params': np.asarray([json.dumps(job.params, default=str)], dtype=str)
+    }
+
+
+def concat_columns(parts: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Concatenates columns, e.g. of several jobs. Parts of the same job are merged into one job.
+
+    Args:
+        parts: Columns to concatenate, see :func:`result_columns`
+
+    Returns:
+        Dictionary of columns
+    """
+    dtype = np.result_type(np.float32, *(part['values'] for part in parts))
+    dimensions = max((part['states'].shape[1] for part in parts), default=0)
+    rows = sum(len(part['values']) for part in parts)
+
+    states = np.full((rows, dimensions), np.nan, dtype=dtype)
+    job_index = np.empty(rows, dtype=np.int32)
+    job_positions: Dict[str, int] = {}
+    job_rows: List[Tuple[str, str, str]] = []
+    row = 0
+    for part in parts:
+        positions = []
+        for job_id, model, params in zip(part['job_ids'], part['models'], part['params']):
+            if job_id not in job_positions:
+                job_positions[job_id] = len(job_rows)
+                job_rows.append((job_id, model, params))
+            positions.append(job_positions[job_id])
+
+        part_rows = len(part['values'])
+        states[row:row + part_rows, :part['states'].shape[1]] = part['states']
+        job_index[row:row + part_rows] = np.asarray(positions, dtype=np.int32)[part['job_index']]
+        row += part_rows
+
+    return {
+        'values': np.concatenate([part['values'] for part in parts]).astype(dtype) if rows > 0 else
+        np.empty(0, dtype=dtype),
+        'states': states,
+        'job_index': job_index,
+        'job_ids': np.asarray([job_id for job_id, _, _ in job_rows], dtype=str),
+        'models': np.asarray([model for _, model, _ in job_rows], dtype=str),
+        'params': np.asarray([params for _, _, params in job_rows], dtype=str)
+    }
+
+
+def best_per_job(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Reduces columns to the best result of each job
+
+    Args:
+        columns: Columns to reduce, see :func:`result_columns`
+
+    Returns:
+        Dictionary of columns, with one result per job, in the order of the jobs
+    """
+    order = np.lexsort((columns['values'], columns['job_index']))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = columns['job_index'][order][1:] != columns['job_index'][order][:-1]
+    best = order[first]
+    return dict(columns, values=columns['values'][best], states=columns['states'][best],
+                job_index=columns['job_index'][best])
+
+
+def write_results(path: str, jobs: List[Job], output_format: str = 'npz', only_best: bool = False) -> None:
+    """Writes the results of jobs into a single file, see :func:`result_columns` for the contained columns
+
+    Supported formats are `npz` (uncompressed, numpy only), `hdf5` (requires `h5py`) and `arrow` (Arrow IPC file,
+    requires `pyarrow`). All formats store the values, states and job indices as contiguous arrays, which
+    :func:`read_results` memory-maps with `mmap_mode`. This includes `npz` files, for which `numpy.load` ignores
+    `mmap_mode` and reads the arrays into memory. The Arrow file contains one record per result, with `value`,
+    `state` and `job_id`. The models and params of the jobs are stored as JSON in the schema metadata.
+
+    Args:
+        path: Path of the file
+        jobs: Jobs to write, jobs without results are skipped
+        output_format: One of `npz`, `hdf5` or `arrow`
+        only_best: Only write the best result of each job
+
+    Raises:
+        AttributeError if the format is unrecognized
+        AssertionError if the package required for the format is missing
+    """
+    check_output_format(output_format)
+    write_columns(path, result_columns(jobs, only_best), output_format)
+
+
+def write_columns(path: str, columns: Dict[str, np.ndarray], output_format: str = 'npz') -> None:
+    """Writes columns into a single file, see :func:`write_results`"""
+    if output_format == 'npz':
+        with open(path, 'wb') as output_file:
+            # numpy's stubs match the named arrays against the `allow_pickle` flag
+            np.savez(output_file, **columns)  # type: ignore
+    elif output_format == 'hdf5':
+        _write_hdf5(path, columns)
+    elif output_format == 'arrow':
+        _write_arrow(path, columns)
+    else:
+        raise AttributeError('Output format ' + output_format + ' unrecognized.')
+
+
+class StreamingResultWriter():
+    """Persists results from a background thread as they arrive, instead of writing all results at the end of a run
+
+    Each added result is written as a part, i.e. an npz file in the directory `<path>.parts`, so that completed jobs
+    survive a crash of the application master. Parts are written to a temporary file first and then renamed, so a
+    part is either complete or missing. :meth:`~StreamingResultWriter.close` consolidates the parts into the single
+    file at `path` and removes the parts. Parts left behind by a crash can be consolidated with
+    :func:`consolidate_parts`.
+
+    Args:
+        path: Path of the consolidated file
+        output_format: Format of the consolidated file, see :func:`write_results`
+        only_best: Only keep the best result of each job in the consolidated file
+
+    Raises:
+        AttributeError if the format is unrecognized
+        AssertionError if the package required for the format is missing
+    """
+
+    def __init__(self, path: str, output_format: str = 'npz', only_best: bool = False) -> None:
+        check_output_format(output_format)
+
+        self.path = path
+        self.parts_path = path + '.parts'
+        self.output_format = output_format
+        self.only_best = only_best
+        self.failures = 0
+        self._parts = 0
+        self._job_parts: Dict[str, List[str]] = {}
+        self._queue: queue.Queue = queue.Queue()
+
+        os.makedirs(self.parts_path, exist_ok=True)
+        self._thread = threading.Thread(target=self._write_parts, name='csaopt-result-writer', daemon=True)
+        self._thread.start()
+
+    def add(self, job: Job, values: np.ndarray, states: np.ndarray, replace: bool = False) -> None:
+        """Enqueues results of a job for writing, returns immediately
+
+        Args:
+            job: Job the results belong to
+            values: Values of the results
+            states: States of the results, one row per result
+            replace: Replace previously added results of the job, e.g. of a previous round of successive halving.
+                Otherwise, results are appended to the results of the job, e.g. for jobs broadcast to several workers.
+        """
+        self._queue.put((job_columns(job, values, states), job.id, replace))
+
+    def close(self) -> str:
+        """Writes all enqueued results and consolidates them into a single file
+
+        Returns:
+            The path of the consolidated file
+        """
+        self._queue.put(None)
+        self._thread.join()
+        consolidate_parts(self.parts_path, self.path, self.output_format, self.only_best)
+        return self.path
+
+    def _write_parts(self) -> None:
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+
+            columns, job_id, replace = entry
+            try:
+                part_path = os.path.join(self.parts_path, '{:08d}.npz'.format(self._parts))
+                self._parts += 1
+                with open(part_path + '.tmp', 'wb') as part_file:
+                    np.savez(part_file, **columns)
+                os.replace(part_path + '.tmp', part_path)
+
+                if replace:
+                    for previous_part in self._job_parts.pop(job_id, []):
+                        os.remove(previous_part)
+                self._job_parts.setdefault(job_id, []).append(part_path)
+            except Exception:
+                # Writing continues with the next result, the run is not interrupted
+                log.exception('Could not write results of job {}'.format(job_id))
+                self.failures += 1
+
+
+def consolidate_parts(parts_path: str, path: str, output_format: str = 'npz', only_best: bool = False) -> None:
+    """Consolidates the parts written by a :class:`StreamingResultWriter` into a single file and removes the parts
+
+    Args:
+        parts_path: Directory containing the parts
+        path: Path of the consolidated file
+        output_format: Format of the consolidated file, see :func:`write_results`
+        only_best: Only keep the best result of each job
+    """
+    part_paths = sorted(glob.glob(os.path.join(parts_path, '*.npz')))
+    parts = [read_results(part_path) for part_path in part_paths]
+    columns = concat_columns(parts)
+    write_columns(path, best_per_job(columns) if only_best else columns, output_format)
+    shutil.rmtree(parts_path, ignore_errors=True)
+
+
+def read_results(path: str, mmap_mode: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """Reads a file written by :func:`write_results`, the format is determined by the file extension
+
+    Args:
+        path: Path of the file
+        mmap_mode: If set, `values`, `states` and `job_index` are memory-mapped instead of read into memory, with the
+            given mode of :class:`numpy.memmap`, i.e. `r`, `r+` or `c`. Columns of Arrow files are always read-only
+            views of the memory-mapped file.
+
+    Returns:
+        Dictionary of columns, see :func:`result_columns`
+    """
+    if mmap_mode is not None and mmap_mode not in _MMAP_MODES:
+        raise AssertionError('mmap_mode must be one of {}, got {}'.format(_MMAP_MODES, mmap_mode))
+
+    if path.endswith('.' + OUTPUT_FORMATS['hdf5']):
+        return _read_hdf5(path, mmap_mode)
+    elif path.endswith('.' + OUTPUT_FORMATS['arrow']):
+        return _read_arrow(path)
+
+    if mmap_mode is None:
+        with np.load(path) as npz:
+            return {name: npz[name] for name in npz.files}
+    return _read_npz_mmap(path, mmap_mode)
+
+
+def _read_npz_mmap(path: str, mmap_mode: str) -> Dict[str, np.ndarray]:
+    """Reads an npz file, memory-mapping the result columns
+
+    `numpy.savez` stores the arrays uncompressed, as `.npy` data inside the zip file, so they are memory-mapped at
+    their offset in the file.
+    """
+    columns: Dict[str, np.ndarray] = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as input_file:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')]
+            column = _mmap_npy(path, input_file, info, mmap_mode) if name in _RESULT_COLUMNS else None
+            if column is None:
+                with archive.open(info) as member:
+                    column = np.lib.format.read_array(member)
+            columns[name] = column
+    return columns
+
+
+def _mmap_npy(path: str, input_file, info: zipfile.ZipInfo, mmap_mode: str) -> Optional[np.ndarray]:
+    """Memory-maps an `.npy` member of a zip file, `None` if it is compressed or cannot be mapped"""
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+
+    input_file.seek(info.header_offset)
+    header = input_file.read(_ZIP_LOCAL_HEADER_SIZE)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    input_file.seek(info.header_offset + _ZIP_LOCAL_HEADER_SIZE + name_length + extra_length)
+
+    version = np.lib.format.read_magic(input_file)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(input_file)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(input_file)
+    else:
+        return None
+
+    # Empty arrays cannot be memory-mapped
+    if dtype.hasobject or int(np.prod(shape)) == 0:
+        return None
+    return _memmap(path, dtype, shape, input_file.tell(), mmap_mode, order='F' if fortran_order else 'C')
+
+
+def _memmap(path: str, dtype: np.dtype, shape: Tuple[int, ...], offset: int, mmap_mode: str,
+            order: str = 'C') -> np.ndarray:
+    # numpy's stubs only accept literal modes and orders
+    return np.memmap(path, dtype=dtype, mode=mmap_mode, offset=offset, shape=shape, order=order)  # type: ignore
+
+
+def _read_hdf5(path: str, mmap_mode: Optional[str]) -> Dict[str, np.ndarray]:
+    h5py = _import_for_format('hdf5', 'h5py')
+    columns: Dict[str, np.ndarray] = {}
+    with h5py.File(path, 'r') as input_file:
+        for name, dataset in input_file.items():
+            if name in ('job_ids', 'models', 'params'):
+                columns[name] = np.asarray([_to_str(entry) for entry in dataset[()]], dtype=str)
+                continue
+
+            # Datasets are written contiguously and uncompressed, so they can be mapped at their offset in the file
+            offset = dataset.id.get_offset() if name in _RESULT_COLUMNS else None
+            if mmap_mode is not None and offset is not None and dataset.size > 0:
+                columns[name] = _memmap(path, dataset.dtype, dataset.shape, offset, mmap_mode)
+            else:
+                columns[name] = dataset[()]
+    return columns
+
+
+def _write_hdf5(path: str, columns: Dict[str, np.ndarray]) -> None:
+    h5py = _import_for_format('hdf5', 'h5py')
+    with h5py.File(path, 'w') as output_file:
+        for name, column in columns.items():
+            if column.dtype.kind == 'U':
+                output_file.create_dataset(name, data=column.astype(object), dtype=h5py.special_dtype(vlen=str))
+            else:
+                output_file.create_dataset(name, data=column)
+
+
+def _write_arrow(path: str, columns: Dict[str, np.ndarray]) -> None:
+    pa = _import_for_format('arrow', 'pyarrow')
+    states = columns['states']
+    arrays = [
+        pa.array(columns['values']),
+        pa.FixedSizeListArray.from_arrays(pa.array(states.ravel()), states.shape[1]),
+        pa.DictionaryArray.from_arrays(pa.array(columns['job_index']), pa.array(columns['job_ids'].tolist()))
+    ]
+    jobs = [{'job_id': job_id, 'model': model, 'params': json.loads(params)}
+            for job_id, model, params in zip(columns['job_ids'], columns['models'], columns['params'])]
+    table = pa.Table.from_arrays(arrays, names=['value', 'state', 'job_id'], metadata={'jobs': json.dumps(jobs)})
+
+    with pa.OSFile(path, 'wb') as sink:
+        writer = pa.RecordBatchFileWriter(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+
+
+def _read_arrow(path: str) -> Dict[str, np.ndarray]:
+    pa = _import_for_format('arrow', 'pyarrow')
+    with pa.memory_map(path, 'r') as source:
+        table = pa.RecordBatchFileReader(source).read_all()
+
+    jobs = json.loads(table.schema.metadata[b'jobs'])
+    values = _arrow_to_numpy(table.column('value').chunks, np.float32)
+    dimensions = table.schema.field('state').type.list_size
+    # The flat values of the fixed size lists are the rows of the states
+    states = _arrow_to_numpy([chunk.flatten() for chunk in table.column('state').chunks], values.dtype)
+    job_ids = [job['job_id'] for job in jobs]
+    job_positions = {job_id: position for position, job_id in enumerate(job_ids)}
+
+    # Dictionary indices refer to the job ids of their chunk. They are the job indices if the dictionary lists the
+    # jobs in order, as written by write_results, otherwise they are translated to the positions of the jobs.
+    job_index_chunks = []
+    for chunk in table.column('job_id').chunks:
+        positions = np.asarray([job_positions[job_id] for job_id in chunk.dictionary.to_pylist()], dtype=np.int32)
+        indices = chunk.indices.to_numpy().astype(np.int32, copy=False)
+        in_order = np.array_equal(positions, np.arange(len(positions)))
+        job_index_chunks.append(indices if in_order else positions[indices])
+
+    return {
+        'values': values,
+        'states': states.reshape((table.num_rows, dimensions)),
+        'job_index': _arrow_to_numpy(job_index_chunks, np.int32),
+        'job_ids': np.asarray(job_ids, dtype=str),
+        'models': np.asarray([job['model'] for job in jobs], dtype=str),
+        'params': np.asarray([json.dumps(job['params']) for job in jobs], dtype=str)
+    }
+
+
+def _arrow_to_numpy(chunks: List, dtype) -> np.ndarray:
+    """Joins chunks of Arrow or numpy arrays into one numpy array, a single Arrow chunk is converted without copying"""
+    arrays = [chunk if isinstance(chunk, np.ndarray) else chunk.to_numpy() for chunk in chunks]
+    if len(arrays) == 0:
+        return np.empty(0, dtype=dtype)
+    return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+
+def _import_for_format(output_format: str, package: str):
+    try:
+        return __import__(package)
+    except ImportError:
+        raise AssertionError('Output format {} is not available, the required package {} is missing'.format(
+            output_format, package))
+
+
+def _to_str(entry) -> str:
+    return entry.decode('utf-8') if isinstance(entry, bytes) else str(entry)
@@ -0,0 +1,103 @@
+import logging
+
+from collections import deque
+from dramatiq import Message
+from typing import Deque, Dict, List, Tuple, Any, Optional
+
+from . import Job
+from ..broker import Broker, WorkerCommand
+
+log = logging.getLogger(__name__)
+
+
+class JobScheduler():
+    """Dispatches any number of jobs to workers as they become free
+
+    Each worker has at most `max_in_flight` jobs enqueued at a time. With a depth of two or more, the next job is
+    already waiting on the worker's queue while the current one runs, so workers run jobs back to back without waiting
+    for a round trip to the application master. Jobs are dispatched to the least loaded queues first.
+
+    All workers need to have the models of all jobs deployed.
+
+    Args:
+        broker: Broker used to send jobs and retrieve results
+        max_in_flight: Maximum number of jobs enqueued per worker
+    """
+
+    def __init__(self, broker: Broker, max_in_flight: int = 2) -> None:
+        if max_in_flight < 1:
+            raise AssertionError('max_in_flight needs to be at least 1, but is {}'.format(max_in_flight))
+
+        self.broker = broker
+        self.max_in_flight = max_in_flight
+        self.pending: Deque[Job] = deque()
+        self.in_flight: Dict[str, Tuple[Job, Message]] = {}
+        self.queue_load: Dict[str, int] = {queue_id: 0 for queue_id in broker.queue_ids}
+
+    @property
+    def done(self) -> bool:
+        """`True` if there are neither pending nor running jobs"""
+        return len(self.pending) == 0 and len(self.in_flight) == 0
+
+    def submit(self, jobs: List[Job]) -> None:
+        """Adds jobs to the schedule and dispatches as many as the workers can take
+
+        Args:
+            jobs: Jobs to run
+        """
+        self.pending.extend(jobs)
+        self._dispatch()
+
+    def cancel_pending(self) -> List[Job]:
+        """Removes all jobs that have not been dispatched yet, jobs in flight are not affected
+
+        Returns:
+            The removed jobs
+        """
+        jobs = list(self.pending)
+        self.pending.clear()
+        return jobs
+
+    async def next_completed(self, timeout: float) -> Optional[Tuple[Job, Any]]:
+        """Waits for the next job to complete and dispatches pending jobs to the worker that became free
+
+        Args:
+            timeout: Maximum time to wait in seconds
+
+        Returns:
+            Tuple of the completed job and its result or `None` on timeout
+        """
+        completed = await self.broker.wait_for_any_result([msg for _, msg in self.in_flight.values()], timeout)
+        if completed is None:
+            return None
+
+        msg, result = completed
+        job, _ = self.in_flight.pop(msg.message_id)
+        self.queue_load[msg.queue_name] -= 1
+        self._dispatch()
+
+        return job, result
+
+    def _dispatch(self) -> None:
+        submissions = []
+        jobs = []
+        while len(self.pending) > 0:
+            queue_id = min(self.queue_load, key=lambda q: self.queue_load[q])
+            if self.queue_load[queue_id] >= self.max_in_flight:
+                break
+
+            job = self.pending.popleft()
+            job.queue_id = queue_id
+            job.submitted_to = [queue_id]
+            self.queue_load[queue_id] += 1
+            jobs.append(job)
+            submissions.append((queue_id, WorkerCommand.RunOptimization, job.to_dict()))
+
+        if len(submissions) == 0:
+            return
+
+        for job, msg in zip(jobs, self.broker.send_to_queues(submissions)):
+            job.message_id = msg.message_id
+            self.in_flight[msg.message_id] = (job, msg)
+
+        log.debug('Dispatched {} jobs, {} jobs pending'.format(len(jobs), len(self.pending)))
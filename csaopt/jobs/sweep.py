@@ -0,0 +1,117 @@
+import copy
+import itertools
+import math
+import numpy as np
+
+from pyhocon import ConfigTree
+from typing import Dict, List, Any
+
+SweepPoint = Dict[str, Any]
+
+
+def expand_sweep(sweep_conf: Dict[str, Any]) -> List[SweepPoint]:
+    """Expands the `sweep` section of a configuration into parameter points
+
+    Keys are relative to the `optimization` section. The section may contain any combination of
+    - `grid`: Lists of values per key, all combinations are evaluated
+    - `points`: List of explicit parameter points
+    - `random`: Number of `samples` (and optionally a `seed`) as well as `min` and `max` per key in `params`. Values
+      are drawn uniformly, or log-uniformly if `log = true`. If `min` and `max` are integers, so are the samples.
+
+    Args:
+        sweep_conf: The `sweep` section of a configuration
+
+    Returns:
+        List of parameter points, i.e. dictionaries of keys and values
+    """
+    points: List[SweepPoint] = []
+
+    grid = sweep_conf.get('grid', None)
+    if grid is not None:
+        keys = list(_flatten(grid).keys())
+        values = [_flatten(grid)[key] for key in keys]
+        for key, key_values in zip(keys, values):
+            if not isinstance(key_values, list) or len(key_values) == 0:
+                raise AssertionError('Sweep grid values for {} need to be a non-empty list'.format(key))
+        points.extend(dict(zip(keys, combination)) for combination in itertools.product(*values))
+
+    for point in sweep_conf.get('points', []):
+        points.append(_flatten(point))
+
+    random = sweep_conf.get('random', None)
+    if random is not None:
+        points.extend(_sample(random))
+
+    if len(points) == 0:
+        raise AssertionError('Sweep configuration contains no parameter points')
+
+    return points
+
+
+def apply_sweep_point(config: Dict[str, Any], point: SweepPoint) -> Dict[str, Any]:
+    """Creates a copy of a configuration with the parameters of a sweep point
+
+    Args:
+        config: Configuration containing the sweep
+        point: Parameter point, see :func:`expand_sweep`
+
+    Returns:
+        A copy of the configuration with updated `optimization` values and without the `sweep` section
+    """
+    config = copy.deepcopy(config)
+    config.pop('sweep', None)
+
+    for key, value in point.items():
+        if isinstance(config, ConfigTree):
+            config.put('optimization.' + key, value)
+        else:
+            section = config.setdefault('optimization', {})
+            *path, name = key.split('.')
+            for part in path:
+                section = section.setdefault(part, {})
+            section[name] = value
+
+    return config
+
+
+def _flatten(section: Dict[str, Any], prefix: str = '') -> Dict[str, Any]:
+    flat: Dict[str, Any] = {}
+    for key, value in section.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, prefix + key + '.'))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def _sample(random_conf: Dict[str, Any]) -> List[SweepPoint]:
+    samples = random_conf.get('samples', 0)
+    if samples < 1:
+        raise AssertionError('Random sweeps need at least one sample')
+
+    params = random_conf.get('params', {})
+    ranges = {key[:-len('.min')]: None for key in _flatten(params) if key.endswith('.min')}
+    if len(ranges) == 0:
+        raise AssertionError('Random sweeps need min and max values for at least one parameter')
+
+    random_state = np.random.RandomState(random_conf.get('seed', None))
+    flat_params = _flatten(params)
+    columns: Dict[str, List[Any]] = {}
+    for key in ranges:
+        low, high = flat_params[key + '.min'], flat_params.get(key + '.max', None)
+        if high is None or low > high:
+            raise AssertionError('Random sweep over {} needs min <= max'.format(key))
+
+        if flat_params.get(key + '.log', False):
+            if low <= 0:
+                raise AssertionError('Log-uniform sweep over {} needs min > 0'.format(key))
+            values = np.exp(random_state.uniform(math.log(low), math.log(high), samples))
+        else:
+            values = random_state.uniform(low, high, samples)
+
+        if isinstance(low, int) and isinstance(high, int):
+            columns[key] = [int(round(v)) for v in values]
+        else:
+            columns[key] = [float(v) for v in values]
+
+    return [{key: columns[key][n] for key in columns} for n in range(samples)]
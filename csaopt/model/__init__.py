@@ -1,6 +1,7 @@
 """
 This module offers the core CSAOpt modelling component: the :class:`~model.Model` class.
 """
+import hashlib
 import json
 
 from enum import Enum
@@ -65,10 +66,11 @@ class Model:
         assert 'globals' in d
         assert 'functions' in d
 
-        distribution: RandomDistribution = d['distribution']
-        precision: Precision = d['precision']
+        # Enum members and their serialized values are both accepted
+        distribution: RandomDistribution = RandomDistribution(d['distribution'])
+        precision: Precision = Precision(d['precision'])
 
-        return Model(d['name'], d['dimensions'], precision.value, distribution.value, d.get('globals', {}),
+        return Model(d['name'], d['dimensions'], precision, distribution, d.get('globals', {}),
                      d.get('state_shape', 1), d['functions'])
 
     def __init__(self, name: str, dimensions: int, precision: Precision, distribution: RandomDistribution,
@@ -97,5 +99,20 @@ class Model:
             'functions': self.functions
         }
 
+    def content_hash(self) -> str:
+        """Computes a hash of the model's canonical serialized form
+
+        Models with equal content have equal hashes, regardless of when or where they were loaded. The name is not
+        part of the content, since it is generated for models loaded without one. This is used to store models on the
+        broker and to re-use models that were already deployed to a worker.
+
+        Returns:
+            Hex digest (SHA-256) of the model content
+        """
+        content = self.to_dict()
+        del content['name']
+        canonical = json.dumps(content, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
     def __repr__(self) -> str:
         return json.dumps(self, indent=4)
@@ -2,6 +2,8 @@
 This module offers functionality regarding the loading and validation of optimiztion models.
 """
 
+from typing import Optional
+
 __all__ = ['model_loader', 'model_validator']
 
 
@@ -10,8 +12,10 @@ class ValidationError(Exception):
 
     Args:
         message: Error message
+        line: Line in the model file the error refers to, if known
     """
 
-    def __init__(self, message: str) -> None:
+    def __init__(self, message: str, line: Optional[int] = None) -> None:
         # Call the base class constructor with the parameters it needs
         super().__init__(message)
+        self.line = line
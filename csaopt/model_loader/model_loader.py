@@ -1,10 +1,12 @@
 import imp
 import logging
 import inspect
+import multiprocessing
+import os
 
 from types import ModuleType
 from pyhocon import ConfigTree
-from typing import Dict, List, Callable, Any, Optional
+from typing import Dict, List, Callable, Any, Optional, Tuple
 
 from . import ValidationError
 from .model_validator import ModelValidator
@@ -23,6 +25,35 @@ def _get_distribution_with_default(name: str, default: str) -> RandomDistributio
         name.casefold()] if RandomDistribution[name.casefold()] is not None else RandomDistribution[default]
 
 
+def _load_model(conf: ConfigTree, internal_conf: ConfigTree) -> Tuple[Optional[Model], List[ValidationError]]:
+    loader = ModelLoader(conf, internal_conf)
+    return loader.get_model(), loader.errors
+
+
+def load_models(confs: List[ConfigTree], internal_conf: ConfigTree,
+                max_processes: Optional[int] = None) -> List[Tuple[Optional[Model], List[ValidationError]]]:
+    """Loads and validates several models in parallel, each in its own process
+
+    Loading a model interprets the model file and validation runs mypy, both of which take long enough to be worth
+    running in parallel. A single model is loaded in the calling process.
+
+    Args:
+        confs: Configurations of the models, containing `model.path`
+        internal_conf: Internal CSAOpt Configuration
+        max_processes: Maximum number of processes, `None` uses the number of CPUs
+
+    Returns:
+        A list containing a tuple of model (`None` if validation failed) and validation errors per configuration
+    """
+    if len(confs) == 1:
+        return [_load_model(confs[0], internal_conf)]
+
+    # Forking a process with running threads (e.g. the console printer's scheduler) may deadlock, hence spawn
+    processes = min(len(confs), max_processes or os.cpu_count() or 1)
+    with multiprocessing.get_context('spawn').Pool(processes=processes) as pool:
+        return pool.starmap(_load_model, [(conf, internal_conf) for conf in confs])
+
+
 class ModelLoader():
     """Class responsible for loading the provided optimization model into the internal representation of a model.
 
@@ -54,7 +85,8 @@ class ModelLoader():
 
         if not conf.get('model.skip_typecheck'):
             logger.debug('Skipping typecheck')
-            typecheck_error = validator.validate_typing(self.model_path)
+            typecheck_error = validator.validate_typing(
+                self.model_path, cache_dir=internal_conf.get('model.validation.typecheck_cache_dir', None))
             if typecheck_error is not None:
                 self.errors.append(typecheck_error)
 
@@ -1,19 +1,76 @@
-import inspect
+import ast
+import hashlib
+import json
+import logging
+import os
 import subprocess
 
 from pyhocon import ConfigTree
-from typing import Optional, List, Dict, Callable
+from typing import Optional, List, Dict, Callable, Tuple
 from ..model import RequiredFunctions
 from . import ValidationError
 
-
-def _empty_function():
-    pass
+log = logging.getLogger(__name__)
+
+
+# Constructs that are rejected if listed in `model.validation.reserved_keywords`
+_reserved_constructs: Dict[str, Callable[[ast.AST], bool]] = {
+    'import': lambda node: isinstance(node, (ast.Import, ast.ImportFrom)),
+    'except': lambda node: isinstance(node, ast.ExceptHandler),
+    'finally': lambda node: isinstance(node, ast.Try) and len(node.finalbody) > 0,
+    'yield': lambda node: isinstance(node, (ast.Yield, ast.YieldFrom))
+}
+
+# Constructs outside of the subset of python that numba compiles for CUDA devices, which neither support closures nor
+# objects allocated on the heap
+_unsupported_constructs: Dict[type, str] = {
+    ast.ClassDef: 'Class definitions',
+    ast.FunctionDef: 'Nested functions',
+    ast.AsyncFunctionDef: 'Nested functions',
+    ast.Lambda: 'Lambdas',
+    ast.Await: '`await` expressions',
+    ast.With: '`with` statements',
+    ast.AsyncWith: '`with` statements',
+    ast.Global: '`global` statements',
+    ast.Nonlocal: '`nonlocal` statements',
+    ast.Delete: '`del` statements',
+    ast.List: 'Lists',
+    ast.ListComp: 'List comprehensions',
+    ast.Dict: 'Dicts',
+    ast.DictComp: 'Dict comprehensions',
+    ast.Set: 'Sets',
+    ast.SetComp: 'Set comprehensions',
+    ast.GeneratorExp: 'Generator expressions',
+    ast.JoinedStr: 'f-strings',
+    ast.Starred: 'Starred expressions'
+}
+
+
+def _first_line(node: ast.AST) -> int:
+    """Returns the first line of a function definition, which is the line of its first decorator, if any"""
+    return min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])  # type: ignore
+
+
+def _param_count(args: ast.arguments) -> int:
+    return (len(getattr(args, 'posonlyargs', [])) + len(args.args) + len(args.kwonlyargs) +
+            int(args.vararg is not None) + int(args.kwarg is not None))
+
+
+def _is_empty_statement(stmt: ast.stmt) -> bool:
+    """Returns `True` for statements without effect, i.e. `pass`, `return`, docstrings and `...`"""
+    if isinstance(stmt, ast.Pass):
+        return True
+    if isinstance(stmt, ast.Return):
+        return stmt.value is None
+    # Python < 3.8 parses constants as Str and Ellipsis nodes
+    return isinstance(stmt, ast.Expr) and (isinstance(stmt.value, ast.Constant) or
+                                           type(stmt.value).__name__ in ('Str', 'Ellipsis'))
 
 
 class ModelValidator:
 
-    empty_function_bytecode = _empty_function.__code__.co_code
+    # Part of the key of cached validation results, needs to change whenever the validation changes
+    version = '1'
 
     # TODO: review these
     required_param_counts = {
@@ -25,129 +82,171 @@ class ModelValidator:
         'empty_state': 0
     }
 
+    # Functions that are only called on the application master, which do not need to be compiled by numba
+    host_functions = ['empty_state']
+
     def validate_functions(self, functions: Dict[str, Callable], internal_config: ConfigTree) -> List[ValidationError]:
         """Run validators on optimization functions
 
+        The source file of the functions is parsed once and all checks run in a single walk of each function's syntax
+        tree, so errors carry the line in the source file they refer to.
+
         Args:
             functions: Dictionary mapping function name to function object
             internal_config: Internal CSAOpt configuration
 
+        Raises:
+            AssertionError: If a reserved keyword cannot be checked
+
         Returns:
             A list of ValidationsErrors. This list will be empty when all restrictions are met.
         """
         errors: List[ValidationError] = []
 
         self.reserved_keywords: List[str] = internal_config['model.validation.reserved_keywords']
+        for reserved_keyword in self.reserved_keywords:
+            if reserved_keyword not in _reserved_constructs:
+                raise AssertionError('Reserved keyword `{}` unsupported, must be one of {}'.format(
+                    reserved_keyword, ', '.join(_reserved_constructs)))
+        self.numba_subset: bool = internal_config.get('model.validation.numba_subset', True)
 
+        function_nodes: Dict[str, Dict[Tuple[str, int], ast.FunctionDef]] = {}
         for func in RequiredFunctions:
-            val_errors = self._validate_function(func.value, functions[func.value],
-                                                 self.required_param_counts[func.value])
+            fun = functions[func.value]
+            if fun is None:
+                errors.append(ValidationError('Definition of function `{}` not found.'.format(func.value)))
+                continue
+
+            definition = self._find_function_node(fun, function_nodes)
+            if definition is None:
+                errors.append(ValidationError('Source of function `{}` not found.'.format(func.value)))
+                continue
 
-            errors.extend([err for err in val_errors if err is not None])
+            file_path, node = definition
+            errors.extend(self._validate_function(func.value, file_path, node, self.required_param_counts[func.value]))
 
         return errors
 
-    def _validate_function(self, name: str, fun: Callable, param_count: int) -> List[Optional[ValidationError]]:
-        """Run all validators on the input function
+    def _find_function_node(self, fun: Callable, function_nodes: Dict[str, Dict[Tuple[str, int], ast.FunctionDef]]
+                            ) -> Optional[Tuple[str, ast.FunctionDef]]:
+        """Finds the definition of a function in the syntax tree of its source file
 
         Args:
-            name: Name of function
             fun: Function object
-            param_count: Number of expected function arguments
-        """
-        return [
-            self._validate_missing_fun(name, fun),
-            self._validate_empty_fun(name, fun),
-            # TODO review if this is required
-            self._validate_return_statement(name, fun),
-            self._validate_fun_signature_len(name, fun, param_count),
-            self._check_for_reserved_keywords(name, fun)
-        ]
-
-    def validate_typing(self, file_path: str) -> Optional[ValidationError]:
-        """Validates the input file using mypy
-
-        Args:
-            file_path: Path to file
+            function_nodes: Function definitions by name and first line, per source file. Files that are not in here
+                yet are parsed and added.
 
         Returns:
-            :class:`~model_loader.ValidationError` if validation fails, otherwise `None`
+            A tuple of the path of the source file and the function definition, `None` if the definition was not found
         """
-        mypy_result = subprocess.run(['mypy', file_path], stdout=subprocess.PIPE)
-
-        if mypy_result.returncode != 0:
-            return ValidationError(mypy_result.stdout.decode('utf-8'))
-        return None
-
-    def _check_for_reserved_keywords(self, name: str, fun: Callable) -> Optional[ValidationError]:
-        """Returns ValidationError if function contains reserved keywords
+        code = getattr(fun, '__code__', None)
+        if code is None:
+            return None
+
+        file_path = code.co_filename
+        if file_path not in function_nodes:
+            try:
+                with open(file_path, 'r') as source_file:
+                    tree = ast.parse(source_file.read(), filename=file_path)
+                function_nodes[file_path] = {(node.name, _first_line(node)): node
+                                             for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)}
+            except (OSError, SyntaxError):
+                log.debug('Could not parse source file {}'.format(file_path), exc_info=True)
+                function_nodes[file_path] = {}
+
+        node = function_nodes[file_path].get((code.co_name, code.co_firstlineno))
+        return (file_path, node) if node is not None else None
+
+    def _validate_function(self, name: str, file_path: str, node: ast.FunctionDef,
+                           param_count: int) -> List[ValidationError]:
+        """Run all validators on the definition of a function
 
         Args:
-            name: Name of function that is checked
-            fun: Function object to be checked
-
-        Returns:
-            :class:`~model_loader.ValidationError` if validation fails, otherwise `None`
-        """
-        for reserved_keyword in self.reserved_keywords:
-            if reserved_keyword in inspect.getsource(fun):
-                return ValidationError('Reserved Keyword {} found in function \'{}\''.format(reserved_keyword, name))
-        return None
-
-    def _validate_missing_fun(self, name: str, fun: Callable) -> Optional[ValidationError]:
-        """Returns a ValidationError if function is missing
-
-        Args:
-            name: Name of function that is checked
-            fun: Function object to be checked
+            name: Name of function
+            file_path: Path of the source file, used in error messages
+            node: Function definition
+            param_count: Number of expected function arguments
 
         Returns:
-            :class:`~model_loader.ValidationError` if validation fails, otherwise `None`
+            A list of ValidationErrors, ordered by line
         """
-        if fun is None:
-            return ValidationError('Definition of function `{}` not found.'.format(name))
-        return None
-
-    def _validate_empty_fun(self, name: str, fun: Callable) -> Optional[ValidationError]:
-        """Returns a ValidationError if function has no body (i.e. only pass, return)
-
-        Args:
-            name: Name of function that is checked
-            fun: Function object to be checked
-
-        Returns:
-            :class:`~model_loader.ValidationError` if validation fails, otherwise `None`
-        """
-        if fun.__code__.co_code == self.empty_function_bytecode:
-            return ValidationError('Definition of function `{}` is empty.'.format(name))
-        return None
+        findings: List[Tuple[int, str]] = []
+        numba_subset = self.numba_subset and name not in self.host_functions
+
+        if _param_count(node.args) != param_count:
+            findings.append((node.lineno, 'Signature of `{}` has an incorrect number of parameters '
+                             '(expected {}, found {})'.format(name, param_count, _param_count(node.args))))
+
+        if all(_is_empty_statement(stmt) for stmt in node.body):
+            findings.append((node.lineno, 'Definition of function `{}` is empty.'.format(name)))
+
+        has_return = False
+        for stmt in node.body:
+            for child in ast.walk(stmt):
+                if isinstance(child, ast.Return):
+                    has_return = True
+
+                # Some nodes, e.g. operators, have no position
+                line = getattr(child, 'lineno', node.lineno)
+                for reserved_keyword in self.reserved_keywords:
+                    if _reserved_constructs[reserved_keyword](child):
+                        message = 'Reserved keyword `{}` found in function `{}`'.format(reserved_keyword, name)
+                        findings.append((line, message))
+
+                if numba_subset and type(child) in _unsupported_constructs:
+                    message = '{} are not supported by numba on CUDA devices, found in function `{}`'.format(
+                        _unsupported_constructs[type(child)], name)
+                    findings.append((line, message))
+
+        # TODO review if this is required
+        if not has_return:
+            findings.append((node.lineno, 'Body of function `{}` does not contain a `return` statement.'.format(name)))
+
+        return [ValidationError('{}:{}: {}'.format(file_path, line, message), line=line)
+                for line, message in sorted(findings, key=lambda finding: finding[0])]
+
+    def validate_typing(self, file_path: str, cache_dir: Optional[str] = None) -> Optional[ValidationError]:
+        """Validates the input file using mypy
 
-    def _validate_fun_signature_len(self, name: str, fun: Callable, num_params: int) -> Optional[ValidationError]:
-        """Validates that a given function accepts the correct number of arguments
+        Since mypy takes seconds to run, results can be cached on disk. Cached results are keyed by the content hash
+        of the file and the validator version, so changed files are validated again. Modules imported by the file are
+        not part of the key.
 
         Args:
-            name: Name of function that is checked
-            fun: Function object to be checked
+            file_path: Path to file
+            cache_dir: Directory in which validation results are cached, `None` disables the cache
 
         Returns:
             :class:`~model_loader.ValidationError` if validation fails, otherwise `None`
         """
-        if len(inspect.signature(fun).parameters) != num_params:
-            return ValidationError(
-                'Signature of `{}` has an incorrect number of parameters (expected {}, found {})'.format(
-                    name, num_params, len(inspect.signature(fun).parameters)))
+        cache_path = self._typing_cache_path(file_path, cache_dir) if cache_dir is not None else None
+        if cache_path is not None and os.path.isfile(cache_path):
+            with open(cache_path, 'r') as cache_file:
+                error = json.load(cache_file)['error']
+            log.debug('Using cached typecheck result for {}'.format(file_path))
+        else:
+            mypy_result = subprocess.run(['mypy', file_path], stdout=subprocess.PIPE)
+            error = mypy_result.stdout.decode('utf-8') if mypy_result.returncode != 0 else None
+            if cache_path is not None:
+                self._write_typing_cache(cache_path, error)
+
+        if error is not None:
+            return ValidationError(error)
         return None
 
-    def _validate_return_statement(self, name: str, fun: Callable) -> Optional[ValidationError]:
-        """Validates that a given function includes a return statement
-
-        Args:
-            name: Name of function that is checked
-            fun: Function object to be checked
-
-        Returns:
-            :class:`~model_loader.ValidationError` if validation fails, otherwise `None`
-        """
-        if 'return' not in inspect.getsource(fun):
-            return ValidationError('Body of function `{}` does not contain a `return` statement. '.format(name))
-        return None
+    def _typing_cache_path(self, file_path: str, cache_dir: str) -> str:
+        content_hash = hashlib.sha256()
+        with open(file_path, 'rb') as model_file:
+            content_hash.update(model_file.read())
+        content_hash.update(self.version.encode('utf-8'))
+        return os.path.join(os.path.expanduser(cache_dir), content_hash.hexdigest() + '.json')
+
+    def _write_typing_cache(self, cache_path: str, error: Optional[str]) -> None:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # Concurrent validations of the same file write the same result, the rename makes the write atomic
+            with open(cache_path + '.' + str(os.getpid()), 'w') as cache_file:
+                json.dump({'error': error}, cache_file)
+            os.replace(cache_path + '.' + str(os.getpid()), cache_path)
+        except OSError:
+            log.warning('Could not cache typecheck result in {}'.format(cache_path), exc_info=True)
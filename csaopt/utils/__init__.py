@@ -21,6 +21,14 @@ def docker_available() -> bool:
         return False
 
 
+def numba_available() -> bool:
+    try:
+        import numba  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+
 def is_pytest_run() -> bool:
     return os.environ.get('UNIT_TESTS') == '1'
 
@@ -0,0 +1,9 @@
+"""
+This module provides a reference implementation of the CSAOpt worker in pure Python.
+
+The worker declares the Dramatiq actors that the application master communicates with, `PingActor` and
+`OptimizationActor`, and runs optimizations on the CPU using one of the engines in :mod:`~csaopt.engine`. This
+allows running the complete master/worker pipeline on a single machine, without GPUs or worker images.
+"""
+
+__all__ = ['worker']
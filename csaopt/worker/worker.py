@@ -0,0 +1,265 @@
+import dramatiq
+import logging
+import signal
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Dict, Any, Union, Optional
+
+from ..broker import Broker, WorkerCommand, pack_results, unpack_results, parse_result_return, reduce_results
+from ..engine import compile_model, create_engine, get_dtype
+from ..engine.engine import ProgressCallback
+from ..model import Model
+
+log = logging.getLogger(__name__)
+
+
+class OptimizationWorker():
+    """Executes the commands the application master sends to a worker
+
+    Deployed models are kept in memory by name, so that subsequent optimization jobs can refer to them. Models are
+    also kept by content hash, so that models deployed by hash are only fetched and compiled once per worker.
+
+    The ids of cancelled jobs are kept for the most recent `max_cancelled_jobs` cancellations, so that jobs which are
+    still enqueued when they are cancelled do not run either.
+
+    Args:
+        engine: Name of the engine backend used to run optimizations, see :func:`~csaopt.engine.create_engine`
+        broker: Broker from which models deployed by hash are loaded
+    """
+
+    max_cancelled_jobs = 4096
+
+    def __init__(self, engine: str = 'numpy', broker: Optional[Broker] = None) -> None:
+        self.engine = engine
+        self.broker = broker
+        self.models: Dict[str, Model] = {}
+        self.models_by_hash: Dict[str, Model] = {}
+        self.cancelled_jobs: Dict[str, bool] = OrderedDict()
+
+    def handle(self, command: str, payload: Dict[str, Any]) -> Union[str, Dict[str, Any]]:
+        """Dispatches a command received by the `OptimizationActor`
+
+        Args:
+            command: Value of a :class:`~broker.WorkerCommand`
+            payload: Payload sent along with the command
+
+        Returns:
+            The result that will be stored in the result backend
+        """
+        cmd = WorkerCommand(command)
+        if cmd is WorkerCommand.DeployModel:
+            return self.deploy_model(payload)
+        elif cmd is WorkerCommand.DeployCachedModel:
+            return self.deploy_cached_model(payload)
+        elif cmd is WorkerCommand.RunOptimization:
+            return self.run_optimization(payload)
+        elif cmd is WorkerCommand.Cancel:
+            return self.cancel(payload)
+        else:
+            raise AttributeError('Worker command ' + command + ' unrecognized.')
+
+    def deploy_model(self, model_dict: Dict[str, Any]) -> str:
+        """Deploys a model, i.e. compiles it and keeps it for subsequent jobs
+
+        Args:
+            model_dict: Serialized model, see :meth:`~model.Model.to_dict`
+
+        Returns:
+            `model_deployed` on success, otherwise a description of the error
+        """
+        try:
+            model = Model.from_dict(model_dict)
+            compile_model(model)
+        except Exception as e:
+            log.exception('Exception occurred while deploying model')
+            return 'Model deployment failed: {}'.format(repr(e))
+
+        self.models[model.name] = model
+        self.models_by_hash[model.content_hash()] = model
+        log.debug('Deployed model {}'.format(model.name))
+        return 'model_deployed'
+
+    def deploy_cached_model(self, payload: Dict[str, Any]) -> str:
+        """Deploys a model by its content hash
+
+        If a model with the same hash was deployed before, it is re-used. Otherwise, the model is loaded from the
+        broker and deployed, see :meth:`~broker.Broker.store_model`. Either way, the model is registered under the
+        name given in the payload.
+
+        Args:
+            payload: Dictionary containing `name` and `hash` of the model
+
+        Returns:
+            `model_cached` if the model was already deployed, otherwise see :meth:`~OptimizationWorker.deploy_model`
+        """
+        name, model_hash = payload['name'], payload['hash']
+        if model_hash in self.models_by_hash:
+            self.models[name] = self.models_by_hash[model_hash]
+            log.debug('Model {} already deployed'.format(name))
+            return 'model_cached'
+
+        model_dict = self.broker.load_model(model_hash) if self.broker is not None else None
+        if model_dict is None:
+            return 'Model deployment failed: model {} not found on broker'.format(model_hash)
+
+        return self.deploy_model(dict(model_dict, name=name))
+
+    def cancel(self, payload: Dict[str, Any]) -> str:
+        """Cancels jobs, running jobs stop early and return the best results found so far
+
+        Args:
+            payload: Dictionary containing the `job_ids` to cancel
+
+        Returns:
+            `cancelled`
+        """
+        for job_id in payload['job_ids']:
+            self.cancelled_jobs[job_id] = True
+        while len(self.cancelled_jobs) > self.max_cancelled_jobs:
+            self.cancelled_jobs.popitem(last=False)  # type: ignore
+        log.debug('Cancelled {} jobs'.format(len(payload['job_ids'])))
+        return 'cancelled'
+
+    def run_optimization(self, job_dict: Dict[str, Any]) -> Dict[str, Any]:
+        """Runs an optimization job on a previously deployed model
+
+        If the job contains `resume`, the chains continue from the states of a previous run of the job instead of
+        being initialized, see :meth:`~csaopt.engine.engine.Engine.run`.
+
+        If the job contains `progress`, progress updates containing `job_id`, `step`, `temp`, `best_value` and
+        `acceptance_rate` are published every `progress.steps` steps, but at most once per `progress.interval` seconds,
+        see :meth:`~broker.Broker.publish_progress`.
+
+        If the job is cancelled while running (see :meth:`~OptimizationWorker.cancel`), it stops early and returns the
+        best results found so far, flagged with `cancelled`. Jobs cancelled before they started return only the flag.
+
+        If the job params contain `results.return` (`all`, `best` or `top_k=N`), only the best results of the chains
+        are returned, see :func:`~broker.parse_result_return`.
+
+        Args:
+            job_dict: Serialized job, see :meth:`~jobs.Job.to_dict`
+
+        Returns:
+            A dictionary containing the results in columnar format (see :func:`~broker.pack_results`) or, if the
+            optimization failed, `failure`
+        """
+        job_id = job_dict.get('id')
+        if job_id in self.cancelled_jobs:
+            log.debug('Skipping cancelled job {}'.format(job_id))
+            return {'job_id': job_id, 'cancelled': True}
+
+        try:
+            if job_dict['model'] not in self.models:
+                raise AssertionError('Model {} has not been deployed'.format(job_dict['model']))
+
+            model = self.models[job_dict['model']]
+            opt_conf = job_dict['params'].get('optimization', {})
+            result_count = parse_result_return(job_dict['params'].get('results', {}).get('return'))
+            engine = create_engine(self.engine, model, opt_conf)
+
+            run_args: Dict[str, Any] = {}
+            resume = job_dict.get('resume')
+            if resume is not None:
+                _, run_args['initial_states'] = unpack_results(resume)
+                run_args['start_step'] = resume['start_step']
+            progress = job_dict.get('progress')
+            if progress is not None and self.broker is not None:
+                run_args['progress'] = self._progress_publisher(job_dict['id'], progress['interval'])
+                run_args['progress_steps'] = progress['steps']
+
+            run_args['cancelled'] = lambda: job_id in self.cancelled_jobs
+
+            results = engine.run(**run_args)
+            values, states = reduce_results(results['values'], results['states'], result_count)
+            result = dict(job_id=job_id, **pack_results(values, states, get_dtype(model)))
+            if job_id in self.cancelled_jobs:
+                result['cancelled'] = True
+            return result
+        except Exception as e:
+            log.exception('Exception occurred while running optimization')
+            return {'job_id': job_id, 'failure': repr(e)}
+
+    def _progress_publisher(self, job_id: str, interval: float) -> ProgressCallback:
+        """Returns a progress callback publishing updates of a job at most once per `interval` seconds"""
+        last_published = 0.0
+
+        def publish(step: int, temp: float, best_value: float, acceptance_rate: float) -> None:
+            nonlocal last_published
+            now = time.monotonic()
+            if now - last_published < interval:
+                return
+
+            last_published = now
+            try:
+                self.broker.publish_progress({  # type: ignore
+                    'job_id': job_id,
+                    'step': step,
+                    'temp': temp,
+                    'best_value': best_value,
+                    'acceptance_rate': acceptance_rate
+                })
+            except Exception:
+                # Progress is informational, the optimization continues regardless
+                log.exception('Could not publish progress of job {}'.format(job_id))
+
+        return publish
+
+
+def declare_actors(broker: Broker, queue_id: str, worker: OptimizationWorker) -> None:
+    """Declares `PingActor` and `OptimizationActor` for a queue on the given broker
+
+    Args:
+        broker: Broker the actors are declared on
+        queue_id: Queue the actors consume from
+        worker: Worker handling optimization commands
+    """
+
+    def ping() -> str:
+        return 'pong'
+
+    dramatiq.actor(actor_name='PingActor', queue_name=queue_id, broker=broker.dramatiq_broker,
+                   store_results=True)(ping)
+    # Optimizations run as long as their configuration requires, Dramatiq's TimeLimit middleware would otherwise
+    # interrupt them after 10 minutes
+    dramatiq.actor(actor_name='OptimizationActor', queue_name=queue_id, broker=broker.dramatiq_broker,
+                   store_results=True, max_retries=0, time_limit=float('inf'))(worker.handle)
+
+
+def run_worker(queue_id: str, host: str = 'localhost', port: int = 6379, password: Optional[str] = None,
+               engine: str = 'numpy', compression: Optional[str] = None,
+               compression_level: Optional[int] = None) -> None:
+    """Runs a worker until it receives SIGINT or SIGTERM
+
+    Args:
+        queue_id: Queue id of this worker
+        host: Hostname or IP address of the broker
+        port: Redis port
+        password: Redis password
+        engine: Name of the engine backend used to run optimizations
+        compression: Codec used to compress results, see :class:`~broker.Broker`
+        compression_level: Codec specific compression level
+    """
+    broker = Broker(host=host, port=port, password=password, queue_ids=[queue_id], compression=compression,
+                    compression_level=compression_level)
+    worker = OptimizationWorker(engine, broker)
+    declare_actors(broker, queue_id, worker)
+    # Control commands, e.g. cancellations, need to reach the worker while it is busy with a job
+    unsubscribe = broker.subscribe_control(worker.handle)
+
+    # A worker runs one optimization at a time, the engines parallelize internally. The short worker timeout lets
+    # the worker shut down quickly, at the cost of polling the broker more often while idle.
+    dramatiq_worker = dramatiq.Worker(broker.dramatiq_broker, queues={queue_id}, worker_threads=1, worker_timeout=100)
+    dramatiq_worker.start()
+    log.info('Worker {} started'.format(queue_id))
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stopped.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    stopped.wait()
+
+    # Running jobs are finished before the worker stops, they can still be cancelled until then
+    dramatiq_worker.stop()
+    unsubscribe()
+    log.info('Worker {} stopped'.format(queue_id))
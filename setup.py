@@ -53,6 +53,7 @@ setup(
     install_requires=['docopt'],
     extras_require={
         'test': ['coverage', 'pytest', 'pytest-cov'],
+        'numba': ['numba>=0.44.1'],
     },
     entry_points={
         'console_scripts': [
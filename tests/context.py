@@ -7,12 +7,23 @@ from distutils import dir_util
 sys.path.insert(0, os.path.abspath('.'))
 
 from csaopt import Runner, ExecutionType, ConsolePrinter, Context as AppContext
-from csaopt.utils import get_configs, docker_available
-from csaopt.model import Model, RandomDistribution, Precision
-from csaopt.model_loader.model_loader import ModelLoader, ModelValidator, ValidationError
+from csaopt.utils import get_configs, docker_available, numba_available
+from csaopt.model import Model, RandomDistribution, Precision, RequiredFunctions
+from csaopt.model_loader.model_loader import ModelLoader, ModelValidator, ValidationError, load_models
 from csaopt.jobs.jobmanager import JobManager, Job
+from csaopt.jobs.scheduler import JobScheduler
+from csaopt.jobs.sweep import expand_sweep, apply_sweep_point
+from csaopt.jobs.halving import SuccessiveHalving
+from csaopt.jobs.aggregation import TopKAggregator, summarize_values, merge_stats
+from csaopt.jobs.output import write_results, read_results, result_columns, StreamingResultWriter
+from csaopt.jobs.output import consolidate_parts, check_output_format
 from csaopt.instancemanager.awstools import AWSTools, Instance
-from csaopt.broker import Broker, WorkerCommand
+from csaopt.instancemanager.local_processes import LocalProcesses
+from csaopt.instancemanager.in_memory import InMemory
+from csaopt.broker import Broker, WorkerCommand, pack_results, unpack_results, parse_result_return, reduce_results
+from csaopt.engine import compile_model
+from csaopt.engine.numpy_engine import NumpyEngine
+from csaopt.worker.worker import OptimizationWorker, declare_actors
 
 
 def copy_folder_contents(src, dest):
@@ -0,0 +1,49 @@
+import pytest
+import numpy as np
+
+from context import TopKAggregator, summarize_values, merge_stats, Job, Model, Precision, RandomDistribution
+
+
+def build_job():
+    return Job(Model('model', 2, Precision.Float32, RandomDistribution.Uniform, None, 1, {}), {})
+
+
+def test_top_k():
+    aggregator = TopKAggregator(3)
+    job1, job2 = build_job(), build_job()
+
+    aggregator.add(job1, np.asarray([5.0, 1.0, 4.0, 9.0]), np.arange(8, dtype=np.float32).reshape((4, 2)))
+    aggregator.add(job2, np.asarray([3.0, 7.0]), np.full((2, 2), -1.0, dtype=np.float32))
+
+    results = aggregator.results()
+    assert len(aggregator) == 3
+    assert [value for value, _, _ in results] == [1.0, 3.0, 4.0]
+    assert [job for _, _, job in results] == [job1, job2, job1]
+    assert results[0][1].tolist() == [2.0, 3.0]
+
+
+def test_top_k_copies_states():
+    aggregator = TopKAggregator(1)
+    states = np.zeros((2, 2))
+
+    aggregator.add(build_job(), np.asarray([2.0, 1.0]), states)
+    states[1, :] = 42.0
+
+    assert aggregator.results()[0][1].tolist() == [0.0, 0.0]
+
+
+def test_top_k_invalid():
+    with pytest.raises(AssertionError):
+        TopKAggregator(0)
+
+
+def test_merge_stats():
+    values = np.random.uniform(size=100)
+
+    stats = merge_stats(None, summarize_values(values[:30]))
+    stats = merge_stats(stats, summarize_values(values[30:]))
+
+    expected = summarize_values(values)
+    assert stats['count'] == 100
+    for key in ('min', 'max', 'mean', 'std'):
+        assert stats[key] == pytest.approx(expected[key])
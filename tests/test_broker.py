@@ -0,0 +1,285 @@
+import numpy as np
+import pytest
+import redis
+import sys
+
+from dramatiq.results.backends import RedisBackend
+
+from context import Broker, WorkerCommand, OptimizationWorker, declare_actors, pack_results, unpack_results
+from context import parse_result_return, reduce_results
+from csaopt.broker import _MsgPackEncoder
+
+
+@pytest.fixture
+def stub_broker(monkeypatch):
+    monkeypatch.setenv('UNIT_TESTS', '1')
+    monkeypatch.setenv('USE_STUB_BROKER', '1')
+    return Broker(queue_ids=['queue1', 'queue2'])
+
+
+@pytest.fixture
+def redis_backend(stub_broker, mocker):
+    backend = RedisBackend(encoder=stub_broker.result_backend.encoder, client=mocker.Mock())
+    stub_broker.result_backend = backend
+    return backend
+
+
+def _blpop_result(backend, message, result):
+    return backend.build_message_key(message).encode('utf-8'), backend.encoder.encode(result)
+
+
+@pytest.mark.asyncio
+async def test_get_results_blocking_pop(stub_broker, redis_backend):
+    stub_broker.send_to_queue('queue1', WorkerCommand.DeployModel, {})
+    stub_broker.send_to_queue('queue2', WorkerCommand.DeployModel, {})
+    msg1 = stub_broker.queue_messages['queue1'][0]
+    msg2 = stub_broker.queue_messages['queue2'][0]
+
+    redis_backend.client.blpop.side_effect = [
+        _blpop_result(redis_backend, msg2, 'model_deployed'),
+        None,  # blpop timed out, but the overall timeout has not expired yet
+        _blpop_result(redis_backend, msg1, 'model_deployed')
+    ]
+
+    results = await stub_broker.get_all_results(timeout=10.0)
+
+    assert results == {'queue1': ['model_deployed'], 'queue2': ['model_deployed']}
+    assert redis_backend.client.blpop.call_count == 3
+    # Only results of pending messages are awaited
+    assert len(redis_backend.client.blpop.call_args_list[0][0][0]) == 2
+    assert len(redis_backend.client.blpop.call_args_list[2][0][0]) == 1
+
+
+@pytest.mark.asyncio
+async def test_get_queue_results(stub_broker, redis_backend):
+    stub_broker.send_to_queue('queue1', WorkerCommand.DeployModel, {})
+    stub_broker.send_to_queue('queue2', WorkerCommand.DeployModel, {})
+    msg2 = stub_broker.queue_messages['queue2'][0]
+
+    redis_backend.client.blpop.side_effect = [_blpop_result(redis_backend, msg2, 'model_deployed')]
+
+    assert await stub_broker.get_queue_results('queue2') == ['model_deployed']
+
+
+@pytest.mark.asyncio
+async def test_get_results_timeout(stub_broker, redis_backend):
+    stub_broker.send_to_queue('queue1', WorkerCommand.DeployModel, {})
+    redis_backend.client.blpop.return_value = None
+
+    with pytest.raises(TimeoutError):
+        await stub_broker.get_all_results(timeout=0.1)
+
+
+def test_send_to_queues_stub(stub_broker):
+    messages = stub_broker.send_to_queues([('queue1', WorkerCommand.DeployModel, {'a': 1}),
+                                           (1, WorkerCommand.RunOptimization, {'b': 2})])
+
+    assert [msg.queue_name for msg in messages] == ['queue1', 'queue2']
+    assert messages[1].args == ('run_optimization', {'b': 2})
+    assert stub_broker.queue_messages['queue1'] == [messages[0]]
+    assert stub_broker.queue_messages['queue2'] == [messages[1]]
+
+
+def test_broadcast_pipelined(mocker):
+    broker = Broker(queue_ids=['queue1', 'queue2', 'queue3'])
+    client = broker.dramatiq_broker.client = mocker.Mock()
+    # Newer Dramatiq versions query the Lua stack size through a script
+    broker.dramatiq_broker.scripts = {name: mocker.Mock(return_value=8000) for name in broker.dramatiq_broker.scripts}
+    dispatch = broker.dramatiq_broker.scripts['dispatch']
+    pipeline = client.pipeline.return_value
+    payload = {'state': np.arange(4.0)}
+    pack = mocker.spy(broker.result_backend.encoder, 'pack')
+
+    messages = broker.broadcast(WorkerCommand.DeployModel, payload)
+
+    assert [msg.queue_name for msg in messages] == ['queue1', 'queue2', 'queue3']
+    assert len(set(msg.options['redis_message_id'] for msg in messages)) == 3
+    # All messages are sent in a single round trip and the payload is only encoded once
+    assert dispatch.call_count == 3
+    assert all(c[1]['client'] is pipeline for c in dispatch.call_args_list)
+    pipeline.execute.assert_called_once_with()
+    pack.assert_called_once()
+
+    # Messages are encoded exactly like dramatiq would encode them
+    for msg, c in zip(messages, dispatch.call_args_list):
+        assert c[1]['args'][-1] == broker.result_backend.encoder.encode(msg.asdict())
+
+
+def test_send_to_queues_without_pipelining(mocker):
+    broker = Broker(queue_ids=['queue1', 'queue2'])
+    client = broker.dramatiq_broker.client = mocker.Mock()
+    # Dramatiq versions without the dispatch script enqueue one message at a time
+    broker.dramatiq_broker.scripts = {}
+    enqueue = mocker.patch.object(broker.dramatiq_broker, 'enqueue', side_effect=lambda msg: msg)
+
+    messages = broker.broadcast(WorkerCommand.DeployModel, {'a': 1})
+
+    assert [msg.queue_name for msg in messages] == ['queue1', 'queue2']
+    assert enqueue.call_count == 2
+    client.pipeline.assert_not_called()
+    assert broker.queue_messages['queue2'] == [messages[1]]
+
+
+def test_store_model_redis(stub_broker, redis_backend):
+    model_dict = {'name': 'model', 'functions': {'cool': 'def cool(): pass'}}
+    redis_backend.client.expire.side_effect = [False, True]
+
+    assert stub_broker.store_model('abc', model_dict, ttl=10) is True
+    assert stub_broker.store_model('abc', model_dict, ttl=10) is False
+    # The model is only transferred once
+    redis_backend.client.set.assert_called_once_with('csaopt:models:abc', redis_backend.encoder.encode(model_dict),
+                                                     ex=10)
+
+    redis_backend.client.get.side_effect = [redis_backend.encoder.encode(model_dict), None]
+    assert stub_broker.load_model('abc') == model_dict
+    assert stub_broker.load_model('def') is None
+
+
+def test_progress_stub(stub_broker):
+    updates = []
+    unsubscribe = stub_broker.subscribe_progress(updates.append)
+
+    stub_broker.publish_progress({'job_id': 'job1', 'step': 100})
+    unsubscribe()
+    stub_broker.publish_progress({'job_id': 'job1', 'step': 200})
+
+    assert updates == [{'job_id': 'job1', 'step': 100}]
+
+
+def test_progress_redis(stub_broker, redis_backend):
+    update = {'job_id': 'job1', 'step': 100}
+    stub_broker.publish_progress(update)
+
+    channel, data = redis_backend.client.publish.call_args[0]
+    assert channel == 'csaopt:progress'
+    assert stub_broker.encoder.decode(data) == update
+
+
+def test_send_control(stub_broker, redis_backend):
+    stub_broker.send_control(WorkerCommand.Cancel, {'job_ids': ['job1']})
+
+    channel, data = redis_backend.client.publish.call_args[0]
+    assert channel == 'csaopt:control'
+    assert stub_broker.encoder.decode(data) == {'command': 'cancel', 'payload': {'job_ids': ['job1']}}
+
+
+def test_encoder_compression():
+    encoder = _MsgPackEncoder(compression='zlib', compression_threshold=128)
+    plain = _MsgPackEncoder()
+    result = {'values': np.zeros(64), 'states': np.zeros((64, 8))}
+
+    encoded = encoder.encode(result)
+    assert len(encoded) < len(plain.encode(result))
+    assert encoder.bytes_saved == len(plain.encode(result)) - len(encoded)
+    # Decoders without compression accept compressed messages and vice versa
+    assert np.array_equal(plain.decode(encoded)['states'], result['states'])
+    assert plain.bytes_saved == encoder.bytes_saved
+    assert encoder.decode(plain.encode(result))['values'].shape == (64, )
+
+
+def test_encoder_compression_threshold():
+    encoder = _MsgPackEncoder(compression='zlib', compression_threshold=128)
+
+    # Small messages and messages that do not compress are sent as is
+    assert encoder.encode('pong') == _MsgPackEncoder().encode('pong')
+    incompressible = np.random.RandomState(42).bytes(1024)
+    assert encoder.encode(incompressible) == _MsgPackEncoder().encode(incompressible)
+    assert encoder.bytes_saved == 0
+
+
+def test_encoder_compression_unavailable(monkeypatch):
+    with pytest.raises(AttributeError):
+        _MsgPackEncoder(compression='bzip')
+
+    monkeypatch.setitem(sys.modules, 'zstandard', None)
+    with pytest.raises(AssertionError):
+        _MsgPackEncoder(compression='zstd')
+
+
+def test_columnar_results():
+    encoder = _MsgPackEncoder()
+    values = np.arange(4, dtype=np.float64)
+    states = np.arange(8, dtype=np.float64).reshape((4, 2))
+
+    result = encoder.decode(encoder.encode(pack_results(values, states, np.dtype('float32'))))
+    decoded_values, decoded_states = unpack_results(result)
+
+    assert decoded_states.shape == (4, 2)
+    assert decoded_states.dtype == np.float32
+    assert np.array_equal(decoded_values, values)
+    assert np.array_equal(decoded_states, states)
+    # Results are not copied, but wrap the received buffers
+    assert decoded_states.base is not None and not decoded_states.flags.owndata
+
+
+def test_legacy_results():
+    values, states = unpack_results({'values': [1.0, 2.0], 'states': [np.zeros(3), np.ones(3)]})
+
+    assert values.shape == (2, )
+    assert states.shape == (2, 3)
+
+
+def test_parse_result_return():
+    assert parse_result_return(None) is None
+    assert parse_result_return('all') is None
+    assert parse_result_return('best') == 1
+    assert parse_result_return('top_k=5') == 5
+
+    for spec in ('top_k=0', 'top_k', 'top=3', 'worst'):
+        with pytest.raises(AssertionError):
+            parse_result_return(spec)
+
+
+def test_reduce_results():
+    values = np.asarray([4.0, 1.0, 3.0, 0.5, 2.0])
+    states = np.arange(10).reshape((5, 2))
+
+    reduced_values, reduced_states = reduce_results(values, states, 2)
+    assert reduced_values.tolist() == [0.5, 1.0]
+    assert reduced_states.tolist() == [[6, 7], [2, 3]]
+
+    assert reduce_results(values, states, None)[0] is values
+    assert len(reduce_results(values, states, 10)[0]) == 5
+
+
+@pytest.mark.asyncio
+async def test_memory_broker():
+    broker = Broker(queue_ids=['queue1', 'queue2'], in_memory=True)
+    declare_actors(broker, 'queue1', OptimizationWorker(broker=broker))
+    declare_actors(broker, 'queue2', OptimizationWorker(broker=broker))
+
+    pings = [broker.send_ping('queue1'), broker.send_ping('queue2')]
+    _, result = await broker.wait_for_any_result(pings, 1.0)
+    assert result == 'pong'
+
+    messages = broker.broadcast(WorkerCommand.DeployModel, {})
+    # Payloads are passed by reference instead of being serialized
+    assert messages[0].args[1] is messages[1].args[1]
+    results = await broker.get_all_results(timeout=1.0)
+    assert [len(r) for r in results.values()] == [1, 1]
+    assert all(r[0].startswith('Model deployment failed') for r in results.values())
+
+    broker.dramatiq_broker.close()
+
+
+@pytest.mark.asyncio
+async def test_wait_until_ready(mocker):
+    broker = Broker(queue_ids=['queue1'])
+    ping = mocker.patch.object(broker.result_backend.client, 'ping')
+    ping.side_effect = [redis.exceptions.ConnectionError(), redis.exceptions.ConnectionError(), True]
+
+    await broker.wait_until_ready(timeout=5.0, initial_delay=0.01)
+    assert ping.call_count == 3
+
+    ping.side_effect = redis.exceptions.ConnectionError()
+    with pytest.raises(TimeoutError):
+        await broker.wait_until_ready(timeout=0.05, initial_delay=0.01)
+
+
+def test_connection_pool_shared():
+    broker = Broker(queue_ids=['queue1'], max_connections=4, socket_connect_timeout=1)
+    pool = broker.dramatiq_broker.client.connection_pool
+
+    assert broker.result_backend.client.connection_pool is pool
+    assert pool.max_connections == 4
+    assert pool.connection_kwargs['socket_connect_timeout'] == 1
@@ -0,0 +1,202 @@
+import pytest
+import numpy as np
+
+from pyhocon import ConfigFactory
+
+from context import ModelLoader, NumpyEngine, compile_model, numba_available
+
+
+@pytest.fixture
+def internal_conf():
+    return ConfigFactory.parse_file('csaopt/internal/csaopt-internal.conf')
+
+
+def load_model(internal_conf, path):
+    conf = ConfigFactory.parse_string("""
+        {
+            model {
+                skip_typecheck = True
+                dimensions = 2
+            }
+        }
+        """)
+    conf['model']['path'] = path
+    return ModelLoader(conf, internal_conf).get_model()
+
+
+@pytest.fixture
+def opt_conf():
+    return {'thread_count': 64, 'max_steps': 600, 'initial_temp': 1000.0, 'min_temp': 1e-30, 'random_seed': 42}
+
+
+def test_compile_model(internal_conf):
+    model = load_model(internal_conf, 'examples/langermann/langermann_opt.py')
+    functions = compile_model(model)
+
+    assert len(functions) == 6
+    assert functions['empty_state']() == (0.0, 0.0)
+
+
+def test_result_shape(internal_conf, opt_conf):
+    model = load_model(internal_conf, 'examples/langermann/langermann_opt.py')
+    results = NumpyEngine(model, opt_conf).run()
+
+    assert results['values'].shape == (64, )
+    assert results['states'].shape == (64, 2)
+    assert results['states'].dtype == np.float32
+
+
+def test_langermann_converges(internal_conf, opt_conf):
+    model = load_model(internal_conf, 'examples/langermann/langermann_opt.py')
+    results = NumpyEngine(model, opt_conf).run()
+
+    assert results['values'].min() == pytest.approx(-5.16, abs=0.1)
+
+
+def test_resume(internal_conf, opt_conf):
+    model = load_model(internal_conf, 'examples/langermann/langermann_opt.py')
+    first = NumpyEngine(model, dict(opt_conf, max_steps=100)).run()
+    resumed = NumpyEngine(model, dict(opt_conf, max_steps=100)).run(initial_states=first['states'][:8], start_step=100)
+
+    # Resumed chains start at their initial states, so they can only improve on them
+    assert resumed['states'].shape == (64, 2)
+    assert np.all(resumed['values'] <= np.tile(first['values'][:8], 8))
+
+
+def test_target_value(internal_conf, opt_conf):
+    model = load_model(internal_conf, 'examples/langermann/langermann_opt.py')
+    steps = []
+    results = NumpyEngine(model, dict(opt_conf, max_steps=100000, target_value=-4.0)).run(
+        progress=lambda step, temp, best_value, acceptance_rate: steps.append(step), progress_steps=10)
+
+    assert results['values'].min() <= -4.0
+    assert steps[-1] < 100000
+
+
+def test_cancelled(internal_conf, opt_conf):
+    model = load_model(internal_conf, 'examples/langermann/langermann_opt.py')
+    checks = []
+    results = NumpyEngine(model, opt_conf).run(cancelled=lambda: checks.append(True) or len(checks) == 2,
+                                               progress_steps=10)
+
+    assert len(checks) == 2
+    assert results['values'].shape == (64, )
+
+
+def test_per_chain_fallback(internal_conf, opt_conf):
+    model = load_model(internal_conf, 'examples/rastrigin/rastrigin_opt.py')
+    engine = NumpyEngine(model, opt_conf)
+    results = engine.run()
+
+    # generate_next branches on state values and cannot be vectorized
+    assert engine.vectorizable['evaluate'] is True
+    assert engine.vectorizable['generate_next'] is False
+    assert np.all(np.abs(results['states']) <= 5.12)
+
+
+def test_seeded_runs_are_reproducible(internal_conf, opt_conf):
+    model = load_model(internal_conf, 'examples/ackley/ackley_opt.py')
+    results1 = NumpyEngine(model, opt_conf).run()
+    results2 = NumpyEngine(model, opt_conf).run()
+
+    assert np.array_equal(results1['values'], results2['values'])
+    assert np.array_equal(results1['states'], results2['states'])
+
+
+def test_missing_opt_param(internal_conf, opt_conf):
+    model = load_model(internal_conf, 'examples/rastrigin/rastrigin_opt.py')
+    del opt_conf['max_steps']
+
+    with pytest.raises(AssertionError):
+        NumpyEngine(model, opt_conf)
+
+
+@pytest.mark.skipif(not numba_available(), reason='Numba is not available')
+def test_numba_engine(internal_conf, opt_conf):
+    from csaopt.engine.numba_engine import NumbaEngine
+
+    model = load_model(internal_conf, 'examples/langermann/langermann_opt.py')
+    results = NumbaEngine(model, opt_conf).run()
+
+    assert results['values'].shape == (64, )
+    assert results['states'].shape == (64, 2)
+    assert results['values'].min() == pytest.approx(-5.16, abs=0.1)
+
+
+@pytest.mark.skipif(not numba_available(), reason='Numba is not available')
+def test_numba_engine_cuda_helpers(internal_conf, opt_conf):
+    from csaopt.engine.numba_engine import NumbaEngine
+
+    # The ackley model uses helpers decorated with `cuda.jit` from its globals section
+    model = load_model(internal_conf, 'examples/ackley/ackley_opt.py')
+    results = NumbaEngine(model, opt_conf).run()
+
+    assert np.all(np.isfinite(results['values']))
+
+
+@pytest.mark.skipif(not numba_available(), reason='Numba is not available')
+def test_numba_engine_kernel_cache(internal_conf, opt_conf):
+    from csaopt.engine.numba_engine import NumbaEngine
+
+    # Models with the same content share the compiled kernel, even if they were loaded separately
+    model = load_model(internal_conf, 'examples/langermann/langermann_opt.py')
+    same_model = load_model(internal_conf, 'examples/langermann/langermann_opt.py')
+
+    assert model.content_hash() == same_model.content_hash()
+    assert NumbaEngine(model, opt_conf).kernel is NumbaEngine(same_model, opt_conf).kernel
+
+
+@pytest.mark.skipif(not numba_available(), reason='Numba is not available')
+def test_numba_engine_resume(internal_conf, opt_conf):
+    from csaopt.engine.numba_engine import NumbaEngine
+
+    model = load_model(internal_conf, 'examples/langermann/langermann_opt.py')
+    first = NumbaEngine(model, dict(opt_conf, max_steps=100)).run()
+    resumed = NumbaEngine(model, dict(opt_conf, max_steps=100)).run(initial_states=first['states'], start_step=100)
+
+    assert np.all(resumed['values'] <= first['values'])
+
+
+@pytest.mark.skipif(not numba_available(), reason='Numba is not available')
+def test_numba_engine_target_value(internal_conf, opt_conf):
+    from csaopt.engine.numba_engine import NumbaEngine
+
+    model = load_model(internal_conf, 'examples/langermann/langermann_opt.py')
+    steps = []
+    results = NumbaEngine(model, dict(opt_conf, max_steps=100000, target_value=-4.0)).run(
+        progress=lambda step, temp, best_value, acceptance_rate: steps.append(step), progress_steps=10)
+
+    assert results['values'].min() <= -4.0
+    assert steps[-1] < 100000
+
+
+@pytest.mark.skipif(not numba_available(), reason='Numba is not available')
+def test_preflight_model(internal_conf, opt_conf):
+    from csaopt.engine.preflight import preflight_model
+
+    model = load_model(internal_conf, 'examples/langermann/langermann_opt.py')
+    report = preflight_model(model, opt_conf, steps=10, thread_count=4)
+
+    assert report.passed
+    assert set(report.compile_times) == {'initialize', 'evaluate', 'generate_next', 'acceptance_func', 'cool'}
+    assert report.kernel_compile_time > 0
+    assert report.step_time > 0
+    assert np.isfinite(report.best_value)
+
+
+@pytest.mark.skipif(not numba_available(), reason='Numba is not available')
+def test_preflight_model_compile_error(internal_conf, opt_conf, tmpdir):
+    from csaopt.engine.preflight import preflight_model
+
+    with open('examples/langermann/langermann_opt.py', 'r') as model_file:
+        source = model_file.read().replace('return math.exp(x) > rnd', 'return math.exp(x) > rnd.shape')
+    tmpdir.join('model.py').write(source)
+
+    model = load_model(internal_conf, str(tmpdir.join('model.py')))
+    report = preflight_model(model, opt_conf, steps=10, thread_count=4)
+
+    assert not report.passed
+    assert list(report.errors) == ['acceptance_func']
+    assert 'TypingError' in report.errors['acceptance_func']
+    assert 'acceptance_func' not in report.compile_times
+    assert report.step_time is None
@@ -0,0 +1,83 @@
+import pytest
+import numpy as np
+
+from context import SuccessiveHalving, Job, Model, Precision, RandomDistribution, unpack_results
+
+
+def build_jobs(count, max_steps=100):
+    model = Model('model', 2, Precision.Float32, RandomDistribution.Uniform, None, 1, {})
+    return [Job(model, {'optimization': {'max_steps': max_steps}}) for n in range(count)]
+
+
+def complete(jobs, values):
+    for job, value in zip(jobs, values):
+        job.values = np.asarray([value], dtype=np.float32)
+        job.results = np.full((1, 2), value, dtype=np.float32)
+        job.completed = True
+
+
+def test_rounds():
+    halving = SuccessiveHalving(10, keep_fraction=0.5, growth=2.0)
+    jobs = build_jobs(4)
+
+    first = halving.start(jobs)
+    assert [job.params['optimization']['max_steps'] for job in first] == [10] * 4
+    assert all(job.resume is None for job in first)
+
+    complete(jobs, [4.0, 1.0, 3.0, 2.0])
+    second = halving.next_round()
+    assert second == [jobs[1], jobs[3]]
+    assert [job.params['optimization']['max_steps'] for job in second] == [20, 20]
+    assert all(not job.completed for job in second)
+
+    values, states = unpack_results(jobs[1].resume)
+    assert jobs[1].resume['start_step'] == 10
+    assert values.tolist() == [1.0]
+    assert states.tolist() == [[1.0, 1.0]]
+
+    complete(second, [0.5, 0.1])
+    third = halving.next_round()
+    assert third == [jobs[3]]
+    assert third[0].params['optimization']['max_steps'] == 70
+    assert third[0].resume['start_step'] == 30
+
+    complete(third, [0.0])
+    assert halving.next_round() == []
+    assert [job.steps_done for job in jobs] == [10, 30, 10, 100]
+
+
+def test_failed_candidates_are_dropped():
+    halving = SuccessiveHalving(10)
+    jobs = build_jobs(2)
+    halving.start(jobs)
+
+    complete(jobs[1:], [1.0])
+    assert halving.next_round() == [jobs[1]]
+
+
+def test_failed_resumed_candidates_keep_results():
+    halving = SuccessiveHalving(10, keep_fraction=0.5)
+    jobs = build_jobs(4)
+    halving.start(jobs)
+
+    complete(jobs, [4.0, 1.0, 3.0, 2.0])
+    assert halving.next_round() == [jobs[1], jobs[3]]
+
+    # The resumed round of jobs[1] fails, it drops out with the results of its first round
+    jobs[1].failure = 'failed'
+    complete(jobs[3:], [0.5])
+    assert halving.next_round() == [jobs[3]]
+
+    assert jobs[1].completed
+    assert jobs[1].get_best_results()[0] == 1.0
+    assert jobs[1].results.tolist() == [[1.0, 1.0]]
+    assert jobs[1].steps_done == 10
+
+
+def test_invalid_parameters():
+    with pytest.raises(AssertionError):
+        SuccessiveHalving(0)
+    with pytest.raises(AssertionError):
+        SuccessiveHalving(10, keep_fraction=1.0)
+    with pytest.raises(AssertionError):
+        SuccessiveHalving(10, growth=0.5)
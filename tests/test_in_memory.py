@@ -0,0 +1,194 @@
+import asyncio
+import pytest
+import numpy as np
+
+from pyhocon import ConfigFactory
+
+from context import InMemory, Broker, JobManager, AppContext, ModelLoader
+
+
+@pytest.fixture
+def internal_conf():
+    return ConfigFactory.parse_file('csaopt/internal/csaopt-internal.conf')
+
+
+@pytest.fixture
+def conf():
+    return ConfigFactory.parse_string("""
+        {
+            remote {
+                platform = memory
+                memory {
+                    worker_count = 2
+                }
+            }
+            model {
+                name = langermann
+                path = examples/langermann/langermann_opt.py
+                skip_typecheck = True
+                dimensions = 2
+            }
+            optimization {
+                thread_count = 16
+                max_steps = 200
+                initial_temp = 100.0
+            }
+        }
+        """)
+
+
+def test_running_instances(conf, internal_conf):
+    with InMemory(conf, internal_conf) as in_memory:
+        broker, workers = in_memory.get_running_instances()
+
+        assert broker.is_broker is True
+        assert broker.props['in_memory'] is True
+        assert sorted(w.props['queue_id'] for w in workers) == sorted(in_memory.queue_ids)
+
+
+@pytest.mark.asyncio
+async def test_optimization_in_memory(conf, internal_conf):
+    model = ModelLoader(conf, internal_conf).get_model()
+
+    with InMemory(conf, internal_conf) as in_memory:
+        _, workers = in_memory.get_running_instances()
+        broker = Broker(queue_ids=[w.props['queue_id'] for w in workers], in_memory=True)
+        in_memory.declare_workers(broker)
+
+        jobmanager = JobManager(AppContext(None, None, internal_conf), broker, [model], [conf])
+        assert sorted(await jobmanager.wait_for_worker_join()) == sorted(in_memory.queue_ids)
+
+        await jobmanager.deploy_model()
+        jobs = await jobmanager.submit()
+        await jobmanager.wait_for_results()
+
+        # The job is broadcast to both workers
+        assert jobs[0].values.shape == (32, )
+        assert jobs[0].results.shape == (32, 2)
+        assert np.all(np.isfinite(jobs[0].values))
+
+    assert len(broker.dramatiq_broker.consumers) == 0
+
+
+@pytest.mark.asyncio
+async def test_more_jobs_than_workers(conf, internal_conf):
+    model = ModelLoader(conf, internal_conf).get_model()
+    configs = [conf] * 5
+
+    with InMemory(conf, internal_conf) as in_memory:
+        _, workers = in_memory.get_running_instances()
+        broker = Broker(queue_ids=[w.props['queue_id'] for w in workers], in_memory=True)
+        in_memory.declare_workers(broker)
+
+        jobmanager = JobManager(AppContext(None, None, internal_conf), broker, [model], configs)
+        await jobmanager.deploy_model()
+        jobs = await jobmanager.submit()
+        await jobmanager.wait_for_results()
+
+        assert len(jobs) == 5
+        assert all(job.completed for job in jobs)
+        assert set(job.queue_id for job in jobs) == set(in_memory.queue_ids)
+
+
+@pytest.mark.asyncio
+async def test_successive_halving(conf, internal_conf):
+    model = ModelLoader(conf, internal_conf).get_model()
+    conf['halving'] = ConfigFactory.from_dict({'initial_steps': 20})
+    configs = [conf] * 4
+
+    with InMemory(conf, internal_conf) as in_memory:
+        _, workers = in_memory.get_running_instances()
+        broker = Broker(queue_ids=[w.props['queue_id'] for w in workers], in_memory=True)
+        in_memory.declare_workers(broker)
+
+        jobmanager = JobManager(AppContext(None, None, internal_conf), broker, [model], configs)
+        await jobmanager.deploy_model()
+        jobs = await jobmanager.submit()
+        await jobmanager.wait_for_results()
+
+        # 4 candidates run 20 steps, the best 2 another 40 steps and the best one the remaining 140 steps
+        assert sorted(job.steps_done for job in jobs) == [20, 20, 60, 200]
+        assert all(job.completed for job in jobs)
+        best_job, _, _ = jobmanager.scan_for_best_result(jobs)
+        assert best_job.steps_done == 200
+
+
+@pytest.mark.asyncio
+async def test_progress(conf, internal_conf):
+    model = ModelLoader(conf, internal_conf).get_model()
+    conf['progress'] = ConfigFactory.from_dict({'interval': 0.0, 'steps': 50, 'buffer_size': 4})
+    configs = [conf] * 3
+
+    with InMemory(conf, internal_conf) as in_memory:
+        _, workers = in_memory.get_running_instances()
+        broker = Broker(queue_ids=[w.props['queue_id'] for w in workers], in_memory=True)
+        in_memory.declare_workers(broker)
+
+        jobmanager = JobManager(AppContext(None, None, internal_conf), broker, [model], configs)
+        await jobmanager.deploy_model()
+
+        updates = []
+
+        async def collect():
+            async for update in jobmanager.progress():
+                updates.append(update)
+
+        collector = asyncio.ensure_future(collect())
+        await asyncio.sleep(0)
+        jobs = await jobmanager.submit()
+        await jobmanager.wait_for_results()
+        await asyncio.sleep(0.1)
+        collector.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await collector
+
+        assert len(updates) > 0
+        assert set(update['job_id'] for update in updates) <= set(job.id for job in jobs)
+        assert len(broker.subscribers['csaopt:progress']) == 0
+
+
+@pytest.mark.asyncio
+async def test_target_value(conf, internal_conf):
+    model = ModelLoader(conf, internal_conf).get_model()
+    conf['optimization']['max_steps'] = 1000000
+    conf['optimization']['target_value'] = -4.0
+    configs = [conf] * 6
+
+    with InMemory(conf, internal_conf) as in_memory:
+        _, workers = in_memory.get_running_instances()
+        broker = Broker(queue_ids=[w.props['queue_id'] for w in workers], in_memory=True)
+        in_memory.declare_workers(broker)
+
+        jobmanager = JobManager(AppContext(None, None, internal_conf), broker, [model], configs)
+        await jobmanager.deploy_model()
+        jobs = await jobmanager.submit()
+        await jobmanager.wait_for_results(result_timeout=30.0)
+
+        # The pending jobs are not dispatched once the target is reached
+        assert jobmanager.cancelled is True
+        assert any(not job.completed and job.cancelled for job in jobs)
+        _, best_value, _ = jobmanager.scan_for_best_result(jobs)
+        assert best_value <= -4.0
+
+
+@pytest.mark.asyncio
+async def test_cancel(conf, internal_conf):
+    model = ModelLoader(conf, internal_conf).get_model()
+    conf['optimization']['max_steps'] = 1000000
+
+    with InMemory(conf, internal_conf) as in_memory:
+        _, workers = in_memory.get_running_instances()
+        broker = Broker(queue_ids=[w.props['queue_id'] for w in workers], in_memory=True)
+        in_memory.declare_workers(broker)
+
+        jobmanager = JobManager(AppContext(None, None, internal_conf), broker, [model], [conf])
+        await jobmanager.deploy_model()
+        jobs = await jobmanager.submit()
+        await asyncio.sleep(0.5)
+        jobmanager.cancel()
+        await jobmanager.wait_for_results(result_timeout=30.0)
+
+        # Both workers return the partial results of the broadcast job
+        assert jobs[0].cancelled is True
+        assert jobs[0].values.shape == (32, )
+        assert np.all(np.isfinite(jobs[0].values))
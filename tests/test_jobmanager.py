@@ -1,9 +1,9 @@
 import pytest
+import numpy as np
 
-from mock import call
 from dramatiq import Worker
 from context import JobManager, AppContext, Broker, ExecutionType, Model
-from context import RandomDistribution, Precision, Job, WorkerCommand
+from context import RandomDistribution, Precision, Job, WorkerCommand, pack_results
 from pyhocon import ConfigTree, ConfigFactory
 from collections import OrderedDict
 
@@ -24,12 +24,18 @@ def build_async_mock_results(result):
     return mock_deploy_results
 
 
+def deployment(model):
+    return WorkerCommand.DeployModel, model.to_dict()
+
+
 @pytest.fixture
 def stub_broker(mocker):
     o = MockBroker()
     o.send_to_queue = mocker.Mock()
+    o.send_to_queues = mocker.Mock(side_effect=lambda submissions: [MockMessage(s[0]) for s in submissions])
     o.broadcast = mocker.Mock()
     o.clear_queue_messages = mocker.Mock()
+    o.store_model = mocker.Mock(return_value=True)
     o.queue_ids = []
     return o
 
@@ -101,7 +107,60 @@ async def test_deploy_single_model_single_conf(mocker, stub_broker, internal_con
     jobmanager = JobManager(ctx, stub_broker, [model], configs)
     await jobmanager.deploy_model()
 
+    stub_broker.broadcast.assert_called_with(*deployment(model))
+    assert jobmanager.models_deployed is True
+
+
+@pytest.mark.asyncio
+async def test_deploy_model_cache(mocker, stub_broker, internal_conf):
+    ctx = AppContext(None, None, internal_conf)
+    model = Model(
+        name='testmodel',
+        dimensions=3,
+        precision=Precision.Float32,
+        distribution=RandomDistribution.Uniform,
+        state_shape=2,
+        opt_globals=None,
+        functions=[])
+
+    stub_broker.queue_ids = ['queue1', 'queue2']
+
+    stub_broker.get_all_results = build_async_mock_results({'queue1': ['model_cached'], 'queue2': ['model_deployed']})
+    configs = [{'broker.model_cache': True}]
+
+    jobmanager = JobManager(ctx, stub_broker, [model], configs)
+    await jobmanager.deploy_model()
+
+    stub_broker.store_model.assert_called_once_with(model.content_hash(), model.to_dict(),
+                                                    ttl=internal_conf['broker.model_cache_ttl'])
+    stub_broker.broadcast.assert_called_with(WorkerCommand.DeployCachedModel, {'name': model.name,
+                                                                               'hash': model.content_hash()})
+    assert jobmanager.models_deployed is True
+
+
+@pytest.mark.asyncio
+async def test_deploy_model_cache_disabled(mocker, stub_broker, internal_conf):
+    ctx = AppContext(None, None, internal_conf)
+    model = Model(
+        name='testmodel',
+        dimensions=3,
+        precision=Precision.Float32,
+        distribution=RandomDistribution.Uniform,
+        state_shape=2,
+        opt_globals=None,
+        functions=[])
+
+    stub_broker.queue_ids = ['queue1']
+
+    stub_broker.get_all_results = build_async_mock_results({'queue1': ['model_deployed']})
+    # Disabled by default, since the worker image does not support cached deployments
+    configs = [{}]
+
+    jobmanager = JobManager(ctx, stub_broker, [model], configs)
+    await jobmanager.deploy_model()
+
     stub_broker.broadcast.assert_called_with(WorkerCommand.DeployModel, model.to_dict())
+    stub_broker.store_model.assert_not_called()
     assert jobmanager.models_deployed is True
 
 
@@ -126,7 +185,7 @@ async def test_deploy_single_model_single_conf_failed_missing_response(mocker, s
     with pytest.raises(AssertionError):
         await jobmanager.deploy_model()
 
-    stub_broker.broadcast.assert_called_with(WorkerCommand.DeployModel, model.to_dict())
+    stub_broker.broadcast.assert_called_with(*deployment(model))
     assert jobmanager.models_deployed is False
 
 
@@ -151,7 +210,7 @@ async def test_deploy_single_model_single_conf_failed_with_error(mocker, stub_br
     with pytest.raises(AssertionError):
         await jobmanager.deploy_model()
 
-    stub_broker.broadcast.assert_called_with(WorkerCommand.DeployModel, model.to_dict())
+    stub_broker.broadcast.assert_called_with(*deployment(model))
     assert jobmanager.models_deployed is False
 
 
@@ -176,7 +235,7 @@ async def test_deploy_single_model_multi_conf(mocker, stub_broker, internal_conf
     jobmanager = JobManager(ctx, stub_broker, [model], configs)
     await jobmanager.deploy_model()
 
-    stub_broker.broadcast.assert_called_with(WorkerCommand.DeployModel, model.to_dict())
+    stub_broker.broadcast.assert_called_with(*deployment(model))
     assert jobmanager.models_deployed is True
 
 
@@ -209,9 +268,12 @@ async def test_deploy_multi_model_single_conf(mocker, stub_broker, internal_conf
     jobmanager = JobManager(ctx, stub_broker, [model, model2], configs)
     await jobmanager.deploy_model()
 
-    stub_broker.send_to_queue.assert_has_calls([
-        call('queue1', WorkerCommand.DeployModel, model.to_dict()),
-        call('queue2', WorkerCommand.DeployModel, model2.to_dict())
+    # Jobs may run on any worker, so all workers need all models
+    stub_broker.send_to_queues.assert_called_once_with([
+        ('queue1', ) + deployment(model),
+        ('queue2', ) + deployment(model),
+        ('queue1', ) + deployment(model2),
+        ('queue2', ) + deployment(model2)
     ])
     assert jobmanager.models_deployed is True
 
@@ -245,13 +307,39 @@ async def test_deploy_multi_model_multi_conf(mocker, stub_broker, internal_conf)
     jobmanager = JobManager(ctx, stub_broker, [model, model2], configs)
     await jobmanager.deploy_model()
 
-    stub_broker.send_to_queue.assert_has_calls([
-        call('queue1', WorkerCommand.DeployModel, model.to_dict()),
-        call('queue2', WorkerCommand.DeployModel, model2.to_dict())
+    # Jobs may run on any worker, so all workers need all models
+    stub_broker.send_to_queues.assert_called_once_with([
+        ('queue1', ) + deployment(model),
+        ('queue2', ) + deployment(model),
+        ('queue1', ) + deployment(model2),
+        ('queue2', ) + deployment(model2)
     ])
     assert jobmanager.models_deployed is True
 
 
+@pytest.mark.asyncio
+async def test_deploy_duplicate_model_names(mocker, stub_broker, internal_conf):
+    ctx = AppContext(None, None, internal_conf)
+    models = [
+        Model(
+            name='testmodel',
+            dimensions=3,
+            precision=Precision.Float32,
+            distribution=RandomDistribution.Uniform,
+            state_shape=2,
+            opt_globals=None,
+            functions=[]) for _ in range(2)
+    ]
+
+    stub_broker.queue_ids = ['queue1']
+    jobmanager = JobManager(ctx, stub_broker, models, [{}])
+
+    # Workers keep models by name, so the second model would replace the first one
+    with pytest.raises(AssertionError):
+        await jobmanager.deploy_model()
+    stub_broker.send_to_queues.assert_not_called()
+
+
 @pytest.mark.asyncio
 async def test_job_single_model_single_conf(stub_broker, mocker, internal_conf):
     ctx = AppContext(None, None, internal_conf)
@@ -312,18 +400,19 @@ async def test_job_multi_model_single_conf(stub_broker, mocker, internal_conf):
     jobmanager.models_deployed = True
 
     await jobmanager.submit()
-    assert stub_broker.send_to_queue.call_count == 2
+    assert stub_broker.send_to_queues.call_count == 1
 
-    jobs = stub_broker.send_to_queue.call_args_list
-    assert jobs[0][0][0] == 'queue1'
-    assert jobs[0][0][1] == WorkerCommand.RunOptimization
-    assert jobs[0][0][2]['params'] == configs[0]
-    assert jobs[0][0][2]['model'] == 'testmodel1'
+    jobs = stub_broker.send_to_queues.call_args[0][0]
+    assert len(jobs) == 2
+    assert jobs[0][0] == 'queue1'
+    assert jobs[0][1] == WorkerCommand.RunOptimization
+    assert jobs[0][2]['params'] == configs[0]
+    assert jobs[0][2]['model'] == 'testmodel1'
 
-    assert jobs[1][0][0] == 'queue2'
-    assert jobs[1][0][1] == WorkerCommand.RunOptimization
-    assert jobs[1][0][2]['params'] == configs[0]
-    assert jobs[1][0][2]['model'] == 'testmodel2'
+    assert jobs[1][0] == 'queue2'
+    assert jobs[1][1] == WorkerCommand.RunOptimization
+    assert jobs[1][2]['params'] == configs[0]
+    assert jobs[1][2]['model'] == 'testmodel2'
 
 
 @pytest.mark.asyncio
@@ -348,18 +437,19 @@ async def test_job_single_model_multi_conf(stub_broker, mocker, internal_conf):
     jobmanager.models_deployed = True
 
     await jobmanager.submit()
-    assert stub_broker.send_to_queue.call_count == 2
+    assert stub_broker.send_to_queues.call_count == 1
 
-    jobs = stub_broker.send_to_queue.call_args_list
-    assert jobs[0][0][0] == 'queue1'
-    assert jobs[0][0][1] == WorkerCommand.RunOptimization
-    assert jobs[0][0][2]['params'] == configs[0]
-    assert jobs[0][0][2]['model'] == 'testmodel1'
+    jobs = stub_broker.send_to_queues.call_args[0][0]
+    assert len(jobs) == 2
+    assert jobs[0][0] == 'queue1'
+    assert jobs[0][1] == WorkerCommand.RunOptimization
+    assert jobs[0][2]['params'] == configs[0]
+    assert jobs[0][2]['model'] == 'testmodel1'
 
-    assert jobs[1][0][0] == 'queue2'
-    assert jobs[1][0][1] == WorkerCommand.RunOptimization
-    assert jobs[1][0][2]['params'] == configs[1]
-    assert jobs[1][0][2]['model'] == 'testmodel1'
+    assert jobs[1][0] == 'queue2'
+    assert jobs[1][1] == WorkerCommand.RunOptimization
+    assert jobs[1][2]['params'] == configs[1]
+    assert jobs[1][2]['model'] == 'testmodel1'
 
 
 @pytest.mark.asyncio
@@ -392,18 +482,19 @@ async def test_job_multi_model_multi_conf(stub_broker, mocker, internal_conf):
     jobmanager.models_deployed = True
 
     await jobmanager.submit()
-    assert stub_broker.send_to_queue.call_count == 2
+    assert stub_broker.send_to_queues.call_count == 1
 
-    jobs = stub_broker.send_to_queue.call_args_list
-    assert jobs[0][0][0] == 'queue1'
-    assert jobs[0][0][1] == WorkerCommand.RunOptimization
-    assert jobs[0][0][2]['params'] == configs[0]
-    assert jobs[0][0][2]['model'] == 'testmodel1'
+    jobs = stub_broker.send_to_queues.call_args[0][0]
+    assert len(jobs) == 2
+    assert jobs[0][0] == 'queue1'
+    assert jobs[0][1] == WorkerCommand.RunOptimization
+    assert jobs[0][2]['params'] == configs[0]
+    assert jobs[0][2]['model'] == 'testmodel1'
 
-    assert jobs[1][0][0] == 'queue2'
-    assert jobs[1][0][1] == WorkerCommand.RunOptimization
-    assert jobs[1][0][2]['params'] == configs[1]
-    assert jobs[1][0][2]['model'] == 'testmodel2'
+    assert jobs[1][0] == 'queue2'
+    assert jobs[1][1] == WorkerCommand.RunOptimization
+    assert jobs[1][2]['params'] == configs[1]
+    assert jobs[1][2]['model'] == 'testmodel2'
 
 
 def test_get_execution_type_multimulti(internal_conf):
@@ -468,3 +559,171 @@ def test_get_execution_type_noconf(internal_conf):
 
     with pytest.raises(AssertionError):
         JobManager(ctx, None, models, confs)
+
+
+class MockMessage():
+    def __init__(self, queue_name):
+        self.queue_name = queue_name
+        self.message_id = 'ping-' + queue_name
+
+
+def build_async_mock_ping_results(responses):
+    async def mock_wait_for_any_result(messages, timeout):
+        for msg in messages:
+            if msg.queue_name in responses:
+                return msg, responses[msg.queue_name]
+        return None
+
+    return mock_wait_for_any_result
+
+
+@pytest.fixture
+def ping_broker(stub_broker, mocker):
+    stub_broker.send_ping = mocker.Mock(side_effect=MockMessage)
+    stub_broker.remove_queue = mocker.Mock()
+    return stub_broker
+
+
+def build_model(name='testmodel'):
+    return Model(
+        name=name,
+        dimensions=3,
+        precision=Precision.Float32,
+        distribution=RandomDistribution.Uniform,
+        state_shape=2,
+        opt_globals=None,
+        functions=[])
+
+
+@pytest.mark.asyncio
+async def test_wait_for_worker_join(ping_broker, mocker, internal_conf):
+    ctx = AppContext(None, None, internal_conf)
+    ping_broker.queue_ids = ['queue1', 'queue2', 'queue3']
+    ping_broker.wait_for_any_result = build_async_mock_ping_results({
+        'queue1': 'pong',
+        'queue2': 'pong',
+        'queue3': 'pong'
+    })
+    on_join = mocker.Mock()
+
+    jobmanager = JobManager(ctx, ping_broker, [build_model()], [{}])
+    joined = await jobmanager.wait_for_worker_join(on_join=on_join)
+
+    assert sorted(joined) == ['queue1', 'queue2', 'queue3']
+    assert ping_broker.send_ping.call_count == 3
+    assert on_join.call_count == 3
+    ping_broker.remove_queue.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_wait_for_worker_join_quorum(ping_broker, internal_conf):
+    ctx = AppContext(None, None, internal_conf)
+    ping_broker.queue_ids = ['queue1', 'queue2', 'queue3']
+    ping_broker.wait_for_any_result = build_async_mock_ping_results({'queue1': 'pong', 'queue3': 'pong'})
+
+    jobmanager = JobManager(ctx, ping_broker, [build_model()], [{'broker.worker_join_quorum': 0.5}])
+    jobmanager.worker_join_grace_period = 0.1
+    joined = await jobmanager.wait_for_worker_join()
+
+    assert sorted(joined) == ['queue1', 'queue3']
+    ping_broker.remove_queue.assert_called_once_with('queue2')
+    assert 'queue2' not in jobmanager.queue_models_deployed
+
+
+@pytest.mark.asyncio
+async def test_wait_for_worker_join_all_required(ping_broker, internal_conf):
+    ctx = AppContext(None, None, internal_conf)
+    ping_broker.queue_ids = ['queue1', 'queue2']
+    ping_broker.wait_for_any_result = build_async_mock_ping_results({'queue1': 'pong'})
+
+    # Without a quorum, all workers are required
+    jobmanager = JobManager(ctx, ping_broker, [build_model()], [{}, {}])
+    jobmanager.worker_join_timeout = 0.1
+
+    with pytest.raises(AssertionError):
+        await jobmanager.wait_for_worker_join()
+
+
+@pytest.mark.asyncio
+async def test_job_sweep(stub_broker, internal_conf):
+    ctx = AppContext(None, None, internal_conf)
+    configs = [{'optimization': {'max_steps': 10}, 'sweep': {'grid': {'initial_temp': [1.0, 2.0, 3.0]}}}]
+
+    stub_broker.queue_ids = ['queue1', 'queue2']
+
+    jobmanager = JobManager(ctx, stub_broker, [build_model()], configs)
+    assert jobmanager.execution_type is ExecutionType.SingleModelSingleConf
+    jobmanager.models_deployed = True
+
+    jobs = await jobmanager.submit()
+    assert len(jobs) == 3
+    assert [job.sweep_point for job in jobs] == [{'initial_temp': 1.0}, {'initial_temp': 2.0}, {'initial_temp': 3.0}]
+    assert stub_broker.broadcast.call_count == 0
+
+    submissions = stub_broker.send_to_queues.call_args[0][0]
+    assert len(submissions) == 3
+    assert submissions[2][2]['params'] == {'optimization': {'max_steps': 10, 'initial_temp': 3.0}}
+
+    for job, value in zip(jobs, [3.0, 1.0, 2.0]):
+        job.values, job.results, job.completed = np.asarray([value]), np.zeros((1, 2)), True
+    assert [value for _, value in jobmanager.summarize_sweep(jobs)] == [1.0, 2.0, 3.0]
+
+
+def test_sweep_multi_conf(internal_conf):
+    ctx = AppContext(None, None, internal_conf)
+    configs = [{'sweep': {'grid': {'initial_temp': [1.0]}}}, {}]
+
+    with pytest.raises(AssertionError):
+        JobManager(ctx, None, [build_model()], configs)
+
+
+def test_top_k_aggregation(stub_broker, internal_conf):
+    ctx = AppContext(None, None, internal_conf)
+    configs = [{'results': {'aggregation': 'top_k', 'top_k': 2, 'job_stats': True}}, {}]
+
+    jobmanager = JobManager(ctx, stub_broker, [build_model()], configs)
+    job1, job2 = Job(build_model(), {}), Job(build_model(), {})
+
+    jobmanager._process_result(job1, pack_results(np.asarray([3.0, 1.0, 2.0]), np.eye(3), np.float32))
+    jobmanager._process_result(job2, pack_results(np.asarray([0.5, 4.0, 6.0]), np.eye(3), np.float32))
+
+    assert [(value, job) for value, _, job in jobmanager.top_results()] == [(0.5, job2), (1.0, job1)]
+    assert job1.values.tolist() == [1.0]
+    assert job1.results.tolist() == [[0.0, 1.0, 0.0]]
+    assert job1.stats['count'] == 3
+    assert job1.stats['mean'] == pytest.approx(2.0)
+    assert jobmanager.scan_for_best_result([job1, job2])[1] == 0.5
+
+
+def test_top_k_aggregation_disabled(stub_broker, internal_conf):
+    ctx = AppContext(None, None, internal_conf)
+
+    jobmanager = JobManager(ctx, stub_broker, [build_model()], [{}, {}])
+
+    assert jobmanager.aggregator is None
+    with pytest.raises(AssertionError):
+        jobmanager.top_results()
+    with pytest.raises(AssertionError):
+        JobManager(ctx, stub_broker, [build_model()], [{'results': {'aggregation': 'some'}}, {}])
+
+
+def test_invalid_result_return(stub_broker, internal_conf):
+    ctx = AppContext(None, None, internal_conf)
+
+    with pytest.raises(AssertionError):
+        JobManager(ctx, stub_broker, [build_model()], [{'results': {'return': 'top_k=-1'}}, {}])
+
+
+def test_result_writer(stub_broker, internal_conf, mocker):
+    ctx = AppContext(None, None, internal_conf)
+    jobmanager = JobManager(ctx, stub_broker, [build_model()], [{}, {}])
+    jobmanager.result_writer = mocker.Mock()
+    job = Job(build_model(), {})
+
+    jobmanager._process_result(job, pack_results(np.asarray([1.0]), np.zeros((1, 2)), np.float32))
+    job.resume = {'start_step': 10}
+    jobmanager._process_result(job, pack_results(np.asarray([0.5]), np.zeros((1, 2)), np.float32))
+
+    calls = jobmanager.result_writer.add.call_args_list
+    assert [call[0][1].tolist() for call in calls] == [[1.0], [0.5]]
+    assert [call[1]['replace'] for call in calls] == [False, True]
@@ -0,0 +1,95 @@
+import pytest
+import shutil
+
+from pyhocon import ConfigFactory
+
+from context import LocalProcesses
+
+
+@pytest.fixture
+def internal_conf():
+    return ConfigFactory.parse_file('csaopt/internal/csaopt-internal.conf')
+
+
+@pytest.fixture
+def conf():
+    return ConfigFactory.parse_string("""
+        {
+            remote {
+                platform = local
+                local {
+                    worker_count = 3
+                    broker_port = 6379
+                }
+            }
+        }
+        """)
+
+
+def test_queue_ids(conf, internal_conf):
+    local_processes = LocalProcesses(conf, internal_conf)
+
+    assert len(local_processes.queue_ids) == 3
+    assert len(set(local_processes.queue_ids)) == 3
+    assert local_processes.engine == internal_conf['remote.local.engine']
+    assert local_processes.start_broker is False
+
+
+def test_running_instances(conf, internal_conf):
+    with LocalProcesses(conf, internal_conf) as local_processes:
+        broker, workers = local_processes.get_running_instances()
+
+        assert broker.is_broker is True
+        assert broker.port == 6379
+        assert sorted(w.props['queue_id'] for w in workers) == sorted(local_processes.queue_ids)
+
+    assert not any(worker.is_alive() for worker in local_processes.workers)
+
+
+@pytest.mark.skipif(shutil.which('redis-server') is None, reason='redis-server is not available')
+def test_starts_broker(conf, internal_conf):
+    del conf['remote']['local']['broker_port']
+
+    with LocalProcesses(conf, internal_conf) as local_processes:
+        broker, _ = local_processes.get_running_instances()
+        assert broker.port is not None
+        assert local_processes.broker.poll() is None
+
+    assert local_processes.broker.poll() is not None
+
+
+@pytest.fixture
+def mock_processes(conf, mocker):
+    del conf['remote']['local']['broker_port']
+    mocker.patch('csaopt.instancemanager.local_processes.shutil.which', return_value='redis-server')
+    mocker.patch('csaopt.instancemanager.local_processes._wait_for_port')
+    broker = mocker.patch('csaopt.instancemanager.local_processes.subprocess.Popen').return_value
+    workers = [mocker.Mock() for _ in range(3)]
+    context = mocker.patch('csaopt.instancemanager.local_processes.multiprocessing.get_context').return_value
+    context.Process.side_effect = workers
+    return broker, workers
+
+
+def test_terminates_started_processes_on_failure(conf, internal_conf, mock_processes):
+    broker, workers = mock_processes
+    workers[1].start.side_effect = OSError('cannot start worker')
+
+    with pytest.raises(OSError):
+        with LocalProcesses(conf, internal_conf):
+            pass
+
+    workers[0].terminate.assert_called_once_with()
+    workers[1].terminate.assert_not_called()
+    broker.terminate.assert_called_once_with()
+
+
+def test_terminates_broker_on_timeout(conf, internal_conf, mock_processes, mocker):
+    broker, workers = mock_processes
+    mocker.patch('csaopt.instancemanager.local_processes._wait_for_port', side_effect=TimeoutError)
+
+    with pytest.raises(TimeoutError):
+        with LocalProcesses(conf, internal_conf):
+            pass
+
+    broker.terminate.assert_called_once_with()
+    assert not any(worker.start.called for worker in workers)
@@ -3,7 +3,7 @@ import imp
 
 from pyhocon import ConfigFactory
 
-from context import ModelLoader, ModelValidator, ValidationError, Precision, RandomDistribution
+from context import ModelLoader, ModelValidator, ValidationError, Precision, RandomDistribution, load_models
 
 
 @pytest.fixture
@@ -98,3 +98,22 @@ def test_model_params(conf, internal_conf, mocker):
     assert Precision.Float32 == model.precision
     assert RandomDistribution.Uniform == model.distribution
     assert 2 == model.dimensions
+
+
+def test_load_models(conf, internal_conf):
+    ackley_conf = ConfigFactory.parse_string("""
+        {
+            model {
+                name = ackley
+                path = examples/ackley/ackley_opt.py
+                skip_typecheck = True
+                dimensions = 2
+            }
+        }
+        """)
+
+    loaded = load_models([conf, ackley_conf], internal_conf)
+
+    assert [model.name for model, _ in loaded] == ['testopt', 'ackley']
+    assert all(len(errors) == 0 for _, errors in loaded)
+    assert len(loaded[1][0].functions) == 6
@@ -1,8 +1,9 @@
+import importlib.util
 import pytest
 
 from pyhocon import ConfigFactory
 
-from context import ModelValidator
+from context import ModelValidator, RequiredFunctions
 
 
 @pytest.fixture
@@ -32,17 +33,119 @@ def validator():
     return ModelValidator()
 
 
-def test_validate_functions_return(validator: ModelValidator):
-    def f_empty():
-        pass
+model_source = '''
+import math
 
-    def f_two(a, b):
-        return a + b
 
-    error_empty = validator._validate_fun_signature_len('testfun1', f_empty, 0)
-    error_empty_2 = validator._validate_fun_signature_len('testfun2', f_empty, 1)
-    error_two = validator._validate_fun_signature_len('testfun3', f_two, 2)
+def empty_state():
+    return (0.0, 0.0)
 
-    assert error_empty is None
-    assert error_empty_2 is not None
-    assert error_two is None
+
+def cool(initial_temp, old_temp, step):
+    return initial_temp * math.pow(0.9, step)
+
+
+def acceptance_func(e_old, e_new, temp, rnd):
+    return math.exp((e_old - e_new) / temp) > rnd
+
+
+def initialize(state, randoms):
+    for i in range(len(randoms)):
+        state[i] = randoms[i]
+    return
+
+
+def evaluate(state):
+    return state[0]**2 + state[1]**2
+
+
+def generate_next(state, new_state, randoms, step):
+    for i in range(len(state)):
+        new_state[i] = state[i] + randoms[i]
+    return
+'''
+
+
+def load_functions(tmpdir, source):
+    model_file = tmpdir.join('model.py')
+    model_file.write(source)
+    spec = importlib.util.spec_from_file_location('model', str(model_file))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return {func.value: getattr(module, func.value) for func in RequiredFunctions}
+
+
+def test_validate_functions(validator, internal_conf, tmpdir):
+    assert validator.validate_functions(load_functions(tmpdir, model_source), internal_conf) == []
+
+
+def test_validate_functions_return(validator, internal_conf, tmpdir):
+    source = model_source.replace('def cool(initial_temp, old_temp, step):', 'def cool(initial_temp, old_temp):')
+    source = source.replace('    return state[0]**2 + state[1]**2', '    pass')
+
+    errors = validator.validate_functions(load_functions(tmpdir, source), internal_conf)
+
+    assert [error.line for error in errors] == [9, 23, 23]
+    assert str(errors[0]).endswith(
+        ':9: Signature of `cool` has an incorrect number of parameters (expected 3, found 2)')
+    assert str(errors[1]).endswith(':23: Definition of function `evaluate` is empty.')
+    assert str(errors[2]).endswith(':23: Body of function `evaluate` does not contain a `return` statement.')
+
+
+def test_validate_functions_reserved_keywords(validator, internal_conf, tmpdir):
+    # Keywords in identifiers, strings and comments are not reserved
+    source = model_source.replace('    return state[0]**2 + state[1]**2',
+                                  '    important = \'import yield\'  # finally\n    return len(important)')
+    assert validator.validate_functions(load_functions(tmpdir, source), internal_conf) == []
+
+    source = model_source.replace('    return state[0]**2 + state[1]**2',
+                                  '    try:\n        import os\n    finally:\n        pass\n    return state[0]')
+    errors = validator.validate_functions(load_functions(tmpdir, source), internal_conf)
+
+    assert [(error.line, str(error).split(': ')[1]) for error in errors] == [
+        (24, 'Reserved keyword `finally` found in function `evaluate`'),
+        (25, 'Reserved keyword `import` found in function `evaluate`')
+    ]
+
+
+def test_validate_functions_numba_subset(validator, internal_conf, tmpdir):
+    source = model_source.replace('        new_state[i] = state[i] + randoms[i]',
+                                  '        new_state[i] = sum([state[i] * r for r in randoms])')
+    # Only called on the application master
+    source = source.replace('    return (0.0, 0.0)', '    return [0.0, 0.0]')
+    functions = load_functions(tmpdir, source)
+
+    errors = validator.validate_functions(functions, internal_conf)
+    assert len(errors) == 1
+    assert errors[0].line == 29
+    assert str(errors[0]).endswith(
+        ':29: List comprehensions are not supported by numba on CUDA devices, found in function `generate_next`')
+
+    internal_conf.put('model.validation.numba_subset', False)
+    assert validator.validate_functions(functions, internal_conf) == []
+
+
+def test_validate_functions_unknown_keyword(validator, internal_conf, tmpdir):
+    internal_conf.put('model.validation.reserved_keywords', ['while'])
+    with pytest.raises(AssertionError):
+        validator.validate_functions(load_functions(tmpdir, model_source), internal_conf)
+
+
+def test_validate_typing_cached(validator, tmpdir, mocker):
+    model_file = tmpdir.join('model.py')
+    model_file.write('x: int = 1\n')
+    run = mocker.patch('subprocess.run', return_value=mocker.Mock(returncode=1, stdout=b'model.py:1: error'))
+    cache_dir = str(tmpdir.join('cache'))
+
+    assert str(validator.validate_typing(str(model_file), cache_dir=cache_dir)) == 'model.py:1: error'
+    assert str(validator.validate_typing(str(model_file), cache_dir=cache_dir)) == 'model.py:1: error'
+    assert run.call_count == 1
+
+    # Changed files are validated again
+    model_file.write('x: int = 2\n')
+    run.return_value = mocker.Mock(returncode=0, stdout=b'')
+    assert validator.validate_typing(str(model_file), cache_dir=cache_dir) is None
+    assert run.call_count == 2
+
+    validator.validate_typing(str(model_file))
+    assert run.call_count == 3
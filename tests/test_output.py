@@ -0,0 +1,148 @@
+import json
+import pytest
+import numpy as np
+
+from context import write_results, read_results, result_columns, StreamingResultWriter, consolidate_parts
+from context import check_output_format, Job, Model, Precision, RandomDistribution
+
+
+def build_job(name, values, states):
+    job = Job(Model(name, states.shape[1], Precision.Float32, RandomDistribution.Uniform, None, 1, {}),
+              {'optimization': {'max_steps': 10}})
+    job.values, job.results, job.completed = np.asarray(values, dtype=np.float32), states.astype(np.float32), True
+    return job
+
+
+@pytest.fixture
+def jobs():
+    return [
+        build_job('model1', [3.0, 1.0], np.arange(4).reshape((2, 2))),
+        build_job('model2', [2.0], np.ones((1, 3))),
+        Job(Model('model3', 2, Precision.Float32, RandomDistribution.Uniform, None, 1, {}), {})
+    ]
+
+
+def test_result_columns(jobs):
+    columns = result_columns(jobs)
+
+    assert columns['values'].tolist() == [3.0, 1.0, 2.0]
+    assert columns['job_index'].tolist() == [0, 0, 1]
+    assert columns['job_ids'].tolist() == [jobs[0].id, jobs[1].id]
+    assert columns['models'].tolist() == ['model1', 'model2']
+    assert json.loads(columns['params'][0]) == {'optimization': {'max_steps': 10}}
+    # States of different dimensions are padded
+    assert columns['states'].shape == (3, 3)
+    assert np.isnan(columns['states'][0, 2])
+    assert columns['states'][2].tolist() == [1.0, 1.0, 1.0]
+
+
+def test_result_columns_best(jobs):
+    columns = result_columns(jobs, only_best=True)
+
+    assert columns['values'].tolist() == [1.0, 2.0]
+    assert columns['states'][0, :2].tolist() == [2.0, 3.0]
+
+
+def test_write_npz(jobs, tmpdir):
+    path = str(tmpdir.join('results.npz'))
+    write_results(path, jobs)
+
+    columns = read_results(path)
+    assert columns['values'].tolist() == [3.0, 1.0, 2.0]
+    assert columns['states'].dtype == np.float32
+    assert columns['job_ids'].tolist() == [jobs[0].id, jobs[1].id]
+
+
+@pytest.mark.parametrize('output_format,extension', [('hdf5', 'h5'), ('arrow', 'arrow')])
+def test_write_optional_formats(jobs, tmpdir, output_format, extension):
+    pytest.importorskip('h5py' if output_format == 'hdf5' else 'pyarrow')
+    path = str(tmpdir.join('results.' + extension))
+    write_results(path, jobs, output_format=output_format)
+
+    columns = read_results(path)
+    expected = result_columns(jobs)
+    assert columns['values'].tolist() == expected['values'].tolist()
+    assert np.array_equal(columns['states'], expected['states'], equal_nan=True)
+    assert columns['job_index'].tolist() == expected['job_index'].tolist()
+    assert columns['params'].tolist() == expected['params'].tolist()
+
+
+@pytest.mark.parametrize('output_format,extension', [('npz', 'npz'), ('hdf5', 'h5'), ('arrow', 'arrow')])
+def test_read_results_mmap(jobs, tmpdir, output_format, extension):
+    if output_format != 'npz':
+        pytest.importorskip('h5py' if output_format == 'hdf5' else 'pyarrow')
+    path = str(tmpdir.join('results.' + extension))
+    write_results(path, jobs, output_format=output_format)
+
+    columns = read_results(path, mmap_mode='r')
+    expected = result_columns(jobs)
+    for name in ('values', 'states', 'job_index'):
+        assert np.array_equal(columns[name], expected[name], equal_nan=True)
+        # Result columns are backed by the file instead of being read into memory
+        if output_format == 'arrow':
+            assert not columns[name].flags.owndata
+        else:
+            assert isinstance(columns[name], np.memmap)
+    assert columns['job_ids'].tolist() == expected['job_ids'].tolist()
+
+    with pytest.raises(AssertionError):
+        read_results(path, mmap_mode='w+')
+
+
+def test_write_unknown_format(jobs, tmpdir):
+    with pytest.raises(AttributeError):
+        write_results(str(tmpdir.join('results.csv')), jobs, output_format='csv')
+
+
+def test_streaming_writer(jobs, tmpdir):
+    path = str(tmpdir.join('results.npz'))
+    writer = StreamingResultWriter(path)
+
+    writer.add(jobs[0], np.asarray([3.0]), np.zeros((1, 2)))
+    # Results of several workers for the same job are appended, later rounds of a job replace earlier ones
+    writer.add(jobs[0], np.asarray([1.0]), np.ones((1, 2)))
+    writer.add(jobs[1], np.asarray([5.0, 4.0]), np.zeros((2, 3)))
+    writer.add(jobs[1], np.asarray([2.0]), np.ones((1, 3)), replace=True)
+
+    assert writer.close() == path
+    assert not tmpdir.join('results.npz.parts').exists()
+
+    columns = read_results(path)
+    assert columns['values'].tolist() == [3.0, 1.0, 2.0]
+    assert columns['job_index'].tolist() == [0, 0, 1]
+    assert columns['job_ids'].tolist() == [jobs[0].id, jobs[1].id]
+    assert columns['states'].shape == (3, 3)
+
+
+def test_streaming_writer_best(jobs, tmpdir):
+    path = str(tmpdir.join('results.npz'))
+    writer = StreamingResultWriter(path, only_best=True)
+
+    writer.add(jobs[0], np.asarray([3.0, 1.0]), np.arange(4).reshape((2, 2)))
+    writer.add(jobs[1], np.asarray([2.0]), np.ones((1, 3)))
+    writer.add(jobs[0], np.asarray([0.5]), np.full((1, 2), 7.0))
+    writer.close()
+
+    columns = read_results(path)
+    assert columns['values'].tolist() == [0.5, 2.0]
+    assert columns['states'][0, :2].tolist() == [7.0, 7.0]
+
+
+def test_consolidate_parts(jobs, tmpdir):
+    path = str(tmpdir.join('results.npz'))
+    writer = StreamingResultWriter(path)
+    writer.add(jobs[0], jobs[0].values, jobs[0].results)
+    # Stops the writer thread without consolidating, like a crash after the results were written
+    writer._queue.put(None)
+    writer._thread.join()
+
+    consolidate_parts(path + '.parts', path)
+
+    assert read_results(path)['values'].tolist() == [3.0, 1.0]
+
+
+def test_check_output_format():
+    check_output_format('npz')
+
+    with pytest.raises(AttributeError):
+        check_output_format('csv')
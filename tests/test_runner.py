@@ -1,6 +1,9 @@
+import asyncio
 import pytest
 import numpy as np
 
+from pyhocon import ConfigFactory
+
 from context import Runner, ExecutionType, get_configs, docker_available
 
 
@@ -22,3 +25,95 @@ def test_runner_langermann():
         raise Exception('Runner had failures: %s' % runner.failures)
 
     assert runner.best_value == pytest.approx(0, abs=0.2)
+
+
+def model_conf(name):
+    return ConfigFactory.parse_string("""
+        {{
+            model {{
+                name = {}
+                skip_typecheck = true
+                dimensions = 2
+            }}
+        }}
+        """.format(name))
+
+
+@pytest.mark.asyncio
+async def test_load_models_single_conf_names():
+    internal_conf = get_configs('csaopt/internal/csaopt-internal.conf')
+    runner = Runner(['examples/langermann/langermann_opt.py', 'examples/ackley/ackley_opt.py'], [],
+                    {'internal_conf': internal_conf})
+
+    assert await runner._load_models([model_conf('opt')], internal_conf, asyncio.get_event_loop())
+    # Further models of a single configuration get their own names, since workers keep models by name
+    assert [model.name for model in runner.models] == ['opt', 'opt_1']
+
+
+@pytest.mark.asyncio
+async def test_load_models_duplicate_names():
+    internal_conf = get_configs('csaopt/internal/csaopt-internal.conf')
+    runner = Runner(['examples/langermann/langermann_opt.py', 'examples/ackley/ackley_opt.py'], [],
+                    {'internal_conf': internal_conf})
+
+    configs = [model_conf('opt'), model_conf('opt')]
+    assert not await runner._load_models(configs, internal_conf, asyncio.get_event_loop())
+    assert len(runner.failures) == 1
+    assert 'same name `opt`' in runner.failures[0]
+
+
+@pytest.mark.asyncio
+async def test_output_settings():
+    internal_conf = get_configs('csaopt/internal/csaopt-internal.conf')
+    runner = Runner([], [], {'internal_conf': internal_conf})
+    config = ConfigFactory.parse_string('{ save_to_file { type = best, format = npz } }')
+
+    assert runner._output_settings([config, config], internal_conf) == ('best', 'npz')
+    assert runner._output_settings([ConfigFactory.parse_string('{}')], internal_conf) == ('none', 'npz')
+
+    # All results are written into one file
+    with pytest.raises(AssertionError):
+        runner._output_settings([config, ConfigFactory.parse_string('{}')], internal_conf)
+
+
+def mock_runner(mocker, tmp_path):
+    internal_conf = get_configs('csaopt/internal/csaopt-internal.conf')
+    conf_path = tmp_path / 'run.conf'
+    conf_path.write_text('{ remote { platform = memory } }')
+    runner = Runner([], [str(conf_path)], {'internal_conf': internal_conf})
+    instancemanager = mocker.MagicMock()
+    mocker.patch.object(runner, '_get_instance_manager', return_value=instancemanager)
+    return runner, instancemanager
+
+
+@pytest.mark.asyncio
+async def test_instances_exited_when_models_fail(mocker, tmp_path):
+    runner, instancemanager = mock_runner(mocker, tmp_path)
+    mocker.patch.object(runner, '_load_models', return_value=False)
+
+    await runner._run_async(asyncio.get_event_loop())
+
+    instancemanager.__enter__.assert_called_once_with()
+    instancemanager.__exit__.assert_called_once()
+    instancemanager.get_running_instances.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_instances_exited_when_provisioning_fails(mocker, tmp_path):
+    runner, instancemanager = mock_runner(mocker, tmp_path)
+    mocker.patch.object(runner, '_load_models', return_value=True)
+    instancemanager.__enter__.side_effect = RuntimeError('no capacity')
+
+    with pytest.raises(RuntimeError):
+        await runner._run_async(asyncio.get_event_loop())
+
+    # Instances that were started before provisioning failed are terminated
+    instancemanager.__exit__.assert_called_once_with(None, None, None)
+    assert runner.failures == ['Error while starting instances: no capacity']
+
+    # Errors of partially initialized instance managers do not replace the provisioning error
+    instancemanager.reset_mock()
+    instancemanager.__exit__.side_effect = AttributeError('broker')
+    with pytest.raises(RuntimeError):
+        await runner._run_async(asyncio.get_event_loop())
+    instancemanager.__exit__.assert_called_once_with(None, None, None)
@@ -0,0 +1,76 @@
+import pytest
+
+from context import JobScheduler, Job, Model, Precision, RandomDistribution
+
+
+class MockMessage():
+    def __init__(self, queue_name, message_id):
+        self.queue_name = queue_name
+        self.message_id = message_id
+
+
+class MockBroker():
+    """Broker completing messages in the order they were sent"""
+
+    def __init__(self, queue_ids):
+        self.queue_ids = queue_ids
+        self.sent = []
+
+    def send_to_queues(self, submissions):
+        messages = [MockMessage(queue_id, 'msg-{}'.format(len(self.sent) + n))
+                    for n, (queue_id, _, _) in enumerate(submissions)]
+        self.sent.extend(messages)
+        return messages
+
+    async def wait_for_any_result(self, messages, timeout):
+        if len(messages) == 0:
+            return None
+        msg = min(messages, key=lambda m: int(m.message_id.split('-')[1]))
+        return msg, {'job_id': msg.message_id}
+
+
+def build_jobs(count):
+    model = Model('model', 2, Precision.Float32, RandomDistribution.Uniform, None, 1, {})
+    return [Job(model, {'n': n}) for n in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_in_flight_depth():
+    broker = MockBroker(['queue1', 'queue2'])
+    scheduler = JobScheduler(broker, max_in_flight=2)
+    jobs = build_jobs(7)
+
+    scheduler.submit(jobs)
+
+    # Two jobs per worker are dispatched right away, alternating between workers
+    assert [msg.queue_name for msg in broker.sent] == ['queue1', 'queue2', 'queue1', 'queue2']
+    assert len(scheduler.pending) == 3
+
+    job, _ = await scheduler.next_completed(1.0)
+    assert job is jobs[0]
+    # The worker that completed a job receives the next one
+    assert len(broker.sent) == 5
+    assert broker.sent[4].queue_name == 'queue1'
+    assert jobs[4].submitted_to == ['queue1']
+
+
+@pytest.mark.asyncio
+async def test_all_jobs_complete():
+    broker = MockBroker(['queue1', 'queue2', 'queue3'])
+    scheduler = JobScheduler(broker, max_in_flight=1)
+    jobs = build_jobs(10)
+
+    scheduler.submit(jobs)
+    completed = []
+    while not scheduler.done:
+        job, _ = await scheduler.next_completed(1.0)
+        completed.append(job)
+        assert len(scheduler.in_flight) <= 3
+
+    assert completed == jobs
+    assert all(job.message_id != '' for job in jobs)
+
+
+def test_invalid_depth():
+    with pytest.raises(AssertionError):
+        JobScheduler(MockBroker(['queue1']), max_in_flight=0)
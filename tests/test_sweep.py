@@ -0,0 +1,81 @@
+import pytest
+
+from context import expand_sweep, apply_sweep_point
+from pyhocon import ConfigFactory
+
+
+def test_grid():
+    points = expand_sweep({'grid': {'initial_temp': [10.0, 100.0], 'max_steps': [500, 1000, 2000]}})
+
+    assert len(points) == 6
+    assert {'initial_temp': 10.0, 'max_steps': 500} in points
+    assert {'initial_temp': 100.0, 'max_steps': 2000} in points
+
+
+def test_points_and_grid():
+    points = expand_sweep({'grid': {'initial_temp': [10.0]}, 'points': [{'initial_temp': 5.0, 'max_steps': 20}]})
+
+    assert points == [{'initial_temp': 10.0}, {'initial_temp': 5.0, 'max_steps': 20}]
+
+
+def test_random():
+    sweep = {
+        'random': {
+            'samples': 16,
+            'seed': 42,
+            'params': {
+                'initial_temp': {'min': 1.0, 'max': 1000.0, 'log': True},
+                'max_steps': {'min': 100, 'max': 200}
+            }
+        }
+    }
+    points = expand_sweep(sweep)
+
+    assert len(points) == 16
+    assert points == expand_sweep(sweep)
+    for point in points:
+        assert 1.0 <= point['initial_temp'] <= 1000.0
+        assert isinstance(point['max_steps'], int)
+        assert 100 <= point['max_steps'] <= 200
+
+
+def test_invalid_sweeps():
+    with pytest.raises(AssertionError):
+        expand_sweep({})
+    with pytest.raises(AssertionError):
+        expand_sweep({'grid': {'initial_temp': 10.0}})
+    with pytest.raises(AssertionError):
+        expand_sweep({'random': {'samples': 2, 'params': {'initial_temp': {'min': 10.0, 'max': 1.0}}}})
+    with pytest.raises(AssertionError):
+        expand_sweep({'random': {'samples': 2, 'params': {'initial_temp': {'min': 0.0, 'max': 1.0, 'log': True}}}})
+
+
+def test_hocon_sweep():
+    conf = ConfigFactory.parse_string("""
+        optimization {
+            max_steps = 1000
+            initial_temp = 1000.0
+        }
+        sweep {
+            grid {
+                initial_temp = [10.0, 100.0]
+            }
+        }
+    """)
+
+    points = expand_sweep(conf['sweep'])
+    configs = [apply_sweep_point(conf, point) for point in points]
+
+    assert [config['optimization.initial_temp'] for config in configs] == [10.0, 100.0]
+    assert all(config['optimization.max_steps'] == 1000 for config in configs)
+    assert all('sweep' not in config for config in configs)
+    assert conf['optimization.initial_temp'] == 1000.0
+
+
+def test_apply_sweep_point_dict():
+    config = {'optimization': {'max_steps': 10}, 'sweep': {}}
+
+    updated = apply_sweep_point(config, {'initial_temp': 5.0, 'cooling.alpha': 0.9})
+
+    assert updated == {'optimization': {'max_steps': 10, 'initial_temp': 5.0, 'cooling': {'alpha': 0.9}}}
+    assert config['optimization'] == {'max_steps': 10}
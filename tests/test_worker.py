@@ -0,0 +1,200 @@
+import pytest
+import numpy as np
+
+from dramatiq import Worker
+from pyhocon import ConfigFactory
+
+from context import Broker, WorkerCommand, ModelLoader, OptimizationWorker, declare_actors, unpack_results
+
+
+@pytest.fixture
+def internal_conf():
+    return ConfigFactory.parse_file('csaopt/internal/csaopt-internal.conf')
+
+
+@pytest.fixture
+def model(internal_conf):
+    conf = ConfigFactory.parse_string("""
+        {
+            model {
+                name = langermann
+                path = examples/langermann/langermann_opt.py
+                skip_typecheck = True
+                dimensions = 2
+            }
+        }
+        """)
+    return ModelLoader(conf, internal_conf).get_model()
+
+
+@pytest.fixture
+def job_dict():
+    return {
+        'id': 'job1',
+        'model': 'langermann',
+        'params': {
+            'optimization': {
+                'thread_count': 16,
+                'max_steps': 200,
+                'initial_temp': 100.0
+            }
+        }
+    }
+
+
+@pytest.fixture
+def stub_broker(monkeypatch):
+    monkeypatch.setenv('UNIT_TESTS', '1')
+    monkeypatch.setenv('USE_STUB_BROKER', '1')
+    return Broker(queue_ids=['queue1'])
+
+
+@pytest.fixture
+def stub_worker(stub_broker):
+    declare_actors(stub_broker, 'queue1', OptimizationWorker(broker=stub_broker))
+    worker = Worker(stub_broker.dramatiq_broker, worker_threads=1, worker_timeout=100)
+    worker.start()
+    yield worker
+    worker.stop()
+
+
+def test_deploy_model(model):
+    worker = OptimizationWorker()
+
+    assert worker.deploy_model(model.to_dict()) == 'model_deployed'
+    assert 'langermann' in worker.models
+
+
+def test_deploy_broken_model(model):
+    worker = OptimizationWorker()
+    model.functions['evaluate'] = 'def evaluate(state):\n    return state['
+
+    assert worker.deploy_model(model.to_dict()) != 'model_deployed'
+    assert len(worker.models) == 0
+
+
+def test_deploy_cached_model(stub_broker, model):
+    worker = OptimizationWorker(broker=stub_broker)
+    payload = {'name': model.name, 'hash': model.content_hash()}
+
+    assert worker.deploy_cached_model(payload) != 'model_deployed'
+
+    assert stub_broker.store_model(model.content_hash(), model.to_dict()) is True
+    assert stub_broker.store_model(model.content_hash(), model.to_dict()) is False
+    assert worker.deploy_cached_model(payload) == 'model_deployed'
+    assert worker.deploy_cached_model(payload) == 'model_cached'
+    assert 'langermann' in worker.models
+
+
+def test_run_optimization(model, job_dict):
+    worker = OptimizationWorker()
+    worker.deploy_model(model.to_dict())
+    result = worker.run_optimization(job_dict)
+
+    values, states = unpack_results(result)
+    assert result['job_id'] == 'job1'
+    assert values.shape == (16, )
+    assert states.shape == (16, 2)
+    assert states.dtype == np.float32
+
+
+def test_run_optimization_top_k(model, job_dict):
+    worker = OptimizationWorker()
+    worker.deploy_model(model.to_dict())
+    job_dict['params']['results'] = {'return': 'top_k=3'}
+    result = worker.run_optimization(job_dict)
+
+    values, states = unpack_results(result)
+    assert values.shape == (3, )
+    assert states.shape == (3, 2)
+    assert np.all(np.diff(values) >= 0)
+
+
+def test_run_optimization_invalid_return(model, job_dict):
+    worker = OptimizationWorker()
+    worker.deploy_model(model.to_dict())
+    job_dict['params']['results'] = {'return': 'some'}
+
+    assert 'failure' in worker.run_optimization(job_dict)
+
+
+def test_run_optimization_progress(stub_broker, model, job_dict):
+    worker = OptimizationWorker(broker=stub_broker)
+    worker.deploy_model(model.to_dict())
+    updates = []
+    stub_broker.subscribe_progress(updates.append)
+
+    job_dict['progress'] = {'interval': 0.0, 'steps': 50}
+    worker.run_optimization(job_dict)
+
+    assert [update['step'] for update in updates] == [50, 100, 150, 200]
+    assert all(update['job_id'] == 'job1' for update in updates)
+    assert all(0.0 <= update['acceptance_rate'] <= 1.0 for update in updates)
+    # The best value can only improve
+    assert all(a['best_value'] >= b['best_value'] for a, b in zip(updates, updates[1:]))
+
+    # Updates are rate-limited per job
+    updates.clear()
+    job_dict['progress'] = {'interval': 60.0, 'steps': 50}
+    worker.run_optimization(job_dict)
+    assert len(updates) == 1
+
+
+def test_cancel(stub_broker, model, job_dict):
+    worker = OptimizationWorker(broker=stub_broker)
+    worker.deploy_model(model.to_dict())
+    stub_broker.subscribe_control(worker.handle)
+
+    stub_broker.send_control(WorkerCommand.Cancel, {'job_ids': ['job1']})
+
+    assert worker.run_optimization(job_dict) == {'job_id': 'job1', 'cancelled': True}
+
+
+def test_cancel_running_job(stub_broker, model, job_dict):
+    worker = OptimizationWorker(broker=stub_broker)
+    worker.deploy_model(model.to_dict())
+
+    # Cancel the job once it reported progress, i.e. while it is running
+    job_dict['params']['optimization']['max_steps'] = 100000
+    job_dict['progress'] = {'interval': 0.0, 'steps': 10}
+    stub_broker.subscribe_progress(lambda update: worker.handle('cancel', {'job_ids': [update['job_id']]}))
+    result = worker.run_optimization(job_dict)
+
+    values, states = unpack_results(result)
+    assert result['cancelled'] is True
+    assert values.shape == (16, )
+    assert np.all(np.isfinite(values))
+
+
+def test_run_optimization_model_not_deployed(job_dict):
+    result = OptimizationWorker().run_optimization(job_dict)
+
+    assert result['job_id'] == 'job1'
+    assert 'failure' in result
+
+
+def test_unknown_command():
+    with pytest.raises(ValueError):
+        OptimizationWorker().handle('unknown_command', {})
+
+
+@pytest.mark.asyncio
+async def test_actors_on_stub_broker(stub_broker, stub_worker, model, job_dict):
+    assert stub_broker.ping('queue1') is True
+    stub_broker.clear_queue_messages()
+
+    stub_broker.send_to_queue('queue1', WorkerCommand.DeployModel, model.to_dict())
+    results = await stub_broker.get_all_results(timeout=10.0)
+    assert results['queue1'] == ['model_deployed']
+    stub_broker.clear_queue_messages()
+
+    stub_broker.send_to_queue('queue1', WorkerCommand.RunOptimization, job_dict)
+    results = await stub_broker.get_all_results(timeout=10.0)
+    values, states = unpack_results(results['queue1'][0])
+    assert values.shape == (16, )
+
+
+def test_optimization_actor_has_no_time_limit(stub_broker):
+    declare_actors(stub_broker, 'queue1', OptimizationWorker(broker=stub_broker))
+    actor = stub_broker.dramatiq_broker.get_actor('OptimizationActor')
+    assert actor.options['time_limit'] == float('inf')